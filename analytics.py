@@ -0,0 +1,278 @@
+import threading
+from datetime import datetime
+
+import bus
+from db import (
+    list_session_index,
+    aggregate_hot_sessions,
+    iter_archived_sessions,
+    iter_session_orders,
+    load_session_summaries,
+    save_session_summaries,
+    load_prices,
+    primary_reads,
+    TIME_FORMAT
+)
+
+# =====================
+# SALGSANALYSE (ADMIN DASHBOARD)
+# =====================
+# Én "summary" pr. session: omsætning, stk, betalt-andel, pr. vare og pr.
+# køber. Lukkede sessions ændrer sig sjældent, så deres summary caches i
+# hukommelsen og i session_summaries – kun den åbne session tælles forfra
+# ved hvert kald. Ændres en lukket session alligevel (betalt efter luk,
+# slettet ordre, slettet session), kommer der et "session_changed" på
+# bussen, og summaryen smides ud af hukommelsen i alle workers. Den gemte
+# række i session_summaries slettes kun én gang, af den der ændrede
+# sessionen (web.notify_session).
+#
+# Vare-omsætning er stk × pris på det tidspunkt sessionen blev talt op.
+
+TOP_BUYERS = 10
+TREND_SESSIONS = 12
+
+_lock = threading.Lock()
+_cache = {}            # navn → summary (kun lukkede sessions)
+_generation = {}       # navn → tæller, bumpes ved invalidering
+_loaded = False
+_merged = None         # alle cachede summaries lagt sammen
+
+
+def new_summary(name, closed_at=None, live=False):
+    return {
+        "name": name,
+        "closed_at": closed_at,
+        "live": live,
+        "orders": 0,
+        "paid_orders": 0,
+        "delivered_orders": 0,
+        "revenue": 0,
+        "paid_revenue": 0,
+        "units": 0,
+        "paid_units": 0,
+        "items": {},     # vare → {"units", "paid_units", "revenue"}
+        "buyers": {}     # uid → {"name", "orders", "total", "paid"}
+    }
+
+
+def add_buyer(s, uid, user, orders, paid_orders, delivered, total, paid_total):
+    total = int(total or 0)
+    paid_total = int(paid_total or 0)
+    s["orders"] += orders
+    s["paid_orders"] += paid_orders
+    s["delivered_orders"] += delivered
+    s["revenue"] += total
+    s["paid_revenue"] += paid_total
+
+    b = s["buyers"].setdefault(uid, {"name": user, "orders": 0, "total": 0, "paid": 0})
+    b["name"] = user or b["name"]
+    b["orders"] += orders
+    b["total"] += total
+    b["paid"] += paid_total
+
+
+def add_item(s, item, units, paid_units, price):
+    units = int(units)
+    paid_units = int(paid_units)
+    s["units"] += units
+    s["paid_units"] += paid_units
+
+    i = s["items"].setdefault(item, {"units": 0, "paid_units": 0, "revenue": 0})
+    i["units"] += units
+    i["paid_units"] += paid_units
+    i["revenue"] += units * (price or 0)
+
+
+def summarize(name, orders, prices, closed_at=None, live=False):
+    """Én gennemgang af ordrerne (arkiv-blobs og når journalen er foran DB'en)."""
+    s = new_summary(name, closed_at, live)
+    for o in orders:
+        paid = bool(o.get("paid"))
+        total = o.get("total") or 0
+        add_buyer(
+            s, o.get("user_id") or o.get("user") or "", o.get("user"),
+            1, int(paid), int(bool(o.get("delivered"))), total, total if paid else 0
+        )
+        for item, amount in (o.get("items") or {}).items():
+            if amount > 0:
+                add_item(s, item, amount, amount if paid else 0, prices.get(item))
+    return s
+
+
+def _from_rows(rows, index, prices):
+    out = {}
+
+    def get(name):
+        if name not in out:
+            out[name] = new_summary(name, index["hot"].get(name), name == index["current"])
+        return out[name]
+
+    for name, uid, user, orders, paid_orders, delivered, total, paid_total in rows["buyers"]:
+        add_buyer(get(name), uid, user, orders, paid_orders, delivered, total, paid_total)
+    for name, item, units, paid_units in rows["items"]:
+        add_item(get(name), item, units, paid_units, prices.get(item))
+    return out
+
+
+def summarize_hot(names, index, prices):
+    names = list(names)
+    if not names:
+        return {}
+
+    rows = aggregate_hot_sessions(names)
+    if rows is not None:
+        out = _from_rows(rows, index, prices)
+    else:
+        grouped = {}
+        for name, o in iter_session_orders(archive=False):
+            if name in names:
+                grouped.setdefault(name, []).append(o)
+        out = {
+            name: summarize(name, orders, prices, index["hot"].get(name), name == index["current"])
+            for name, orders in grouped.items()
+        }
+
+    # sessions uden ordrer skal stadig med
+    for name in names:
+        out.setdefault(name, new_summary(name, index["hot"].get(name), name == index["current"]))
+    return out
+
+
+def summarize_archived(names, prices):
+    if not names:
+        return {}
+    return {
+        name: summarize(name, orders, prices, closed_at)
+        for name, closed_at, orders in iter_archived_sessions(list(names))
+    }
+
+
+def merge(summaries, name="Alle sessions"):
+    total = new_summary(name)
+    for s in summaries:
+        for key in ("orders", "paid_orders", "delivered_orders", "revenue", "paid_revenue", "units", "paid_units"):
+            total[key] += s[key]
+        for item, i in s["items"].items():
+            t = total["items"].setdefault(item, {"units": 0, "paid_units": 0, "revenue": 0})
+            for key in t:
+                t[key] += i[key]
+        for uid, b in s["buyers"].items():
+            t = total["buyers"].setdefault(uid, {"name": b["name"], "orders": 0, "total": 0, "paid": 0})
+            t["name"] = b["name"] or t["name"]
+            for key in ("orders", "total", "paid"):
+                t[key] += b[key]
+    return total
+
+
+# =====================
+# CACHE
+# =====================
+def _on_session_changed(data):
+    global _merged
+    name = (data or {}).get("session")
+    if not name:
+        return
+    with _lock:
+        _generation[name] = _generation.get(name, 0) + 1
+        dropped = _cache.pop(name, None) is not None
+        if dropped:
+            _merged = None
+
+
+bus.subscribe("session_changed", _on_session_changed)
+
+
+def _closed_summaries(index, prices):
+    global _loaded, _merged
+
+    if not _loaded:
+        stored = load_session_summaries()
+        with _lock:
+            for name, s in stored.items():
+                _cache.setdefault(name, s)
+            _loaded = True
+            _merged = None
+
+    closed = (set(index["hot"]) | set(index["archived"])) - {index["current"]}
+    with _lock:
+        # slettede sessions ryger ud
+        for name in set(_cache) - closed:
+            del _cache[name]
+            _merged = None
+        missing = closed - set(_cache)
+        generations = {name: _generation.get(name, 0) for name in missing}
+
+    if missing:
+        # fra primær – en forsinket replika må ikke caches for evigt
+        with primary_reads():
+            fresh = summarize_hot(missing & set(index["hot"]), index, prices)
+            fresh.update(summarize_archived(missing - set(index["hot"]), prices))
+
+        with _lock:
+            # blev sessionen ændret mens vi talte, er tallet allerede forældet
+            fresh = {n: s for n, s in fresh.items() if _generation.get(n, 0) == generations.get(n)}
+            _cache.update(fresh)
+            _merged = None
+        save_session_summaries(fresh)
+
+    with _lock:
+        if _merged is None:
+            _merged = merge(_cache.values())
+        return dict(_cache), _merged
+
+
+def _sort_key(s):
+    try:
+        closed = datetime.strptime(s["closed_at"], TIME_FORMAT) if s.get("closed_at") else None
+    except ValueError:
+        closed = None
+    return (s["live"], closed is None, closed or datetime.min, s["name"])
+
+
+def _ratio(part, whole):
+    return round(100 * part / whole) if whole else 0
+
+
+def dashboard(top=TOP_BUYERS, trend=TREND_SESSIONS):
+    index = list_session_index()
+    prices = load_prices()
+
+    closed, merged = _closed_summaries(index, prices)
+    sessions = list(closed.values())
+    if index["current"]:
+        live = summarize_hot([index["current"]], index, prices)[index["current"]]
+        sessions.append(live)
+        merged = merge([merged, live])
+
+    sessions.sort(key=_sort_key)
+    sessions = [{**s, "paid_ratio": _ratio(s["paid_orders"], s["orders"])} for s in sessions]
+
+    items = sorted(merged["items"].items(), key=lambda kv: (-kv[1]["revenue"], kv[0]))
+    buyers = sorted(merged["buyers"].values(), key=lambda b: (-b["paid"], -b["total"]))
+
+    recent = sessions[-trend:] if trend else []
+    peak = max((s["revenue"] for s in recent), default=0)
+    trends = []
+    prev = None
+    for s in recent:
+        trends.append({
+            "name": s["name"],
+            "live": s["live"],
+            "revenue": s["revenue"],
+            "width": _ratio(s["revenue"], peak),
+            "change": _ratio(s["revenue"] - prev, prev) if prev else None
+        })
+        prev = s["revenue"]
+
+    return {
+        "totals": {
+            **{k: merged[k] for k in ("orders", "paid_orders", "revenue", "paid_revenue", "units", "paid_units")},
+            "sessions": len(sessions),
+            "paid_ratio": _ratio(merged["paid_orders"], merged["orders"]),
+            "buyers": len(merged["buyers"])
+        },
+        "sessions": sessions[::-1],
+        "items": items,
+        "buyers": buyers[:top],
+        "trends": trends
+    }
@@ -0,0 +1,8 @@
+import sys
+from db import init_db, archive_audit, AUDIT_RETENTION_DAYS
+
+if __name__ == "__main__":
+    init_db()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else AUDIT_RETENTION_DAYS
+    moved = archive_audit(days)
+    print(f"✅ {sum(moved.values())} audit-events arkiveret (ældre end {days} dage)")
@@ -0,0 +1,8 @@
+import sys
+from db import init_db, archive_sessions, ARCHIVE_AFTER_DAYS
+
+if __name__ == "__main__":
+    init_db()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    moved = archive_sessions(days)
+    print(f"✅ {len(moved)} sessions arkiveret (lukket > {days} dage)")
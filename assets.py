@@ -0,0 +1,224 @@
+"""Byg statiske filer med hash i navnet, minificeret og prækomprimeret.
+
+    python assets.py             # static/*.css → static/dist/
+
+Hver fil får indholdets hash i navnet (style.3f2a1b9c0d.css) og ligger
+ved siden af en .gz og – hvis brotli er installeret – en .br. Navnene
+står i static/dist/manifest.json, som templates slår op i via
+asset_url("style.css"). Fordi navnet skifter når indholdet gør, kan
+filerne caches for evigt (immutable) i stedet for at blive
+genvalideret ved hver auto-reload.
+"""
+import os
+import re
+import sys
+import gzip
+import hashlib
+import mimetypes
+
+from flask import send_file
+
+import metrics
+import serializer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - afhænger af miljøet
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST = os.path.join(DIST_DIR, "manifest.json")
+ASSET_TYPES = (".css", ".js")
+ASSET_URL = "/assets/"
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+COMPRESS = os.getenv("COMPRESS", "on").lower() not in ("off", "0", "false")
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "500"))
+COMPRESS_TYPES = ("text/html", "application/json")
+# brotli on-the-fly: lav kvalitet er hurtig og stadig bedre end gzip -6
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSED_BYTES = metrics.Counter(
+    "bestilling_compressed_bytes_total",
+    "Response bytes before and after on-the-fly compression",
+    ("encoding", "stage")
+)
+
+# =====================
+# BUILD
+# =====================
+def minify_css(text):
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    # ikke før ":" – "a :hover" og "a:hover" er ikke det samme
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+MINIFIERS = {".css": minify_css}
+
+
+def _write(path, data):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _sources():
+    return sorted(
+        name for name in os.listdir(STATIC_DIR)
+        if name.endswith(ASSET_TYPES) and os.path.isfile(os.path.join(STATIC_DIR, name))
+    )
+
+
+def build(verbose=True):
+    """static/<navn> → static/dist/<navn>.<hash>.<ext> (+ .gz/.br) og manifest."""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    for name in _sources():
+        with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+            text = f.read()
+        stem, ext = os.path.splitext(name)
+        minify = MINIFIERS.get(ext)
+        data = (minify(text) if minify else text).encode("utf-8")
+
+        built = f"{stem}.{hashlib.md5(data).hexdigest()[:10]}{ext}"
+        path = os.path.join(DIST_DIR, built)
+        _write(path, data)
+        _write(path + ".gz", gzip.compress(data, 9, mtime=0))
+        if brotli:
+            _write(path + ".br", brotli.compress(data, quality=11))
+        manifest[name] = built
+
+        if verbose:
+            print(f"📦 {name}: {len(text.encode('utf-8'))} → {len(data)} bytes ({built})")
+
+    _write(MANIFEST, serializer.dumps_bytes(manifest, sort_keys=True))
+
+    # gamle versioner ryddes op – manifestet peger kun på de nye
+    keep = set(manifest.values())
+    for name in os.listdir(DIST_DIR):
+        base = name.removesuffix(".gz").removesuffix(".br")
+        if name != "manifest.json" and base not in keep and ".tmp" not in name:
+            os.remove(os.path.join(DIST_DIR, name))
+    return manifest
+
+
+# =====================
+# MANIFEST / URLS
+# =====================
+_manifest = {}
+
+
+def _stale():
+    if not os.path.exists(MANIFEST):
+        return True
+    built = os.path.getmtime(MANIFEST)
+    return any(os.path.getmtime(os.path.join(STATIC_DIR, name)) > built for name in _sources())
+
+
+def load():
+    """Læs manifestet – bygges først hvis det mangler eller en kilde er nyere."""
+    global _manifest
+    try:
+        if _stale():
+            build(verbose=False)
+        with open(MANIFEST, "rb") as f:
+            _manifest = serializer.loads(f.read())
+    except OSError as e:
+        print("⚠️ Kunne ikke bygge statiske filer – bruger /static direkte:", e)
+        _manifest = {}
+    return _manifest
+
+
+def url(name):
+    built = _manifest.get(name)
+    return ASSET_URL + built if built else "/static/" + name
+
+
+# =====================
+# KOMPRESSION
+# =====================
+def accepted_encodings(header):
+    """"gzip, br;q=0.5, deflate;q=0" → {"gzip", "br"}"""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def send(filename, accept_encoding):
+    """Send en bygget fil – .br/.gz hvis klienten kan tage imod dem."""
+    if filename not in _manifest.values():
+        return "Not found", 404
+
+    path = os.path.join(DIST_DIR, filename)
+    accepted = accepted_encodings(accept_encoding)
+    encoding = None
+    for coding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if coding in accepted and os.path.exists(path + suffix):
+            encoding, path = coding, path + suffix
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE, conditional=True, etag=False)
+    response.headers.pop("Content-Disposition", None)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
+
+
+def compress_response(response, accept_encoding):
+    """gzip/brotli af HTML og JSON – streamede svar og filer røres ikke."""
+    if not COMPRESS or response.mimetype not in COMPRESS_TYPES:
+        return response
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if "Content-Encoding" in response.headers:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    accepted = accepted_encodings(accept_encoding)
+    if brotli and "br" in accepted:
+        encoding, body = "br", brotli.compress(data, quality=BROTLI_QUALITY)
+    elif "gzip" in accepted:
+        encoding, body = "gzip", gzip.compress(data, COMPRESS_LEVEL, mtime=0)
+    else:
+        return response
+
+    COMPRESSED_BYTES.inc(len(data), encoding=encoding, stage="in")
+    COMPRESSED_BYTES.inc(len(body), encoding=encoding, stage="out")
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def main(argv=None):
+    manifest = build()
+    print(f"✅ {len(manifest)} fil(er) bygget til {os.path.relpath(DIST_DIR)}" + ("" if brotli else " (uden brotli)"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Svartid og korrekthed for salgsanalysen på /admin.
+
+    python bench/analytics_check.py --sessions 300 --orders 80
+
+Bygger et datasæt hvor de ældste sessions ligger i arkivet (som
+archive_sessions efterlader det), og måler /admin kold (alt tælles) og
+varm (kun den åbne session tælles). Tallene sammenlignes med en naiv
+optælling over alle ordrer, og det tjekkes at en ændret lukket session
+bliver talt forfra efter "session_changed" på bussen.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("ROLE_SYNC_SECONDS", "0")
+os.environ.setdefault("RATE_LIMIT", "off")
+
+import serializer
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import bus
+import web
+import analytics
+
+
+def naive_totals(mem):
+    revenue = paid = units = orders = 0
+    for _, o in mem.iter_session_orders():
+        orders += 1
+        revenue += o.get("total") or 0
+        if o.get("paid"):
+            paid += o.get("total") or 0
+        units += sum(a for a in (o.get("items") or {}).values() if a > 0)
+    return {"orders": orders, "revenue": revenue, "paid_revenue": paid, "units": units}
+
+
+def timed(client, n):
+    times = []
+    for _ in range(n):
+        started = time.perf_counter()
+        r = client.get("/admin")
+        times.append((time.perf_counter() - started) * 1000)
+        assert r.status_code == 200, r.status_code
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--orders", type=int, default=80)
+    parser.add_argument("--hot", type=int, default=20, help="sessions der ikke er arkiveret")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    dataset = make_dataset(args.sessions, args.orders)
+    sessions = dataset["sessions"]["sessions"]
+    names = list(sessions)
+    archived = names[:max(0, len(names) - args.hot)]
+
+    mem = MemoryDB(dataset)
+    data = mem.load_sessions()
+    for name in archived:
+        mem.archive[name] = serializer.dumps(data["sessions"].pop(name))
+    mem.save_sessions(data)
+    mem.install(web, analytics)
+
+    admin = next(uid for uid, u in dataset["access"]["users"].items() if u["role"] == "admin")
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": admin, "name": "admin", "avatar": None}
+
+    print(f"📊 {args.sessions} sessions × {args.orders} ordrer ({len(archived)} arkiveret)")
+
+    cold = timed(client, 1)[0]
+    warm = timed(client, args.repeat)
+    print(f"  kold (alt tælles)       {cold:8.1f} ms")
+    print(f"  varm (kun åben session) {statistics.median(warm):8.1f} ms median, {max(warm):.1f} ms max")
+
+    # en ny worker starter fra session_summaries
+    analytics._cache.clear()
+    analytics._loaded = False
+    analytics._merged = None
+    print(f"  ny worker (gemte)       {timed(client, 1)[0]:8.1f} ms")
+
+    expected = naive_totals(mem)
+    got = analytics.dashboard()["totals"]
+    for key, value in expected.items():
+        assert got[key] == value, (key, got[key], value)
+    print("✅ totaler matcher naiv optælling")
+
+    # betal alt i en lukket hot-session → cache skal smides ud
+    closed = names[len(archived)] if len(archived) < len(names) - 1 else archived[-1]
+    data = mem.load_sessions()
+    if closed in data["sessions"]:
+        for o in data["sessions"][closed]["orders"]:
+            o["paid"] = True
+        mem.save_sessions(data)
+    bus.publish("session_changed", {"session": closed})
+    expected = naive_totals(mem)
+    got = analytics.dashboard()["totals"]
+    assert got["paid_revenue"] == expected["paid_revenue"], (got["paid_revenue"], expected["paid_revenue"])
+    print(f"✅ {closed} talt forfra efter session_changed")
+
+    ok = statistics.median(warm) < 100
+    print(("✅" if ok else "❌") + " varm /admin under 100 ms")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
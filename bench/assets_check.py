@@ -0,0 +1,87 @@
+"""Bygning af statiske filer og komprimering af HTML/JSON.
+
+    python bench/assets_check.py --sessions 5 --orders 300
+
+Bygger static/dist, henter sessionssiden og dens stylesheet som en
+mobil-browser (Accept-Encoding: gzip, br) og viser bytes over linjen og
+hvad komprimeringen koster i svartid.
+"""
+import os
+import re
+import sys
+import gzip
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("ROLE_SYNC_SECONDS", "0")
+os.environ.setdefault("RATE_LIMIT", "off")
+
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import web
+import assets
+import analytics
+
+BROWSER = {"Accept-Encoding": "gzip, deflate, br"}
+
+
+def timed(client, path, n, headers=None):
+    times = []
+    for _ in range(n):
+        started = time.perf_counter()
+        r = client.get(path, headers=headers or {})
+        times.append((time.perf_counter() - started) * 1000)
+        assert r.status_code == 200, (path, r.status_code)
+    return statistics.median(times), r
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    manifest = assets.build(verbose=False)
+    assets.load()
+
+    dataset = make_dataset(args.sessions, args.orders)
+    MemoryDB(dataset).install(web, analytics)
+    current = dataset["sessions"]["current"]
+    admin = next(uid for uid, u in dataset["access"]["users"].items() if u["role"] == "admin")
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": admin, "name": "admin", "avatar": None}
+
+    path = f"/session/{current}"
+    plain_ms, plain = timed(client, path, args.repeat)
+    packed_ms, packed = timed(client, path, args.repeat, BROWSER)
+    encoding = packed.headers["Content-Encoding"]
+    print(f"📄 {path}: {len(plain.data):,} → {len(packed.data):,} bytes ({encoding}), "
+          f"{plain_ms:.1f} → {packed_ms:.1f} ms")
+    if encoding == "gzip":
+        assert gzip.decompress(packed.data) == plain.data
+
+    href = re.search(r'rel="stylesheet" href="([^"]+)"', plain.get_data(as_text=True)).group(1)
+    assert href == assets.ASSET_URL + manifest["style.css"], href
+    r = client.get(href, headers=BROWSER)
+    assert r.status_code == 200 and "immutable" in r.headers["Cache-Control"]
+    assert "Cookie" not in r.headers.get("Vary", "")
+    print(f"🎨 {href}: {os.path.getsize(os.path.join(assets.STATIC_DIR, 'style.css')):,} → "
+          f"{int(r.headers['Content-Length']):,} bytes ({r.headers.get('Content-Encoding')}), "
+          f"{r.headers['Cache-Control']}")
+    r.close()
+
+    r = client.get(f"/session_data/{current}", headers=BROWSER)
+    print(f"🔁 /session_data: {len(r.data)} bytes ({r.headers.get('Content-Encoding') or 'for lille til komprimering'})")
+    print("✅ statiske filer og komprimering ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
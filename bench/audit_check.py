@@ -0,0 +1,132 @@
+"""Audit-arkivet: månedsblobs, filtre og svartid på /admin/audit.
+
+    python bench/audit_check.py --events 100000 --months 24
+
+Fylder audit-loggen med events spredt over --months måneder, måler
+/admin/audit før og efter archive_audit(), og sammenligner filtrene
+(handling, datointerval) med en naiv filtrering af hele listen.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("ROLE_SYNC_SECONDS", "0")
+os.environ.setdefault("RATE_LIMIT", "off")
+
+import serializer
+from datasets import make_dataset
+from memdb import MemoryDB, TIME_FORMAT
+
+import web
+import analytics
+
+ACTIONS = ["create_order", "order_paid", "order_delivered", "edit_order", "delete_order",
+           "open_session", "close_session", "block", "unblock"]
+
+
+def make_events(n, months, seed=1):
+    rng = random.Random(seed)
+    now = datetime.now()
+    span = months * 30 * 24 * 60
+    events = []
+    for _ in range(n):
+        at = now - timedelta(minutes=rng.randrange(span))
+        events.append({
+            "time": at.strftime(TIME_FORMAT),
+            "action": rng.choice(ACTIONS),
+            "admin": f"admin{rng.randrange(5)}",
+            "target": str(rng.randrange(10 ** 6))
+        })
+    # audit-dokumentet er i indsættelsesrækkefølge
+    events.sort(key=lambda e: datetime.strptime(e["time"], TIME_FORMAT))
+    return events
+
+
+def naive(events, start=None, end=None, action=None):
+    out = []
+    for i, e in enumerate(events):
+        at = datetime.strptime(e["time"], TIME_FORMAT)
+        if (start is None or at >= start) and (end is None or at < end) and (action is None or e["action"] == action):
+            out.append((at, i, e))
+    out.sort(key=lambda x: x[:2], reverse=True)
+    return [e for _, _, e in out]
+
+
+def timed(client, path):
+    started = time.perf_counter()
+    r = client.get(path)
+    assert r.status_code == 200, (path, r.status_code)
+    return (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--days", type=int, default=90, help="retention")
+    args = parser.parse_args(argv)
+
+    dataset = make_dataset(2, 10)
+    events = make_events(args.events, args.months)
+    dataset["audit"] = events
+    mem = MemoryDB(dataset)
+    mem.install(web, analytics)
+
+    admin = next(uid for uid, u in dataset["access"]["users"].items() if u["role"] == "admin")
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": admin, "name": "admin", "avatar": None}
+
+    old_month = (datetime.now() - timedelta(days=400)).strftime("%Y-%m")
+    queries = [
+        ("første side", "/admin/audit"),
+        ("handling", "/admin/audit?action=block"),
+        ("gammel måned", f"/admin/audit?from={old_month}-01&to={old_month}-28"),
+    ]
+
+    print(f"📜 {args.events:,} events over {args.months} måneder")
+    before = {label: timed(client, path) for label, path in queries}
+
+    started = time.perf_counter()
+    moved = mem.archive_audit(args.days)
+    secs = time.perf_counter() - started
+    index = mem.audit_index()
+    raw = len(serializer.dumps_bytes(events))
+    packed = sum(m["bytes"] for m in index["months"])
+    print(f"🗄️ {sum(moved.values()):,} events → {len(moved)} måneder på {secs:.2f} s, "
+          f"{index['hot']:,} tilbage i den aktive tabel")
+    print(f"   {raw / 1024:,.0f} KB JSON → {packed / 1024:,.0f} KB gzip-JSONL")
+    assert index["hot"] + sum(moved.values()) == len(events)
+
+    for label, path in queries:
+        after = timed(client, path)
+        print(f"  {label:<14} {before[label]:8.1f} ms (alt hot) → {after:8.1f} ms (arkiveret)")
+
+    start = datetime.strptime(f"{old_month}-01", "%Y-%m-%d")
+    cases = [
+        {},
+        {"action": "block"},
+        {"start": start, "end": start + timedelta(days=28)},
+        {"start": start, "end": datetime.now(), "action": "order_paid"},
+    ]
+    for case in cases:
+        got = list(mem.iter_audit(**case))
+        want = naive(events, **case)
+        assert [(e["time"], e["action"], e["target"]) for e in got] == \
+               [(e["time"], e["action"], e["target"]) for e in want], case
+    print(f"✅ {len(cases)} filtre matcher naiv filtrering (nyeste først)")
+
+    html = client.get(f"/admin/audit?limit=50").get_data(as_text=True)
+    assert "Vis flere" in html and html.count('class="card"') == 50
+    print("✅ /admin/audit viser én side ad gangen")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
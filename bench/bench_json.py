@@ -0,0 +1,52 @@
+"""Benchmark: stdlib json vs. serializer (orjson) på realistiske session-dokumenter.
+
+Kør fra repo-roden:  python bench/bench_json.py [sessions] [ordrer_per_session]
+"""
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import serializer
+from datasets import make_dataset
+
+
+def run(n_sessions=50, n_orders=500, number=10):
+    doc = make_dataset(n_sessions, n_orders)["sessions"]
+    current = doc["sessions"][doc["current"]]["orders"]
+    raw_std = json.dumps(doc)
+    raw_fast = serializer.dumps_bytes(doc)
+
+    cases = {
+        "dumps sessions (save_sessions)": (
+            lambda: json.dumps(doc),
+            lambda: serializer.dumps(doc)
+        ),
+        "loads sessions (JSONB loader)": (
+            lambda: json.loads(raw_std),
+            lambda: serializer.loads(raw_fast)
+        ),
+        "dumps sort_keys (/session_data)": (
+            lambda: json.dumps(current, sort_keys=True).encode(),
+            lambda: serializer.dumps_bytes(current, sort_keys=True)
+        ),
+    }
+
+    print(f"📊 {n_sessions} sessions × {n_orders} ordrer – {len(raw_std) / 1e6:.1f} MB JSON "
+          f"(backend: {serializer.BACKEND})")
+    results = {}
+    for name, (std, fast) in cases.items():
+        t_std = timeit.timeit(std, number=number) / number
+        t_fast = timeit.timeit(fast, number=number) / number
+        results[name] = {"stdlib_ms": t_std * 1000, "serializer_ms": t_fast * 1000}
+        print(f"  {name:<34} stdlib {t_std * 1000:>9.2f} ms   serializer {t_fast * 1000:>9.2f} ms"
+              f"   ({t_std / t_fast:.1f}x)")
+    return results
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
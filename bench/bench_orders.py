@@ -0,0 +1,75 @@
+"""Mikro-benchmark: hvad koster én ordre-request ved 10k ordrer?
+
+Kør fra repo-roden:  python bench/bench_orders.py [antal_ordrer]
+
+Måler hele vejen for en request som mark_paid – parse sessions-
+dokumentet, find ordren, ret den, serialisér igen – og hvor stor en del
+selve opslaget er. Et dict-indeks skulle bygges forfra af den parsede
+liste ved hver request, så det koster det samme som det opslag det
+sparer (build_index mod find_order).
+
+Målingen er grunden til at orders.py ikke har et id-/user_id-indeks
+eller __slots__-ordreobjekter: ordrerne bliver som listen i dokumentet.
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serializer
+from orders import find_order, order_for_user, remove_order, used_items
+
+ITEMS = ["SNS", "9mm", "vintage", "ceramic", "xm3", "deagle", "Pump", "veste"]
+
+
+def make_session(n):
+    orders = []
+    for i in range(n):
+        orders.append({
+            "id": f"{1700000000 + i}.{i:06d}",
+            "user": f"user{i}",
+            "user_id": str(100000 + i),
+            "items": {k: random.randint(0, 3) for k in ITEMS},
+            "total": 0,
+            "time": "01-01-2025 12:00",
+            "paid": False,
+            "delivered": False
+        })
+    return {"open": True, "orders": orders, "locked_users": []}
+
+
+def run(n=10_000, lookups=200):
+    session_data = make_session(n)
+    raw = serializer.dumps_bytes({"current": "b", "sessions": {"b": session_data}})
+    ids = [o["id"] for o in random.sample(session_data["orders"], lookups)]
+    uids = [o["user_id"] for o in random.sample(session_data["orders"], lookups)]
+
+    def request():
+        data = serializer.loads(raw)
+        s = data["sessions"]["b"]
+        find_order(s, ids[0])["paid"] = True
+        return serializer.dumps_bytes(data)
+
+    results = {
+        "loads": timeit.timeit(lambda: serializer.loads(raw), number=10) / 10,
+        "dumps": timeit.timeit(lambda: serializer.dumps_bytes(session_data), number=10) / 10,
+        "find_order": timeit.timeit(lambda: [find_order(session_data, i) for i in ids], number=1) / lookups,
+        "order_for_user": timeit.timeit(lambda: [order_for_user(session_data, u) for u in uids], number=1) / lookups,
+        "build_index": timeit.timeit(lambda: {o["id"]: o for o in session_data["orders"]}, number=10) / 10,
+        "used_items": timeit.timeit(lambda: used_items(session_data), number=10) / 10,
+        "remove_order": timeit.timeit(lambda: remove_order(dict(session_data), ids[0]), number=10) / 10,
+        "request": timeit.timeit(request, number=10) / 10,
+    }
+
+    print(f"📊 {n} ordrer i én session ({len(raw) // 1024} KB JSON)")
+    for name, secs in results.items():
+        print(f"  {name:<16} {secs * 1e6:>12.2f} µs")
+    share = results["find_order"] / results["request"] * 100
+    print(f"  opslaget er {share:.1f}% af en hel request")
+    return results
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,98 @@
+"""Syntetiske datasæt til benchmarks (samme form som databasens JSON)."""
+import random
+from datetime import datetime, timedelta
+
+# de 8 varer fra db.init_db
+LAGER = {
+    "SNS": 20,
+    "9mm": 20,
+    "vintage": 10,
+    "ceramic": 10,
+    "xm3": 10,
+    "deagle": 10,
+    "Pump": 10,
+    "veste": 200
+}
+
+PRICES = {
+    "SNS": 500000,
+    "9mm": 800000,
+    "vintage": 950000,
+    "ceramic": 950000,
+    "xm3": 1500000,
+    "deagle": 1700000,
+    "Pump": 2550000,
+    "veste": 350000
+}
+
+TIME_FORMAT = "%d-%m-%Y %H:%M"
+
+
+def make_order(rng, i, uid, when):
+    items = {k: 0 for k in PRICES}
+    for item in rng.sample(list(PRICES), rng.randint(1, 3)):
+        items[item] = rng.randint(1, 5)
+    paid = rng.random() < 0.7
+    return {
+        "id": f"{when.timestamp():.6f}{i:05d}",
+        "user": f"user{uid}",
+        "user_id": str(100000000000000000 + uid),
+        "items": items,
+        "total": sum(items[k] * PRICES[k] for k in items),
+        "time": when.strftime(TIME_FORMAT),
+        "paid": paid,
+        "delivered": paid and rng.random() < 0.5
+    }
+
+
+def make_dataset(n_sessions, orders_per_session, n_users=None, seed=1):
+    """Returnerer dict med sessions, lager, prices, user_stats, access og audit."""
+    rng = random.Random(seed)
+    n_users = n_users or max(50, orders_per_session)
+    start = datetime(2024, 1, 1)
+
+    sessions = {}
+    stats = {}
+    for s in range(1, n_sessions + 1):
+        when = start + timedelta(days=s)
+        is_current = s == n_sessions
+        uids = rng.sample(range(n_users), min(orders_per_session, n_users))
+        uids += [rng.randrange(n_users) for _ in range(orders_per_session - len(uids))]
+
+        orders = []
+        for i, uid in enumerate(uids):
+            o = make_order(rng, i, uid, when)
+            orders.append(o)
+            if o["paid"]:
+                st = stats.setdefault(o["user_id"], {"total_spent": 0, "total_items": 0, "items": {}})
+                for item, amount in o["items"].items():
+                    if amount > 0:
+                        st["items"][item] = st["items"].get(item, 0) + amount
+                        st["total_items"] += amount
+                st["total_spent"] += o["total"]
+
+        session = {"open": is_current, "orders": orders, "locked_users": []}
+        if not is_current:
+            session["closed_at"] = (when + timedelta(hours=6)).strftime(TIME_FORMAT)
+        sessions[f"bestilling{s}"] = session
+
+    users = {
+        str(100000000000000000 + u): {
+            "name": f"user{u}",
+            "role": "admin" if u == 0 else "user",
+            "avatar": None,
+            "first_seen": start.strftime(TIME_FORMAT),
+            "last_seen": start.strftime(TIME_FORMAT)
+        }
+        for u in range(n_users)
+    }
+
+    return {
+        "sessions": {"current": f"bestilling{n_sessions}", "sessions": sessions},
+        # samme 8 varer – lageret skaleres så sessionen ikke er udsolgt
+        "lager": {k: v * orders_per_session for k, v in LAGER.items()},
+        "prices": dict(PRICES),
+        "user_stats": stats,
+        "access": {"users": users, "blocked": []},
+        "audit": []
+    }
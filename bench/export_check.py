@@ -0,0 +1,81 @@
+"""Hukommelsesforbrug for eksport af en stor arkiveret session.
+
+    python bench/export_check.py --orders 200000
+
+Pakker én session som session_archive gør (gzip JSON) og eksporterer den
+til CSV via samme kode som /admin/export (db._iter_packed_orders +
+export.csv_rows). Peak-hukommelse (tracemalloc) sammenlignes med at
+loade hele sessionen først.
+"""
+import os
+import sys
+import gzip
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import export
+import serializer
+from datasets import make_order, PRICES
+
+
+def build_blob(n):
+    rng = random.Random(1)
+    when = datetime(2024, 1, 1)
+    session = {
+        "open": False,
+        "closed_at": when.strftime(db.TIME_FORMAT),
+        "locked_users": [],
+        "orders": [make_order(rng, i, rng.randrange(5000), when) for i in range(n)]
+    }
+    return gzip.compress(serializer.dumps_bytes(session))
+
+
+def drain(chunks):
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+    return total
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} peak {peak / 1e6:8.2f} MB   {elapsed:6.2f} s   {size / 1e6:7.2f} MB CSV")
+    return peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    blob = build_blob(args.orders)
+    columns = list(PRICES)
+    print(f"📦 {args.orders} ordrer – {len(blob) / 1e6:.2f} MB komprimeret")
+
+    def streaming():
+        orders = (("s", o) for o in db._iter_packed_orders(blob))
+        return drain(export.csv_rows(orders, columns))
+
+    def materialized():
+        s = serializer.loads(gzip.decompress(blob))
+        return drain(export.csv_rows((("s", o) for o in s["orders"]), columns))
+
+    stream_peak = measure("streaming (eksport)", streaming)
+    full_peak = measure("hele sessionen i hukommelsen", materialized)
+    print(f"✅ streaming bruger {full_peak / max(stream_peak, 1):.0f}× mindre hukommelse")
+
+
+if __name__ == "__main__":
+    main()
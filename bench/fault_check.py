@@ -0,0 +1,289 @@
+"""Fejlinjektion mod db.py's retry-, breaker- og pool-stier.
+
+    python bench/fault_check.py                        # alle profiler
+    python bench/fault_check.py --profile resets --seconds 5
+
+Kører som en eventlet-worker (grønne tråde, ligesom gunicorn) med den
+rigtige psycopg2-pool, men forbindelserne kommer fra pgshim.py. Hver
+profil kører en blanding af load_sessions, save_session_ops (ny ordre),
+_load_latest, _insert og _run (save_meta) i --workers tråde, slår fejlene
+fra igen og venter på at journalen og breakeren er kommet sig. Derefter
+måles:
+
+    svartid      p50/p95/max pr. operation, og hvor mange der gav 503/500
+    pool-læk     forbindelser hentet med get_conn men aldrig frigivet,
+                 pladser poolen stadig tror er i brug, og åbne
+                 forbindelser som ingen pool kender (lukkes aldrig)
+    dobbelt      release_conn kaldt på en forbindelse der allerede er frigivet
+    tabte skriv  save_session_ops/save_meta der returnerede uden fejl, men
+                 ikke står i databasen bagefter
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("JOURNAL_DIR", tempfile.mkdtemp(prefix="fault-journal-"))
+os.environ.setdefault("JOURNAL_FLUSH_SECONDS", "0.2")
+os.environ.setdefault("DATABASE_URL", "postgresql://pgshim/faults")
+
+import db
+from orders import op
+from breaker import CircuitBreaker
+from pgshim import FakeServer, FaultProfile
+
+PROFILES = {
+    "baseline": {"fault": FaultProfile(latency_ms=2)},
+    "latency": {"fault": FaultProfile(latency_ms=40, jitter_ms=60)},
+    "resets": {"fault": FaultProfile(latency_ms=2, reset_rate=0.05)},
+    # få workers og lange pauser → forbindelser ligger stille i poolen
+    "idle_resets": {"fault": FaultProfile(latency_ms=2, idle_timeout=0.02), "workers": 4, "think": 0.05},
+    "commit_lost": {"fault": FaultProfile(latency_ms=2, commit_lost_rate=0.1)},
+    # flere samtidige requests end poolens maxconn=10
+    "exhaustion": {"fault": FaultProfile(latency_ms=30), "workers": 40},
+    # serveren er væk i midten af kørslen
+    "outage": {"fault": FaultProfile(latency_ms=2), "outage": (0.3, 0.6)},
+}
+
+OPS = {"load_sessions": 4, "save_ops": 2, "load_latest": 2, "insert": 1, "save_meta": 1}
+
+SEED_DOCS = {
+    "sessions": {"current": "faults", "sessions": {"faults": {"open": True, "orders": []}}},
+    "lager": {"SNS": 20, "veste": 200},
+    "prices": {"SNS": 500000, "veste": 350000},
+}
+
+
+# =====================
+# INSTRUMENTERING AF db.py
+# =====================
+class Probe:
+    """Tæller get_conn/release_conn og create_pool – db.py kalder dem via modulet."""
+
+    def __init__(self):
+        self.get_conn = db.get_conn
+        self.release_conn = db.release_conn
+        self.create_pool = db.create_pool
+        self.reset()
+        db.get_conn = self._get_conn
+        db.release_conn = self._release_conn
+        db.create_pool = self._create_pool
+
+    def reset(self):
+        self.out = {}
+        self.double = 0
+        self.pools = 0
+
+    def _get_conn(self, read=False):
+        conn = self.get_conn(read)
+        self.out[id(conn)] = conn
+        return conn
+
+    def _release_conn(self, conn, broken=False):
+        if self.out.pop(id(conn), None) is None:
+            self.double += 1
+        return self.release_conn(conn, broken)
+
+    def _create_pool(self):
+        self.pools += 1
+        return self.create_pool()
+
+
+# =====================
+# WORKLOAD
+# =====================
+class Run:
+    def __init__(self, server, seed):
+        self.server = server
+        self.rng = random.Random(seed)
+        self.acked_orders = set()
+        self.acked_meta = set()
+        self.samples = {op: [] for op in OPS}
+        self.outcomes = {op: {} for op in OPS}
+
+    def op_load_sessions(self, wid, i):
+        db.load_sessions()
+
+    def op_save_ops(self, wid, i):
+        # ingen lås her – ændringen afspilles mod det nyeste dokument
+        marker = f"{wid}-{i}"
+        db.save_session_ops([op("add_order", session="faults", order={"id": marker})])
+        self.acked_orders.add(marker)
+
+    def op_load_latest(self, wid, i):
+        db.load_lager()
+
+    def op_insert(self, wid, i):
+        db._insert("prices", SEED_DOCS["prices"])
+
+    def op_save_meta(self, wid, i):
+        key = f"fault-{wid}-{i}"
+        db.save_meta(key, i)
+        self.acked_meta.add(key)
+
+    def worker(self, wid, deadline, think):
+        rng = random.Random(wid)
+        names, weights = list(OPS), list(OPS.values())
+        i = 0
+        while time.monotonic() < deadline:
+            i += 1
+            op = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                getattr(self, f"op_{op}")(wid, i)
+                outcome = "ok"
+            except db.DatabaseUnavailable:
+                outcome = "503"
+            except Exception as e:
+                outcome = f"500 {type(e).__name__}"
+            self.samples[op].append((time.perf_counter() - started) * 1000)
+            self.outcomes[op][outcome] = self.outcomes[op].get(outcome, 0) + 1
+            time.sleep(think * rng.random() * 2)
+
+
+def reset_db():
+    """Frisk pool og breaker pr. profil (journalen er tom efter forrige)."""
+    old = db.pool
+    db.pool = None
+    if old is not None:
+        try:
+            old.closeall()
+        except Exception:
+            pass
+    db.db_breaker = CircuitBreaker("db", probe=db._probe_primary, failure_threshold=5, probe_interval=0.2)
+
+
+def wait_recovered(timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not db.journal.pending_count() and db.db_breaker.allow():
+            return True
+        db.journal.start_flusher()
+        time.sleep(0.05)
+    return False
+
+
+def run_profile(name, spec, probe, seconds, workers):
+    server = FakeServer(SEED_DOCS, seed=len(name))
+    server.meta["current"] = "faults"
+    server.install()
+    reset_db()
+    probe.reset()
+
+    fault = spec["fault"]
+    server.profile = fault
+    run = Run(server, seed=1)
+    workers = spec.get("workers", workers)
+    deadline = time.monotonic() + seconds
+
+    outage = spec.get("outage")
+    if outage:
+        def toggle():
+            time.sleep(seconds * outage[0])
+            fault.down = True
+            time.sleep(seconds * (outage[1] - outage[0]))
+            fault.down = False
+        threading.Thread(target=toggle, daemon=True).start()
+
+    threads = [
+        threading.Thread(target=run.worker, args=(w, deadline, spec.get("think", 0.005)), daemon=True)
+        for w in range(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    server.profile = FaultProfile()
+    recovered = wait_recovered(10)
+
+    pool = db.pool
+    known = set()
+    used = 0
+    if pool is not None:
+        known = {id(c) for c in pool._pool} | {id(c) for c in pool._used.values()}
+        used = len(pool._used)
+
+    final = server.latest("sessions", {})
+    stored = {o["id"] for o in final.get("sessions", {}).get("faults", {}).get("orders", [])}
+    return {
+        "run": run,
+        "server": server,
+        "recovered": recovered,
+        "leaked": len(probe.out),
+        "pool_used": used,
+        "orphaned": sum(1 for c in server.open_conns() if id(c) not in known),
+        "double": probe.double,
+        "pools": probe.pools,
+        "lost_orders": len(run.acked_orders - stored),
+        "lost_meta": len(run.acked_meta - set(server.meta)),
+    }
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(name, r):
+    run = r["run"]
+    samples = [v for vs in run.samples.values() for v in vs]
+    stats = r["server"].stats
+    print(f"\n🧨 {name}: {len(samples)} kald")
+    for op, vs in run.samples.items():
+        if vs:
+            failed = ", ".join(f"{k} ×{v}" for k, v in sorted(run.outcomes[op].items()) if k != "ok")
+            print(f"  {op:<14} p50 {statistics.median(vs):7.1f} ms   p95 {pct(vs, 0.95):7.1f} ms   "
+                  f"max {max(vs):7.1f} ms   {failed}")
+    print(f"  server: {stats['connects']} connects ({stats['connect_failures']} afvist), {stats['resets']} resets, "
+          f"{stats['idle_kills']} idle-lukninger, {stats['commits_lost']} tvetydige commits, {r['pools']} nye pools")
+
+    problems = []
+    if r["leaked"] or r["pool_used"]:
+        problems.append(f"{r['leaked']} forbindelser aldrig frigivet, {r['pool_used']} pladser optaget i poolen")
+    if r["orphaned"]:
+        problems.append(f"{r['orphaned']} åbne forbindelser uden pool")
+    if r["double"]:
+        problems.append(f"release_conn kaldt {r['double']} gange på allerede frigivne forbindelser")
+    if r["lost_orders"] or r["lost_meta"]:
+        problems.append(f"{r['lost_orders']} tabte save_session_ops, {r['lost_meta']} tabte save_meta "
+                        f"(af {len(run.acked_orders)} + {len(run.acked_meta)} bekræftede)")
+    if not r["recovered"]:
+        problems.append("journal/breaker ikke kommet sig efter 10 s")
+    for p in problems:
+        print(f"  ❌ {p}")
+    if not problems:
+        print(f"  ✅ ingen læk, ingen dobbelt-release, 0 tabte af "
+              f"{len(run.acked_orders) + len(run.acked_meta)} bekræftede skrivninger")
+    return not problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", action="append", choices=list(PROFILES))
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    probe = Probe()
+    ok = True
+    for name in args.profile or PROFILES:
+        ok &= report(name, run_profile(name, PROFILES[name], probe, args.seconds, args.workers))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
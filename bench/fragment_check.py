@@ -0,0 +1,91 @@
+"""Svartid og korrekthed for fragment-cachen på / og /session.
+
+    python bench/fragment_check.py --sessions 20 --orders 1000
+
+Måler forsiden og sessionssiden som admin og som almindelig bruger, og
+tjekker at en ændret session bliver renderet forfra – både når revisionen
+skifter og når "session_changed" kommer over bussen.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("ROLE_SYNC_SECONDS", "0")
+os.environ.setdefault("RATE_LIMIT", "off")
+
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import bus
+import web
+import fragments
+import analytics
+
+
+def client_for(uid):
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": uid, "name": uid, "avatar": None}
+    return client
+
+
+def timed(client, path, n):
+    times = []
+    for _ in range(n):
+        started = time.perf_counter()
+        r = client.get(path)
+        times.append((time.perf_counter() - started) * 1000)
+        assert r.status_code == 200, (path, r.status_code)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    dataset = make_dataset(args.sessions, args.orders)
+    mem = MemoryDB(dataset)
+    mem.install(web, analytics)
+    current = dataset["sessions"]["current"]
+    users = dataset["access"]["users"]
+    admin = client_for(next(uid for uid, u in users.items() if u["role"] == "admin"))
+    user = client_for(next(uid for uid, u in users.items() if u["role"] != "admin"))
+
+    print(f"🧩 {args.sessions} sessions × {args.orders} ordrer")
+    for who, client in (("admin", admin), ("bruger", user)):
+        for path in ("/", f"/session/{current}"):
+            cold = timed(client, path, 1)[0]
+            warm = timed(client, path, args.repeat)
+            print(f"  {who:<7} {path:<24} kold {cold:7.1f} ms   varm {statistics.median(warm):7.1f} ms median")
+    print(f"  {len(fragments.cache.entries)} fragmenter, {fragments.cache.size / 1024:.0f} KB")
+
+    # admin og bruger må ikke dele ordretabellen (bulk-handlinger, betal-knapper)
+    assert "bulk-form" in admin.get(f"/session/{current}").get_data(as_text=True)
+    assert "bulk-form" not in user.get(f"/session/{current}").get_data(as_text=True)
+    print("✅ ordretabellen renderes pr. rolle")
+
+    # ny ordre → ny revision → ny tabel
+    data = mem.load_sessions()
+    order = dict(data["sessions"][current]["orders"][0], id="999999.0", user="Fragmenttjek")
+    data["sessions"][current]["orders"].append(order)
+    mem.save_sessions(data)
+    assert "Fragmenttjek" in admin.get(f"/session/{current}").get_data(as_text=True)
+    print("✅ ændret session giver ny revision")
+
+    before = len(fragments.cache.by_session.get(current, ()))
+    bus.publish("session_changed", {"session": current})
+    assert before and current not in fragments.cache.by_session
+    print(f"✅ session_changed smed {before} fragment(er) ud")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
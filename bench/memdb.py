@@ -0,0 +1,355 @@
+"""In-memory stand-in for db.py's load_*/save_* API.
+
+Dokumenterne gemmes som JSON-tekst, så hver load/save betaler den samme
+serialiseringspris som en JSONB round trip – bare uden netværket.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serializer
+from db import pack_audit_month, iter_audit_month
+from orders import apply_ops
+
+TIME_FORMAT = "%d-%m-%Y %H:%M"
+
+
+class MemoryDB:
+    def __init__(self, dataset, latency_ms=0):
+        self.docs = {k: serializer.dumps(v) for k, v in dataset.items()}
+        self.archive = {}
+        self._closed_at = {}
+        self._audit_months = {}
+        self.calls = {}
+        # simuleret netværks-round trip (time.sleep → grøn under eventlet)
+        self.latency = latency_ms / 1000
+
+    def _load(self, key):
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        return serializer.loads(self.docs[key])
+
+    def _save(self, key, data):
+        self.calls["save_" + key] = self.calls.get("save_" + key, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.docs[key] = serializer.dumps(data)
+
+    # ---- db.py API ----
+    def load_sessions(self):
+        return self._load("sessions")
+
+    def save_sessions(self, data):
+        self._save("sessions", data)
+
+    def load_lager(self):
+        return self._load("lager")
+
+    def load_prices(self):
+        return self._load("prices")
+
+    def load_user_stats(self):
+        return self._load("user_stats")
+
+    def load_user_stat(self, uid):
+        return self._load("user_stats").get(uid, {"total_spent": 0, "total_items": 0, "items": {}})
+
+    def save_user_stats(self, stats):
+        self._save("user_stats", stats)
+
+    def update_user_stats(self, uids, fn):
+        stats = self.load_user_stats()
+        new = fn({uid: stats[uid] for uid in uids if uid in stats})
+        stats.update(new)
+        self.save_user_stats(stats)
+        return new
+
+    def load_meta(self, key, default=None):
+        return self._load("meta").get(key, default) if "meta" in self.docs else default
+
+    def save_meta(self, key, value):
+        meta = self._load("meta") if "meta" in self.docs else {}
+        meta[key] = value
+        self._save("meta", meta)
+
+    def reset_all_stats(self):
+        self._save("user_stats", {})
+
+    def load_access(self):
+        return self._load("access")
+
+    def save_access(self, data):
+        self._save("access", data)
+
+    def _user(self, access, uid):
+        u = access["users"].get(uid)
+        if u is None:
+            return None
+        return {
+            "uid": uid,
+            "name": u.get("name", "Ukendt"),
+            "avatar": u.get("avatar"),
+            "role": u.get("role", "user"),
+            "blocked": uid in access["blocked"],
+            "revoked": u.get("revoked", False),
+            "discord_roles": u.get("discord_roles", []),
+            "roles_checked": u.get("roles_checked"),
+            "first_seen": u.get("first_seen"),
+            "last_seen": u.get("last_seen")
+        }
+
+    def load_user(self, uid):
+        return self._user(self.load_access(), uid)
+
+    def list_users(self, page=1, per_page=50):
+        access = self.load_access()
+        users = sorted(
+            (self._user(access, uid) for uid in access["users"]),
+            key=lambda u: (u["role"] != "admin", u["name"].lower(), u["uid"])
+        )
+        start = (max(page, 1) - 1) * per_page
+        return users[start:start + per_page], len(users)
+
+    def login_user(self, uid, name, avatar):
+        access = self.load_access()
+        now = datetime.now().strftime(TIME_FORMAT)
+        u = access["users"].setdefault(uid, {"role": "user", "first_seen": now})
+        u.update(name=name, avatar=avatar, last_seen=now, revoked=False)
+        self.save_access(access)
+
+    def touch_user(self, uid, when=None):
+        pass  # coalesces i db.py – ingen skrivning pr. request
+
+    def set_role(self, uid, role):
+        access = self.load_access()
+        if uid not in access["users"]:
+            return False
+        access["users"][uid]["role"] = role
+        self.save_access(access)
+        return True
+
+    def set_blocked(self, uid, blocked):
+        access = self.load_access()
+        if uid not in access["users"]:
+            return False
+        access["blocked"] = [b for b in access["blocked"] if b != uid] + ([uid] if blocked else [])
+        self.save_access(access)
+        return True
+
+    def load_active_users(self, since):
+        out = []
+        for uid, u in self.load_access()["users"].items():
+            try:
+                seen = datetime.strptime(u.get("last_seen", ""), TIME_FORMAT)
+            except ValueError:
+                continue
+            if seen >= since:
+                out.append((uid, u.get("revoked", False)))
+        return out
+
+    def save_role_checks(self, roles, revoked, when=None):
+        access = self.load_access()
+        when = (when or datetime.now()).strftime(TIME_FORMAT)
+        for uid, r in roles.items():
+            u = access["users"][uid]
+            u["discord_roles"] = r
+            u["roles_checked"] = when
+            if uid in revoked:
+                u["revoked"] = True
+        self.save_access(access)
+
+    def load_audit(self):
+        return self._load("audit")
+
+    def audit_log(self, action, admin, target):
+        events = self.load_audit()
+        events.append({
+            "time": datetime.now().strftime(TIME_FORMAT),
+            "action": action,
+            "admin": admin,
+            "target": target
+        })
+        self._save("audit", events)
+
+    def _hot_audit(self):
+        events = []
+        for i, e in enumerate(self.load_audit()):
+            try:
+                at = datetime.strptime(e["time"], TIME_FORMAT)
+            except (TypeError, ValueError):
+                at = datetime.now()
+            events.append((at, i, e))
+        return events
+
+    def iter_audit(self, start=None, end=None, action=None):
+        hot = sorted(self._hot_audit(), key=lambda ev: ev[:2], reverse=True)
+        for at, _, e in hot:
+            if (start is None or at >= start) and (end is None or at < end) \
+                    and (action is None or e["action"] == action):
+                yield e
+        for month in sorted(self._audit_months, reverse=True):
+            m = self._audit_months[month]
+            if start is not None and m["last_at"] < start or end is not None and m["first_at"] >= end:
+                continue
+            if action is not None and action not in m["actions"]:
+                continue
+            yield from iter_audit_month(m["data"], start, end, action)
+
+    def audit_index(self):
+        actions = {e["action"] for e in self.load_audit()}
+        for m in self._audit_months.values():
+            actions |= m["actions"]
+        return {
+            "hot": len(self.load_audit()),
+            "actions": sorted(actions),
+            "months": [
+                {"month": month.strftime("%Y-%m"), "events": m["events"], "first": m["first_at"],
+                 "last": m["last_at"], "bytes": len(m["data"])}
+                for month, m in sorted(self._audit_months.items(), reverse=True)
+            ]
+        }
+
+    def archive_audit(self, max_age_days=None):
+        cutoff = datetime.now() - timedelta(days=90 if max_age_days is None else max_age_days)
+        keep, months = [], {}
+        for at, i, e in sorted(self._hot_audit(), key=lambda ev: ev[:2]):
+            if at >= cutoff:
+                keep.append(e)
+                continue
+            months.setdefault(at.date().replace(day=1), []).append((at, e["action"], e.get("admin"), e.get("target")))
+        for month, events in months.items():
+            m = self._audit_months.setdefault(month, {
+                "first_at": events[0][0], "last_at": events[-1][0], "events": 0, "actions": set(), "data": b""
+            })
+            m["first_at"] = min(m["first_at"], events[0][0])
+            m["last_at"] = max(m["last_at"], events[-1][0])
+            m["events"] += len(events)
+            m["actions"] |= {ev[1] for ev in events}
+            m["data"] += pack_audit_month(events)
+        self._save("audit", keep)
+        return {m.strftime("%Y-%m"): len(evs) for m, evs in sorted(months.items())}
+
+    # køen kører synkront her, så målingen stadig betaler for arbejdet
+    def queue_audit(self, action, admin, target):
+        self.audit_log(action, admin, target)
+
+    def _apply_stats(self, uid, items, total, sign=1):
+        stats = self.load_user_stats()
+        entry = stats.setdefault(uid, {"total_spent": 0, "total_items": 0, "items": {}})
+        for item, amount in items.items():
+            if amount > 0:
+                entry["items"][item] = entry["items"].get(item, 0) + sign * amount
+                entry["total_items"] += sign * amount
+                if entry["items"][item] <= 0:
+                    del entry["items"][item]
+        entry["total_spent"] = max(0, entry["total_spent"] + sign * (total or 0))
+        entry["total_items"] = max(0, entry["total_items"])
+        self.save_user_stats(stats)
+
+    def save_session_ops(self, ops, audit_events=()):
+        data = self._load("sessions")
+        # stats i samme "transaktion" – som db._apply_session_ops
+        for delta in apply_ops(data, ops):
+            self._apply_stats(*delta)
+        self._save("sessions", data)
+        if audit_events:
+            self._save("audit", self.load_audit() + list(audit_events))
+        return True
+
+    def notify_session(self, name, data=None):
+        # ingen Socket.IO-klienter i benchmarks – kun den gemte summary
+        if data is None or data.get("current") != name:
+            self.queue_drop_session_summary(name)
+
+    def load_archived_session(self, name):
+        raw = self.archive.get(name)
+        return serializer.loads(raw) if raw else None
+
+    def list_archived_sessions(self):
+        return list(self.archive)
+
+    def load_archived_sessions_for_user(self, uid):
+        out = {}
+        for name, raw in self.archive.items():
+            s = serializer.loads(raw)
+            if any(o.get("user_id") == uid for o in s.get("orders", [])):
+                out[name] = s
+        return out
+
+    def iter_session_orders(self, name=None, paid=None, delivered=None, archive=True):
+        sessions = dict(self._load("sessions")["sessions"])
+        if archive:
+            sessions.update({n: serializer.loads(raw) for n, raw in self.archive.items()})
+        for sname, s in sessions.items():
+            if name is not None and sname != name:
+                continue
+            for o in s.get("orders", []):
+                if (paid is None or bool(o.get("paid")) == paid) and \
+                        (delivered is None or bool(o.get("delivered")) == delivered):
+                    yield sname, o
+
+    @contextmanager
+    def stats_snapshot(self):
+        # alt læses nu – senere skrivninger ses ikke, som i REPEATABLE READ
+        yield self.load_user_stats(), list(self.iter_session_orders(paid=True))
+
+    def iter_archived_sessions(self, names=None, paid=None, delivered=None):
+        for sname, raw in self.archive.items():
+            if names is not None and sname not in names:
+                continue
+            s = serializer.loads(raw)
+            orders = (
+                o for o in s.get("orders", [])
+                if (paid is None or bool(o.get("paid")) == paid)
+                and (delivered is None or bool(o.get("delivered")) == delivered)
+            )
+            yield sname, s.get("closed_at"), orders
+
+    def list_session_index(self):
+        data = self._load("sessions")
+        # som closed_at-kolonnen i session_archive – blobbet pakkes ikke ud
+        archived = {}
+        for n, raw in self.archive.items():
+            if (n, len(raw)) not in self._closed_at:
+                self._closed_at[(n, len(raw))] = serializer.loads(raw).get("closed_at")
+            archived[n] = self._closed_at[(n, len(raw))]
+        return {
+            "current": data.get("current"),
+            "hot": {n: s.get("closed_at") for n, s in data["sessions"].items()},
+            "archived": archived
+        }
+
+    def aggregate_hot_sessions(self, names):
+        return None  # ingen SQL her – analytics tæller selv i Python
+
+    def load_session_summaries(self):
+        return serializer.loads(self.docs.get("session_summaries", "{}"))
+
+    def save_session_summaries(self, summaries):
+        if summaries:
+            self._save("session_summaries", {**self.load_session_summaries(), **summaries})
+
+    def queue_drop_session_summary(self, name):
+        stored = self.load_session_summaries()
+        if stored.pop(name, None) is not None:
+            self._save("session_summaries", stored)
+
+    def delete_archived_session(self, name):
+        return self.archive.pop(name, None) is not None
+
+    def archive_sessions(self, max_age_days=None):
+        return []
+
+    def install(self, *modules):
+        """Erstat db-funktionerne som modulerne har importeret."""
+        for module in modules:
+            for name in dir(self):
+                if name.startswith("_") or name in ("install", "docs", "archive", "calls"):
+                    continue
+                if hasattr(module, name):
+                    setattr(module, name, getattr(self, name))
@@ -0,0 +1,257 @@
+"""Driver-shim til fejlinjektion: psycopg2.connect → forbindelser i hukommelsen.
+
+Den rigtige psycopg2-pool (SimpleConnectionPool) og alt i db.py kører
+uændret – kun selve forbindelsen er falsk. Den opfører sig som psycopg2
+når serveren forsvinder: execute/commit kaster OperationalError, og
+forbindelsen står derefter som closed=2, så næste brug giver
+InterfaceError. Fejlene styres af en profil:
+
+    latency_ms / jitter_ms   ventetid pr. statement (time.sleep → grøn under eventlet)
+    reset_rate               sandsynlighed for at forbindelsen dør midt i et statement
+    commit_lost_rate         commit når frem, men svaret gør ikke (tvetydig commit)
+    idle_timeout             serveren lukker forbindelser der har ligget stille så længe
+    down                     serveren er nede: connect og statements fejler
+
+Serveren forstår kun de statements db.py bruger til dokumenttabellerne
+og meta (load_sessions, save_session_ops, _load_latest, _insert, *_meta).
+pg_advisory_xact_lock holdes til transaktionen slutter, som i Postgres.
+"""
+import re
+import time
+import random
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+import serializer
+
+
+class FaultProfile:
+    def __init__(self, latency_ms=0, jitter_ms=0, reset_rate=0.0, commit_lost_rate=0.0,
+                 idle_timeout=None, down=False):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reset_rate = reset_rate
+        self.commit_lost_rate = commit_lost_rate
+        self.idle_timeout = idle_timeout
+        self.down = down
+
+
+_DOC_SELECT = re.compile(r"^SELECT data(::text)? FROM (\w+) ORDER BY id DESC LIMIT 1$")
+_ADVISORY_LOCK = re.compile(r"^SELECT pg_advisory_xact_lock\(%s\)$")
+_DOC_INSERT = re.compile(r"^INSERT INTO (\w+) \(data\) VALUES \(%s\)$")
+_META_SELECT = re.compile(r"^SELECT value FROM meta WHERE key ?= ?(?:'(\w+)'|%s)$")
+_META_UPSERT = re.compile(
+    r"^INSERT INTO meta \(key, value\) VALUES \((?:'(\w+)'|%s), %s\) ON CONFLICT \(key\) DO UPDATE SET value = EXCLUDED\.value;?$"
+)
+
+
+class FakeServer:
+    def __init__(self, docs=None, seed=1):
+        self.profile = FaultProfile()
+        self.rng = random.Random(seed)
+        self.docs = {k: [serializer.dumps(v)] for k, v in (docs or {}).items()}
+        self.meta = {}
+        self.conns = []
+        self.xact_locks = {}
+        self.stats = {"connects": 0, "connect_failures": 0, "resets": 0, "idle_kills": 0,
+                      "commits": 0, "commits_lost": 0}
+        self._lock = threading.Lock()
+
+    # ---- psycopg2.connect ----
+    def connect(self, *args, **kwargs):
+        self._delay()
+        if self.profile.down:
+            self.stats["connect_failures"] += 1
+            raise psycopg2.OperationalError("could not connect to server: Connection refused")
+        conn = FakeConnection(self)
+        with self._lock:
+            self.stats["connects"] += 1
+            self.conns.append(conn)
+        return conn
+
+    def install(self):
+        psycopg2.connect = self.connect
+
+    def open_conns(self):
+        return [c for c in self.conns if not c.closed]
+
+    # ---- fejl ----
+    def _delay(self):
+        p = self.profile
+        if p.latency_ms or p.jitter_ms:
+            time.sleep((p.latency_ms + self.rng.random() * p.jitter_ms) / 1000)
+
+    def _roll(self, rate):
+        return rate and self.rng.random() < rate
+
+    # ---- statements ----
+    def run(self, sql, params, pending):
+        sql = " ".join(sql.split())
+        params = tuple(params or ())
+
+        if sql == "SELECT 1":
+            return [(1,)]
+
+        m = _DOC_SELECT.match(sql)
+        if m:
+            with self._lock:
+                rows = self.docs.get(m.group(2))
+                if not rows:
+                    return []
+                return [(rows[-1] if m.group(1) else serializer.loads(rows[-1]),)]
+
+        m = _DOC_INSERT.match(sql)
+        if m:
+            pending.append(("doc", m.group(1), params[0]))
+            return []
+
+        m = _META_SELECT.match(sql)
+        if m:
+            key = m.group(1) or params[0]
+            with self._lock:
+                return [(self.meta[key],)] if key in self.meta else []
+
+        m = _META_UPSERT.match(sql)
+        if m:
+            key, value = (m.group(1), params[0]) if m.group(1) else params
+            pending.append(("meta", key, value))
+            return []
+
+        raise psycopg2.ProgrammingError(f"pgshim forstår ikke: {sql[:80]}")
+
+    def apply(self, pending):
+        with self._lock:
+            for kind, key, value in pending:
+                if kind == "doc":
+                    self.docs.setdefault(key, []).append(value)
+                else:
+                    self.meta[key] = value
+            self.stats["commits"] += 1
+
+    def xact_lock(self, key):
+        with self._lock:
+            lock = self.xact_locks.setdefault(key, threading.Lock())
+        return lock
+
+    def latest(self, table, default=None):
+        with self._lock:
+            rows = self.docs.get(table)
+            return serializer.loads(rows[-1]) if rows else default
+
+
+class _Info:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @property
+    def transaction_status(self):
+        if self.conn.closed:
+            return extensions.TRANSACTION_STATUS_UNKNOWN
+        if self.conn.pending is not None:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = 0
+        self.autocommit = False
+        self.pending = None          # None = ingen åben transaktion
+        self.held = []               # advisory locks til transaktionen slutter
+        self.last_used = time.monotonic()
+        self.info = _Info(self)
+
+    def _check(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+
+    def _end(self):
+        self.pending = None
+        while self.held:
+            self.held.pop().release()
+
+    def _break(self, message, counter):
+        self.closed = 2
+        self._end()
+        self.server.stats[counter] += 1
+        raise psycopg2.OperationalError(message)
+
+    def _io(self):
+        """Én round trip: ventetid og de fejl profilen giver."""
+        self._check()
+        server = self.server
+        p = server.profile
+        now = time.monotonic()
+        idle = now - self.last_used
+        self.last_used = now
+
+        if p.idle_timeout is not None and self.pending is None and idle > p.idle_timeout:
+            self._break("SSL SYSCALL error: EOF detected", "idle_kills")
+        server._delay()
+        if p.down:
+            self._break("server closed the connection unexpectedly", "resets")
+        if server._roll(p.reset_rate):
+            self._break("SSL connection has been closed unexpectedly", "resets")
+
+    def cursor(self, name=None):
+        self._check()
+        return FakeCursor(self)
+
+    def commit(self):
+        self._io()
+        pending = self.pending
+        if pending:
+            self.server.apply(pending)
+        # låsene slippes først når ændringen er synlig
+        self._end()
+        if pending:
+            if self.server._roll(self.server.profile.commit_lost_rate):
+                # skrevet på serveren – men klienten ser en død forbindelse
+                self.server.stats["commits_lost"] += 1
+                self._break("server closed the connection unexpectedly", "resets")
+
+    def rollback(self):
+        self._check()
+        self._end()
+
+    def close(self):
+        if self.closed != 1:
+            self.closed = 1
+            self._end()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+        self.itersize = 2000
+
+    def execute(self, sql, params=None):
+        conn = self.conn
+        conn._io()
+        if conn.pending is None:
+            conn.pending = []
+        if _ADVISORY_LOCK.match(" ".join(sql.split())):
+            lock = conn.server.xact_lock(params[0])
+            lock.acquire()
+            conn.held.append(lock)
+            self.rows = [("",)]
+            return
+        self.rows = conn.server.run(sql, params, conn.pending)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def __iter__(self):
+        while self.rows:
+            yield self.rows.pop(0)
+
+    def close(self):
+        self.rows = []
@@ -0,0 +1,77 @@
+"""Token-bucket grænserne mod den rigtige Flask-app.
+
+    python bench/ratelimit_check.py
+
+Én bruger poller /session_data hurtigere end poll-grænsen tillader: de
+første (burst) går igennem, resten får 429 med Retry-After, og efter
+Retry-After sekunder (simuleret ur) er der plads igen. /debug_db har sin
+egen, langt lavere grænse, og afvisningerne tælles i /metrics.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("ROLE_SYNC_SECONDS", "0")
+
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import web
+import metrics
+import ratelimit
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    clock = Clock()
+    ratelimit.limiter = ratelimit.RateLimiter(ratelimit.rules_from_env(), clock=clock)
+    burst = int(ratelimit.limiter.rules["poll"]["user"][0])
+
+    dataset = make_dataset(2, 20)
+    MemoryDB(dataset).install(web)
+    current = dataset["sessions"]["current"]
+    uid = next(u for u, v in dataset["access"]["users"].items() if v["role"] != "admin")
+
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": uid, "name": "poller", "avatar": None}
+
+    codes = [client.get(f"/session_data/{current}").status_code for _ in range(burst + 20)]
+    ok = codes.count(200)
+    limited = [c for c in codes if c == 429]
+    r = client.get(f"/session_data/{current}")
+    print(f"📡 poll: {ok} ok, {len(limited) + 1} × 429, Retry-After={r.headers.get('Retry-After')}")
+    assert ok == burst and r.status_code == 429 and r.headers.get("Retry-After")
+
+    clock.now += int(r.headers["Retry-After"])
+    assert client.get(f"/session_data/{current}").status_code == 200
+    print("✅ plads igen efter Retry-After")
+
+    # anden bruger, samme IP – egen spand, men IP-grænsen er fælles
+    other = web.app.test_client()
+    with other.session_transaction() as s:
+        s["user"] = {"id": "other", "name": "anden", "avatar": None}
+    assert other.get(f"/session_data/{current}").status_code == 200
+    print("✅ anden bruger påvirkes ikke af første brugers spand")
+
+    debug = [client.get("/debug_db").status_code for _ in range(10)]
+    print(f"🐞 debug_db: {debug.count(429)} af 10 afvist")
+    assert debug.count(429) >= 5
+    # pollerens uid er ikke admin → resten afvises
+    assert set(debug) <= {403, 429}, debug
+
+    text = metrics.render()
+    assert 'bestilling_rate_limited_total{limit="poll",scope="user"}' in text
+    print("✅ afvisninger eksporteres i /metrics")
+
+
+if __name__ == "__main__":
+    main()
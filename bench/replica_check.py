@@ -0,0 +1,63 @@
+"""Lokal kontrol af read-replica routing mod to Postgres-instanser.
+
+    DATABASE_URL=postgres://...primær  DATABASE_READ_URL=postgres://...replica \\
+        python bench/replica_check.py
+
+Skriver intet til databasen – en skrivning simuleres kun i routing-laget.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import metrics
+
+
+def reads(target):
+    return metrics.DB_READS.get(target=target)
+
+
+def check(label, expected, fn):
+    before = {t: reads(t) for t in ("replica", "primary")}
+    fn()
+    got = next((t for t in before if reads(t) > before[t]), None)
+    ok = got == expected
+    print(f"{'✅' if ok else '❌'} {label:<40} → {got} (forventet {expected})")
+    return ok
+
+
+def main():
+    if not db.DATABASE_READ_URL:
+        print("❌ DATABASE_READ_URL er ikke sat")
+        return 1
+
+    db.init_db()
+    results = []
+
+    db.route_reads(replica=True)
+    results.append(check("læse-request", "replica", db.load_lager))
+
+    db._note_write()
+    results.append(check("lige efter egen skrivning (sticky)", "primary", db.load_lager))
+
+    # næste request i en anden worker – tidspunktet kommer fra cookien
+    db.route_reads(replica=True, last_write=db.last_write_at())
+    results.append(check("ny request, skrivning i cookien", "primary", db.load_lager))
+
+    time.sleep(db.READ_STICKY_SECONDS + 0.1)
+    results.append(check("efter sticky-vinduet", "replica", db.load_lager))
+
+    with db.primary_reads():
+        results.append(check("primary_reads()", "primary", db.load_lager))
+
+    db.route_reads(replica=False)
+    results.append(check("skrive-request", "primary", db.load_lager))
+
+    print(f"🐢 replica lag: {metrics.REPLICA_LAG.get():.2f}s")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Kontrol af rolle-revalideringen mod en lokal Discord-stub.
+
+    python bench/role_sync_check.py
+
+Stubben svarer på /guilds/<id>/roles og /guilds/<id>/members (pagineret),
+giver én 429 og sætter X-RateLimit-Remaining: 0 på hver anden side, så
+både retry og pause før næste kald bliver ramt. Brugerne ligger
+i MemoryDB – intet skrives til Postgres eller Discord.
+"""
+import os
+import sys
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DISCORD_USER_ROLE", "Kunde")
+os.environ.setdefault("DISCORD_ADMIN_ROLE", "Admin")
+
+import discord_roles
+from memdb import MemoryDB
+
+GUILD = "42"
+ROLES = [{"id": "1", "name": "Kunde"}, {"id": "2", "name": "Admin"}, {"id": "3", "name": "Andet"}]
+N_MEMBERS = 2500
+
+
+class DiscordStub(BaseHTTPRequestHandler):
+    members = []
+    calls = []
+    throttle_once = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        DiscordStub.calls.append(url.path)
+
+        if self.headers.get("Authorization") != "Bot stub-token":
+            return self._send(401, {"message": "401: Unauthorized"})
+
+        if url.path == f"/guilds/{GUILD}/roles":
+            return self._send(200, ROLES)
+
+        if url.path == f"/guilds/{GUILD}/members":
+            if DiscordStub.throttle_once:
+                DiscordStub.throttle_once = False
+                return self._send(429, {"message": "You are being rate limited.", "retry_after": 0.2, "global": False})
+
+            q = parse_qs(url.query)
+            limit = int(q.get("limit", ["1"])[0])
+            after = int(q.get("after", ["0"])[0])
+            page = [m for m in self.members if int(m["user"]["id"]) > after][:limit]
+            page_no = len([c for c in DiscordStub.calls if c.endswith("/members")])
+            headers = {
+                "X-RateLimit-Remaining": "0" if page_no % 2 else "5",
+                "X-RateLimit-Reset-After": "0.1"
+            }
+            return self._send(200, page, headers)
+
+        self._send(404, {"message": "404: Not Found"})
+
+
+def main():
+    # medlem i → rolle efter i % 4: 0/1 Kunde, 2 Admin, 3 kun "Andet"
+    DiscordStub.members = [
+        {"user": {"id": str(1000 + i)}, "roles": [["1"], ["1"], ["2"], ["3"]][i % 4]}
+        for i in range(N_MEMBERS)
+    ]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DiscordStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    now = datetime.now()
+    recent = now.strftime(discord_roles.TIME_FORMAT)
+    old = (now - timedelta(days=90)).strftime(discord_roles.TIME_FORMAT)
+    users = {
+        "1000": {"name": "kunde", "role": "user", "last_seen": recent},
+        "1002": {"name": "admin", "role": "admin", "last_seen": recent},
+        "1003": {"name": "mistet-rolle", "role": "user", "last_seen": recent},
+        "1007": {"name": "inaktiv", "role": "user", "last_seen": old},
+        "9999": {"name": "forladt-serveren", "role": "user", "last_seen": recent},
+    }
+    mem = MemoryDB({"access": {"users": users, "blocked": []}, "audit": []})
+    mem.install(discord_roles)
+
+    waits = []
+    client = discord_roles.DiscordClient(token="stub-token", base=base, sleep=lambda s: waits.append(s))
+    revoked = discord_roles.revalidate(client, guild_id=GUILD)
+
+    access = mem.load_access()["users"]
+    pages = DiscordStub.calls.count(f"/guilds/{GUILD}/members")
+    results = [
+        ("tilbagekaldt: mistet rolle + forladt serveren", sorted(revoked) == ["1003", "9999"]),
+        ("aktive med rolle beholder adgang", not access["1000"].get("revoked") and not access["1002"].get("revoked")),
+        ("inaktive springes over", "roles_checked" not in access["1007"]),
+        ("roller gemt i access", access["1002"]["discord_roles"] == ["Admin"]),
+        ("alle sider hentet (inkl. 429-retry)", pages == N_MEMBERS // discord_roles.MEMBERS_PAGE + 1 + 1),
+        ("ventet på 429 og tom bucket", 0.2 in waits and len(waits) >= 2),
+        ("audit pr. tilbagekaldelse", len(mem.load_audit()) == 2),
+    ]
+    for label, ok in results:
+        print(f"{'✅' if ok else '❌'} {label}")
+    print(f"📡 {len(DiscordStub.calls)} Discord-kald, ventet {sum(waits):.2f}s på rate limits")
+
+    server.shutdown()
+    return 0 if all(ok for _, ok in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Benchmark-suite for ordre- og lager-hot paths.
+
+Kører mod MemoryDB (ingen Postgres nødvendig) og skriver resultater som
+JSON, så to kørsler kan sammenlignes:
+
+    python bench/run.py --out bench/results/base.json
+    python bench/run.py --out bench/results/new.json --compare bench/results/base.json
+    python bench/run.py --sessions 10,100 --orders 100,1000   # mindre grid
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchmarken måler hot paths – ikke rate limiteren
+os.environ.setdefault("RATE_LIMIT", "off")
+
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import db
+import web
+import bot
+
+MAX_TOTAL_ORDERS = 1_000_000
+
+
+# =====================
+# HJÆLPERE
+# =====================
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.mean(times), 4)
+    }
+
+
+class FakeChannel:
+    def __init__(self, id):
+        self.id = id
+        self.sent = []
+
+    async def send(self, text, delete_after=None):
+        self.sent.append(text)
+
+
+class FakeAuthor:
+    bot = False
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, content, author, channel):
+        self.content = content
+        self.author = author
+        self.channel = channel
+
+
+def client_for(uid, name):
+    client = web.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"id": uid, "name": name, "avatar": None}
+    return client
+
+
+# =====================
+# SCENARIE
+# =====================
+def run_case(n_sessions, n_orders, repeat):
+    dataset = make_dataset(n_sessions, n_orders)
+    memdb = MemoryDB(dataset)
+    # kun db-funktionerne byttes ud – bot'ens og web's egen kode kører som i produktion
+    memdb.install(db, web, bot)
+
+    current = dataset["sessions"]["current"]
+    orders = dataset["sessions"]["sessions"][current]["orders"]
+    prices = dataset["prices"]
+    admin_uid = next(uid for uid, u in dataset["access"]["users"].items() if u["role"] == "admin")
+    buyer = orders[0]
+
+    client = client_for(admin_uid, "user0")
+
+    def calc_totals():
+        for o in orders:
+            db.calc_total(o["items"], prices)
+
+    def lager_status():
+        with web.app.test_request_context():
+            web.get_lager_status_for_session(current)
+
+    def get(url):
+        def fn():
+            r = client.get(url)
+            assert r.status_code == 200, (url, r.status_code)
+        return fn
+
+    channel = FakeChannel(bot.BESTIL_CHANNEL_ID)
+    # en ubetalt ordre – ellers svarer bot'en før den gemmer noget
+    customer = next(o for o in orders if not o.get("paid") and not o.get("delivered"))
+    author = FakeAuthor(int(customer["user_id"]), customer["user"])
+    loop = asyncio.new_event_loop()
+
+    def on_message():
+        loop.run_until_complete(bot.on_message(FakeMessage("1 SNS", author, channel)))
+        assert channel.sent[-1].startswith("✅"), channel.sent[-1]
+
+    benches = {
+        "calc_total": calc_totals,
+        "get_lager_status_for_session": lager_status,
+        "session_data_hash": get(f"/session_data/{current}"),
+        "index": get("/"),
+        "user_history": get(f"/admin/user_history?uid={buyer['user_id']}"),
+        "bot_on_message": on_message
+    }
+
+    results = []
+    for name, fn in benches.items():
+        fn()  # opvarmning
+        r = measure(fn, repeat)
+        r.update({"bench": name, "sessions": n_sessions, "orders": n_orders})
+        results.append(r)
+        print(f"  {name:<30} median {r['median_ms']:>10.3f} ms  (min {r['min_ms']:.3f}, n={repeat})")
+
+    loop.close()
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    key = lambda r: (r["bench"], r["sessions"], r["orders"])
+    old = {key(r): r for r in baseline["results"]}
+
+    regressions = 0
+    print(f"\n📈 Sammenligning med {baseline_path}")
+    for r in results:
+        o = old.get(key(r))
+        if not o or not o["median_ms"]:
+            continue
+        ratio = r["median_ms"] / o["median_ms"]
+        flag = "⚠️" if ratio > threshold else "  "
+        regressions += ratio > threshold
+        print(f"{flag} {r['bench']:<30} {r['sessions']:>4}×{r['orders']:<6} "
+              f"{o['median_ms']:>10.3f} → {r['median_ms']:>10.3f} ms  ({ratio:.2f}x)")
+    return regressions
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="10,100,500")
+    parser.add_argument("--orders", default="100,1000,10000")
+    parser.add_argument("--max-total", type=int, default=MAX_TOTAL_ORDERS,
+                        help="spring kombinationer over med flere ordrer i alt")
+    parser.add_argument("--repeat", type=int, default=0, help="0 = automatisk")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    results = []
+    for n_sessions in [int(x) for x in args.sessions.split(",")]:
+        for n_orders in [int(x) for x in args.orders.split(",")]:
+            total = n_sessions * n_orders
+            if total > args.max_total:
+                print(f"⏭️  {n_sessions} sessions × {n_orders} ordrer (> --max-total)")
+                continue
+            repeat = args.repeat or max(3, min(30, 200_000 // total))
+            print(f"📊 {n_sessions} sessions × {n_orders} ordrer")
+            results.extend(run_case(n_sessions, n_orders, repeat))
+
+    report = {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "git": git_rev(),
+            "python": platform.python_version(),
+            "machine": platform.machine()
+        },
+        "results": results
+    }
+
+    out = args.out or os.path.join(
+        ROOT, "bench", "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Resultater skrevet til {out}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
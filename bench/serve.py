@@ -0,0 +1,31 @@
+"""web.app oven på MemoryDB – til throughput-målinger uden Postgres.
+
+    python bench/serve.py                                  # som den gamle procfile
+    gunicorn -k eventlet -w 4 --chdir bench serve:app      # flere workers
+
+BENCH_SESSIONS / BENCH_ORDERS styrer datasættet og BENCH_DB_LATENCY_MS
+den simulerede round trip pr. load/save.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datasets import make_dataset
+from memdb import MemoryDB
+
+import web
+import analytics
+
+SESSIONS = int(os.getenv("BENCH_SESSIONS", "5"))
+ORDERS = int(os.getenv("BENCH_ORDERS", "300"))
+LATENCY_MS = float(os.getenv("BENCH_DB_LATENCY_MS", "2"))
+
+MemoryDB(make_dataset(SESSIONS, ORDERS), latency_ms=LATENCY_MS).install(web, analytics)
+
+app = web.app
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    web.socketio.run(app, host="127.0.0.1", port=port, debug=True, use_reloader=False)
@@ -0,0 +1,96 @@
+"""Genberegning af user_stats mod et datasæt med kendte, korrekte stats.
+
+    python bench/stats_rebuild_check.py --sessions 50 --orders 200
+
+Stats i datasættet (talt fra betalte ordrer) forskydes som i drift:
+dobbelt-bogførte ordrer, manglende brugere og en bruger uden ordrer.
+Undervejs i genberegningen betales en ordre "live" (som mark_paid), og
+resultatet skal alligevel ende med de korrekte tal.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import serializer
+from datasets import make_dataset
+from memdb import MemoryDB
+from orders import op
+
+import stats_rebuild
+
+
+def drift(stats, rng):
+    stats = serializer.loads(serializer.dumps(stats))
+    uids = sorted(stats)
+    for uid in rng.sample(uids, len(uids) // 5):
+        stats[uid]["total_spent"] *= 2
+        stats[uid]["total_items"] *= 2
+        stats[uid]["items"] = {k: v * 2 for k, v in stats[uid]["items"].items()}
+    for uid in rng.sample(uids, len(uids) // 10):
+        stats.pop(uid, None)
+    stats["999"] = {"total_spent": 12345, "total_items": 3, "items": {"SNS": 3}}
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--orders", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(2)
+    dataset = make_dataset(args.sessions, args.orders)
+    truth = dataset["user_stats"]
+    dataset["user_stats"] = drift(truth, rng)
+
+    mem = MemoryDB(dataset)
+    mem.install(stats_rebuild)
+
+    # én ikke-betalt ordre betales midt i genberegningen
+    current = dataset["sessions"]["current"]
+    live = next(o for o in dataset["sessions"]["sessions"][current]["orders"] if not o["paid"])
+    snapshot = mem.stats_snapshot
+
+    def pay_midway(orders):
+        for n, row in enumerate(orders):
+            if n == 10:
+                mem.save_session_ops([op("set_order", session=current, order_id=live["id"], fields={"paid": True})])
+            yield row
+
+    @contextmanager
+    def snapshot_with_live_payment():
+        with snapshot() as (before, orders):
+            yield before, pay_midway(orders)
+
+    dry = stats_rebuild.rebuild(dry_run=True)
+    assert mem.load_user_stats() == dataset["user_stats"]
+    print(f"🔍 dry-run: {dry['changed']} brugere ville blive ændret, intet skrevet")
+
+    # den live-betalte ordre skal med i facit
+    st = truth.setdefault(live["user_id"], {"total_spent": 0, "total_items": 0, "items": {}})
+    st["total_spent"] += live["total"]
+    for item, amount in live["items"].items():
+        if amount > 0:
+            st["items"][item] = st["items"].get(item, 0) + amount
+            st["total_items"] += amount
+
+    stats_rebuild.stats_snapshot = snapshot_with_live_payment
+    started = time.perf_counter()
+    report = stats_rebuild.rebuild(batch_size=25)
+    print(f"  {report['orders']} ordrer på {time.perf_counter() - started:.2f}s")
+
+    got = mem.load_user_stats()
+    got = {uid: s for uid, s in got.items() if s["total_spent"] or s["total_items"]}
+    assert got == truth, "stats afviger fra facit"
+    assert stats_rebuild.last_report()["status"] == "done"
+    print("✅ stats matcher facit efter genberegning")
+
+
+if __name__ == "__main__":
+    main()
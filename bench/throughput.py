@@ -0,0 +1,203 @@
+"""Throughput: én debug-proces (python web.py) mod gunicorn med eventlet-workers.
+
+    python bench/throughput.py
+    python bench/throughput.py --workers 2,4 --clients 32 --seconds 15
+
+Starter bench/serve.py (MemoryDB + simuleret DB-latency) i hver opsætning,
+kører den samme GET-blanding fra --clients tråde med keep-alive og skriver
+requests/s samt p50/p95. gunicorn-kørslerne bruger den lokale bus-broker
+(MESSAGE_QUEUE=local://...), så fan-out-laget er med i målingen.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import statistics
+import subprocess
+import http.client
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, BENCH)
+
+from datasets import make_dataset
+
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def session_cookie(uid):
+    app = Flask("bench")
+    app.secret_key = SECRET
+    signer = SecureCookieSessionInterface().get_signing_serializer(app)
+    return "session=" + signer.dumps({"user": {"id": uid, "name": "bench", "avatar": None}})
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def load(port, paths, cookie, clients, seconds):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(i):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        own = []
+        n = i
+        while time.time() < stop_at:
+            path = paths[n % len(paths)]
+            n += 1
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"Cookie": cookie})
+                r = conn.getresponse()
+                r.read()
+                if r.status != 200:
+                    with lock:
+                        errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0] * 19
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": q[9] * 1000,
+        "p95_ms": q[18] * 1000,
+        "errors": errors[0]
+    }
+
+
+def run_setup(label, cmd, env, port, args, paths, cookie):
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for(port):
+            print(f"❌ {label}: serveren startede ikke")
+            return None
+        # varm op (imports, første template-render i hver worker)
+        load(port, paths, cookie, args.clients, 1)
+        res = load(port, paths, cookie, args.clients, args.seconds)
+        print(
+            f"  {label:<24} {res['rps']:8.1f} req/s   p50 {res['p50_ms']:7.1f} ms   "
+            f"p95 {res['p95_ms']:7.1f} ms   fejl {res['errors']}"
+        )
+        return res
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="2,4")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=2)
+    args = parser.parse_args(argv)
+
+    data = make_dataset(args.sessions, args.orders)
+    current = data["sessions"]["current"]
+    uid = next(iter(data["access"]["users"]))
+    paths = ["/", f"/session/{current}", f"/session_data/{current}"]
+    cookie = session_cookie(uid)
+
+    base_env = dict(
+        os.environ,
+        FLASK_SECRET=SECRET,
+        BENCH_SESSIONS=str(args.sessions),
+        BENCH_ORDERS=str(args.orders),
+        BENCH_DB_LATENCY_MS=str(args.latency_ms),
+        JOURNAL_DIR=os.path.join(BENCH, "results", "journal"),
+        ROLE_SYNC_SECONDS="0",
+        RATE_LIMIT="off"
+    )
+    print(f"📊 {args.sessions} sessions × {args.orders} ordrer, {args.clients} klienter, "
+          f"{args.latency_ms} ms DB-latency, {args.seconds}s pr. opsætning")
+
+    results = {}
+    port = free_port()
+    results["single"] = run_setup(
+        "python web.py (debug)",
+        [sys.executable, "bench/serve.py"],
+        dict(base_env, PORT=str(port)),
+        port, args, paths, cookie
+    )
+
+    broker_port = free_port()
+    broker = subprocess.Popen(
+        [sys.executable, "bus.py"], cwd=ROOT,
+        env=dict(base_env, MESSAGE_QUEUE=f"local://127.0.0.1:{broker_port}"),
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        wait_for(broker_port)
+        for w in [int(x) for x in args.workers.split(",")]:
+            port = free_port()
+            results[f"gunicorn-{w}"] = run_setup(
+                f"gunicorn eventlet ×{w}",
+                [
+                    sys.executable, "-m", "gunicorn",
+                    "-k", "eventlet", "-w", str(w),
+                    "-b", f"127.0.0.1:{port}",
+                    "--chdir", "bench", "serve:app"
+                ],
+                dict(
+                    base_env,
+                    WEB_CONCURRENCY=str(w),
+                    MESSAGE_QUEUE=f"local://127.0.0.1:{broker_port}"
+                ),
+                port, args, paths, cookie
+            )
+    finally:
+        broker.terminate()
+
+    single = results.get("single")
+    if single:
+        for name, res in results.items():
+            if res and name != "single":
+                print(f"🚀 {name}: {res['rps'] / single['rps']:.1f}× single-proces")
+
+
+if __name__ == "__main__":
+    main()
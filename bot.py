@@ -1,97 +1,26 @@
 import os
 import time
-import json
 import discord
+import metrics
 from discord.ext import commands
 from datetime import datetime
-from db import init_db, get_conn
+from journal import journal
+from orders import op, used_items
 from db import (
     init_db,
     load_sessions,
-    save_sessions,
     load_lager,
     load_prices,
-    load_user_stats,
-    save_user_stats,
-    load_access,
-    save_access,
-    audit_log,
-    new_order,
-    calc_total
+    save_session_ops,
+    route_reads,
+    DatabaseUnavailable,
+    TIME_FORMAT
 )
 
 
-init_db()
-
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 BESTIL_CHANNEL_ID = int(os.getenv("BESTIL_CHANNEL_ID", "0"))
 
-# =====================
-# DB HELPERS
-# =====================
-def load_sessions():
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            c.execute("SELECT value FROM meta WHERE key='current'")
-            row = c.fetchone()
-            current = row[0] if row else None
-
-            sessions = {}
-            c.execute("SELECT name, open, data FROM sessions")
-            for name, open_, data in c.fetchall():
-                data["open"] = open_
-                data.setdefault("orders", [])
-                data.setdefault("locked_users", [])
-                sessions[name] = data
-
-            return {"current": current, "sessions": sessions}
-
-def save_sessions(data):
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            c.execute("DELETE FROM sessions")
-            for name, s in data["sessions"].items():
-                c.execute(
-                    "INSERT INTO sessions (name, open, data) VALUES (%s, %s, %s)",
-                    (name, s.get("open", False), json.dumps(s))
-                )
-
-            c.execute("""
-                INSERT INTO meta (key, value)
-                VALUES ('current', %s)
-                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
-            """, (json.dumps(data.get("current")),))
-        conn.commit()
-
-def load_prices():
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            c.execute("SELECT item, price FROM prices")
-            return dict(c.fetchall())
-
-def load_lager():
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            c.execute("SELECT item, amount FROM lager")
-            return dict(c.fetchall())
-
-def load_user_stats():
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            c.execute("SELECT user_id, data FROM user_stats")
-            return {uid: data for uid, data in c.fetchall()}
-
-def save_user_stats(stats):
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            for uid, data in stats.items():
-                c.execute("""
-                    INSERT INTO user_stats (user_id, data)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data
-                """, (uid, json.dumps(data)))
-        conn.commit()
-
 # =====================
 # DISCORD BOT
 # =====================
@@ -105,6 +34,16 @@ async def on_ready():
 
 @bot.event
 async def on_message(message):
+    with metrics.request_scope("bot:on_message", "MESSAGE"):
+        try:
+            await handle_message(message)
+        except DatabaseUnavailable:
+            await message.channel.send(
+                "⚠️ Databasen er nede lige nu – prøv igen om lidt.",
+                delete_after=5
+            )
+
+async def handle_message(message):
     if message.author.bot or message.channel.id != BESTIL_CHANNEL_ID:
         return
 
@@ -112,6 +51,9 @@ async def on_message(message):
     if not content:
         return
 
+    # bot'en læser, retter og gemmer → altid primær
+    route_reads(replica=False)
+
     data = load_sessions()
     prices = load_prices()
 
@@ -120,11 +62,10 @@ async def on_message(message):
         await message.channel.send("🔴 Ingen aktiv bestilling", delete_after=5)
         return
 
-    session_data = data["sessions"][current]
-    if not session_data["open"]:
+    session_data = data["sessions"].get(current)
+    if not session_data or not session_data.get("open"):
         await message.channel.send("🔒 Bestillingen er lukket", delete_after=5)
         return
-    session_data = data["sessions"][current]
 
 # 🔒 LOCK CHECK
     if str(message.author.id) in session_data.get("locked_users", []):
@@ -134,63 +75,67 @@ async def on_message(message):
         )
         return
 
-    orders = session_data["orders"]
+    orders = session_data.get("orders", [])
     user = str(message.author)
 
     order = next((o for o in orders if o["user"] == user), None)
-    if not order:
+    is_new = order is None
+    if is_new:
         order = {
             "id": str(time.time()),
             "user": user,
             "user_id": str(message.author.id),
             "items": {k: 0 for k in prices},
             "total": 0,
-            "time": datetime.now().strftime("%d-%m-%Y %H:%M")
+            "time": datetime.now().strftime(TIME_FORMAT),
+            "paid": False,
+            "delivered": False
         }
-        orders.append(order)
+
+    # som edit_own_order: betalte/leverede ordrer rettes ikke længere
+    if order.get("paid") or order.get("delivered"):
+        await message.channel.send("💰 Din ordre er betalt og kan ikke ændres", delete_after=5)
+        return
 
     parts = content.split()
     amount = int(parts[0]) if len(parts) > 1 and parts[0].isdigit() else 1
-    item = parts[-1]
+    # beskeden er gjort lowercase – varerne hedder fx "SNS" og "Pump"
+    item = {k.lower(): k for k in prices}.get(parts[-1], parts[-1])
 
     lager = load_lager()
-    used = {k: 0 for k in lager}
-    for o in orders:
-        for i, a in o["items"].items():
-            used[i] += a
+    used = used_items(session_data)
 
     if item not in prices:
         await message.channel.send("❌ Ukendt vare", delete_after=5)
         return
 
-    if amount > max(0, lager[item] - used[item]):
+    # antallet sættes (lægges ikke til) – egen ordre tæller ikke med, som i edit_own_order
+    used_by_others = used.get(item, 0) - order["items"].get(item, 0)
+    if amount > max(0, lager.get(item, 0) - used_by_others):
         await message.channel.send("⚠️ Ikke nok på lager", delete_after=5)
         return
 
     order["items"][item] = amount
-    order["total"] = sum(order["items"][i] * prices[i] for i in order["items"])
-    save_sessions(data)
-
-    stats = load_user_stats()
-    uid = order["user_id"]
-
-    stats.setdefault(uid, {
-        "total_spent": 0,
-        "total_items": 0,
-        "items": {},
-        "orders": {}
-    })
+    order["total"] = sum(order["items"][i] * prices.get(i, 0) for i in order["items"])
 
-    stats[uid]["total_spent"] += order["total"]
-    stats[uid]["total_items"] += amount
-    stats[uid]["items"][item] = stats[uid]["items"].get(item, 0) + amount
-    stats[uid]["orders"][order["id"]] = order
+    # samme vej som web.py: journal → advisory lock → nyeste dokument
+    if is_new:
+        save_session_ops([op("add_order", session=current, order=order)])
+    else:
+        save_session_ops([op("set_order", session=current, order_id=order["id"], fields={
+            "items": order["items"],
+            "total": order["total"]
+        })])
 
-    save_user_stats(stats)
+    # 📊 stats bogføres når ordren markeres betalt (web.mark_paid)
 
     await message.channel.send(
         f"✅ **{item} sat til {amount} stk** ({order['total']} kr)",
         delete_after=3
     )
 
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    init_db()
+    # ændringer der ikke nåede Postgres før sidste stop skrives nu
+    journal.open()
+    bot.run(DISCORD_TOKEN)
@@ -0,0 +1,104 @@
+import time
+import threading
+
+import metrics
+
+# =====================
+# CIRCUIT BREAKER
+# =====================
+# closed    → alt kører normalt, fejl tælles
+# open      → kald afvises straks; en baggrundstråd prober genopretning
+# half_open → proben lykkedes; kald slippes igennem, første fejl åbner igen
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.Gauge(
+    "bestilling_breaker_state",
+    "Circuit breaker state (0=closed, 1=half_open, 2=open)",
+    ("name",)
+)
+BREAKER_TRANSITIONS = metrics.Counter(
+    "bestilling_breaker_transitions_total",
+    "Circuit breaker state transitions",
+    ("name", "from_state", "to_state")
+)
+BREAKER_REJECTED = metrics.Counter(
+    "bestilling_breaker_rejected_total",
+    "Calls rejected while the breaker was open",
+    ("name",)
+)
+
+
+class CircuitBreaker:
+    def __init__(self, name, probe, failure_threshold=5, probe_interval=2.0):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+        self._prober = None
+        BREAKER_STATE.set(0, name=name)
+
+    def _transition(self, new):
+        # kaldes med self._lock holdt
+        old, self.state = self.state, new
+        if old == new:
+            return
+        BREAKER_TRANSITIONS.inc(name=self.name, from_state=old, to_state=new)
+        BREAKER_STATE.set(_STATE_VALUE[new], name=self.name)
+        print(f"🔌 {self.name} breaker: {old} → {new}")
+
+    def allow(self):
+        if self.state != OPEN:
+            return True
+        BREAKER_REJECTED.inc(name=self.name)
+        return False
+
+    def record_success(self):
+        if self.state == CLOSED and self.failures == 0:
+            return
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+                self._start_prober()
+
+    def retry_after(self):
+        return max(1, int(round(self.probe_interval)))
+
+    # ---- baggrundsprobe ----
+    def _start_prober(self):
+        if self._prober and self._prober.is_alive():
+            return
+        self._prober = threading.Thread(
+            target=self._probe_loop, name=f"{self.name}-breaker-probe", daemon=True
+        )
+        self._prober.start()
+
+    def _probe_loop(self):
+        while self.state == OPEN:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except Exception as e:
+                print(f"🔌 {self.name} probe fejlede:", e)
+                continue
+            with self._lock:
+                if self.state == OPEN:
+                    self._transition(HALF_OPEN)
+            return
@@ -0,0 +1,269 @@
+import os
+import time
+import uuid
+import queue
+import select
+import socket
+import threading
+from urllib.parse import urlparse
+
+import socketio
+
+import metrics
+import serializer
+
+# =====================
+# BESKED-BUS MELLEM WORKERS
+# =====================
+# Med flere gunicorn-workers har hver proces sine egne Socket.IO-klienter
+# og sine egne caches. Bussen sender beskeder til alle workers:
+#
+#   MESSAGE_QUEUE=postgres                 → LISTEN/NOTIFY på DATABASE_URL
+#   MESSAGE_QUEUE=local://127.0.0.1:5600   → lokal broker (python bus.py)
+#   (tom)                                  → én proces, alt leveres lokalt
+#
+#   bus.subscribe("lager", lambda data: cache.clear())
+#   bus.publish("lager", {"item": "SNS"})
+#
+# Emnet "socketio" bruges af SocketIOBusManager, så socketio.emit() når
+# klienter på alle workers. Hver worker har én lytte-forbindelse.
+
+MESSAGE_QUEUE = os.getenv("MESSAGE_QUEUE", "")
+BUS_CHANNEL = os.getenv("BUS_CHANNEL", "bestilling")
+# NOTIFY-payloads må højst være 8000 bytes
+PG_MAX_PAYLOAD = 7900
+
+BUS_MESSAGES = metrics.Counter(
+    "bestilling_bus_messages_total",
+    "Bus messages by topic and direction",
+    ("topic", "direction")
+)
+BUS_RECONNECTS = metrics.Counter(
+    "bestilling_bus_reconnects_total",
+    "Bus listener reconnects"
+)
+
+
+# =====================
+# TRANSPORTER
+# =====================
+class PostgresTransport:
+    def __init__(self, dsn, channel=BUS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._pub = None
+        self._pub_lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.dsn, sslmode="require", connect_timeout=5)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, payload):
+        if len(payload.encode()) > PG_MAX_PAYLOAD:
+            raise ValueError(f"bus-besked på {len(payload)} tegn er for stor til NOTIFY")
+        with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None or self._pub.closed:
+                        self._pub = self._connect()
+                    self._pub.cursor().execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    return
+                except Exception:
+                    self._pub = None
+                    if attempt:
+                        raise
+
+    def listen(self):
+        while True:
+            try:
+                conn = self._connect()
+                conn.cursor().execute(f'LISTEN "{self.channel}"')
+                while True:
+                    # select() er grønt under eventlet (monkey-patched)
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        conn.cursor().execute("SELECT 1")   # keepalive
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        yield conn.notifies.pop(0).payload
+            except Exception as e:
+                print("📡 bus: LISTEN-forbindelse tabt – forbinder igen:", e)
+                BUS_RECONNECTS.inc()
+                time.sleep(1)
+
+
+class LocalTransport:
+    """Klient til den lokale broker nedenfor (udvikling / benchmarks)."""
+
+    def __init__(self, host, port):
+        self.addr = (host, port)
+        self._pub = None
+        self._pub_lock = threading.Lock()
+
+    def publish(self, payload):
+        with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = socket.create_connection(self.addr, timeout=5)
+                    self._pub.sendall(payload.encode() + b"\n")
+                    return
+                except OSError:
+                    self._pub = None
+                    if attempt:
+                        raise
+
+    def listen(self):
+        while True:
+            try:
+                with socket.create_connection(self.addr, timeout=None) as s:
+                    for line in s.makefile("rb"):
+                        yield line.decode().rstrip("\n")
+            except OSError as e:
+                print("📡 bus: broker utilgængelig – forbinder igen:", e)
+            BUS_RECONNECTS.inc()
+            time.sleep(1)
+
+
+def serve_local_broker(host="127.0.0.1", port=5600):
+    """Send hver linje videre til alle forbundne klienter (inkl. afsenderen)."""
+    clients = set()
+    lock = threading.Lock()
+
+    def handle(conn):
+        with lock:
+            clients.add(conn)
+        try:
+            for line in conn.makefile("rb"):
+                with lock:
+                    targets = list(clients)
+                for c in targets:
+                    try:
+                        c.sendall(line)
+                    except OSError:
+                        with lock:
+                            clients.discard(c)
+        finally:
+            with lock:
+                clients.discard(conn)
+            conn.close()
+
+    server = socket.create_server((host, port), reuse_port=False)
+    print(f"📡 Lokal bus-broker på {host}:{port}")
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def transport_from_url(url=MESSAGE_QUEUE):
+    if not url:
+        return None
+    if url == "postgres":
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            raise RuntimeError("MESSAGE_QUEUE=postgres kræver DATABASE_URL")
+        return PostgresTransport(dsn)
+    parsed = urlparse(url)
+    if parsed.scheme == "local":
+        return LocalTransport(parsed.hostname or "127.0.0.1", parsed.port or 5600)
+    raise ValueError(f"ukendt MESSAGE_QUEUE {url!r}")
+
+
+# =====================
+# BUS
+# =====================
+class Bus:
+    def __init__(self, transport=None):
+        self.transport = transport
+        self.origin = uuid.uuid4().hex
+        self.handlers = {}           # emne → [fn(data)]
+        self.socketio_inbox = queue.Queue()
+        self._listener = None
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return self.transport is not None
+
+    def subscribe(self, topic, fn):
+        self.handlers.setdefault(topic, []).append(fn)
+
+    def publish(self, topic, data=None):
+        # egen worker får beskeden med det samme – de andre via transporten
+        self._dispatch(topic, data)
+        if self.shared:
+            self._send(topic, data)
+
+    def _send(self, topic, data):
+        BUS_MESSAGES.inc(topic=topic, direction="out")
+        self.transport.publish(serializer.dumps({"topic": topic, "origin": self.origin, "data": data}))
+
+    def _dispatch(self, topic, data):
+        for fn in self.handlers.get(topic, ()):
+            try:
+                fn(data)
+            except Exception as e:
+                print(f"📡 bus-handler for {topic} fejlede:", e)
+
+    def start(self):
+        if not self.shared or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="bus-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        for raw in self.transport.listen():
+            try:
+                msg = serializer.loads(raw)
+            except ValueError:
+                continue
+            topic = msg.get("topic")
+            BUS_MESSAGES.inc(topic=topic, direction="in")
+            if topic == "socketio":
+                # SocketIOBusManager springer selv egne beskeder over (host_id)
+                self.socketio_inbox.put(msg["data"])
+            elif msg.get("origin") != self.origin:
+                self._dispatch(topic, msg.get("data"))
+
+
+class SocketIOBusManager(socketio.PubSubManager):
+    """python-socketio client manager oven på Bus (emnet "socketio")."""
+    name = "bestilling-bus"
+
+    def __init__(self, bus, **kwargs):
+        super().__init__(channel="socketio", **kwargs)
+        self.bus = bus
+
+    def _publish(self, data):
+        self.bus._send("socketio", data)
+
+    def _listen(self):
+        self.bus.start()
+        while True:
+            yield self.bus.socketio_inbox.get()
+
+
+bus = Bus(transport_from_url())
+
+
+def publish(topic, data=None):
+    bus.publish(topic, data)
+
+
+def subscribe(topic, fn):
+    bus.subscribe(topic, fn)
+
+
+def socketio_manager():
+    """Client manager til SocketIO(...) – None når der kun er én proces."""
+    return SocketIOBusManager(bus) if bus.shared else None
+
+
+if __name__ == "__main__":
+    url = urlparse(MESSAGE_QUEUE or "local://127.0.0.1:5600")
+    serve_local_broker(url.hostname or "127.0.0.1", url.port or 5600)
@@ -1,170 +1,698 @@
+import io
 import os
-import json
+import gzip
 import psycopg2
 import time
-from datetime import datetime
-from psycopg2.pool import SimpleConnectionPool
+import threading
+import psycopg2.errors
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from psycopg2.pool import SimpleConnectionPool, PoolError
+from psycopg2.extras import execute_values
+
+import metrics
+import serializer
+from breaker import CircuitBreaker
+from journal import journal, JOURNAL_ASYNC
+from orders import apply_ops
+from jsonstream import Reader, iter_members
+from tasks import task, enqueue
 
 # =====================
 # CONFIG
 # =====================
 DATABASE_URL = os.getenv("DATABASE_URL")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+TIME_FORMAT = "%d-%m-%Y %H:%M"
+
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_STICKY_SECONDS = float(os.getenv("READ_STICKY_SECONDS", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_SECONDS = 10
+REPLICA_RETRY_SECONDS = 30
+# alle forbindelser i brug → vent så længe på en ledig før 503
+DB_POOL_WAIT_SECONDS = float(os.getenv("DB_POOL_WAIT_SECONDS", "5"))
 
 pool = None
+read_pool = None
+_pool_lock = threading.Lock()
 
-def create_pool():
-    global pool
+# JSONB → Python via serializer (orjson hvis installeret)
+serializer.register_psycopg2()
+
+def _new_pool(dsn, label):
     try:
-        pool = SimpleConnectionPool(
+        p = SimpleConnectionPool(
             minconn=1,
             maxconn=10,
-            dsn=DATABASE_URL,
+            dsn=dsn,
             sslmode="require",
             connect_timeout=5
         )
-        print("✅ DB pool oprettet")
+        print(f"✅ DB pool oprettet ({label})")
+        return p
     except Exception as e:
-        print("❌ Kunne ikke oprette DB pool:", e)
-        pool = None
+        print(f"❌ Kunne ikke oprette DB pool ({label}):", e)
+        return None
+
+
+def create_pool():
+    global pool
+    pool = _new_pool(DATABASE_URL, "primær")
+
+
+def create_read_pool():
+    global read_pool
+    read_pool = _new_pool(DATABASE_READ_URL, "replica")
 
-create_pool()
+
+def make_green():
+    """Lad psycopg2 vente via eventlet-hubben i stedet for at blokere workeren.
+
+    Kaldes af gunicorn.conf.py i hver eventlet-worker (samme idé som psycogreen).
+    """
+    from psycopg2 import extensions
+    from eventlet.hubs import trampoline
+
+    def wait(conn, timeout=-1):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                trampoline(conn.fileno(), read=True)
+            elif state == extensions.POLL_WRITE:
+                trampoline(conn.fileno(), write=True)
+            else:
+                raise psycopg2.OperationalError(f"uventet poll-state {state}")
+
+    extensions.set_wait_callback(wait)
+
+
+def _ensure_pool():
+    # poolen oprettes først ved første get_conn() (lazy)
+    if pool is None:
+        with _pool_lock:
+            if pool is None:
+                create_pool()
+
+# =====================
+# READ-REPLICA ROUTING
+# =====================
+# load_* læser fra DATABASE_READ_URL når den er sat – undtagen:
+#  - requests der skriver (route_reads(replica=False) / primary_reads())
+#  - kort efter brugerens egen skrivning (READ_STICKY_SECONDS)
+#  - når replicaen halter mere end REPLICA_MAX_LAG eller fejler
+#
+# Tidspunktet for brugerens seneste skrivning følger brugeren (web gemmer
+# det i session-cookien), ikke processen – næste request kan lande i en
+# anden gunicorn-worker.
+_routing = ContextVar("db_routing", default=None)
+_conn_origin = {}
+_replica = {"down_until": 0.0, "checked": 0.0, "lagging": False}
+
+
+def route_reads(replica=True, last_write=None):
+    """Sæt routing for den aktuelle request (web/bot).
+
+    last_write: time.time() for brugerens seneste skrivning, fx fra cookien.
+    """
+    # "sticky" deles med primary_reads()-kopierne, så en skrivning inde i
+    # sådan en blok stadig kan læses af last_write_at() bagefter
+    _routing.set({"replica": replica, "sticky": {"last_write": last_write}})
+
+
+def last_write_at():
+    """Seneste skrivning i denne request (eller den medbragte) – None hvis ingen."""
+    ctx = _routing.get()
+    return ctx["sticky"]["last_write"] if ctx else None
+
+
+@contextmanager
+def primary_reads():
+    token = _routing.set({"sticky": {"last_write": None}, **(_routing.get() or {}), "replica": False})
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def _note_write():
+    ctx = _routing.get()
+    if ctx:
+        ctx["sticky"]["last_write"] = time.time()
+
+
+def _replica_allowed():
+    if not DATABASE_READ_URL:
+        return False
+
+    ctx = _routing.get()
+    if ctx:
+        if not ctx.get("replica", True):
+            return False
+        last_write = ctx["sticky"]["last_write"]
+        if last_write and time.time() - last_write < READ_STICKY_SECONDS:
+            return False
+
+    return True
+
+
+def _mark_replica_down(reason):
+    print("♻️ Replica utilgængelig – læser fra primær:", reason)
+    _replica["down_until"] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+
+def _replica_lag(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+    lag = float(cur.fetchone()[0])
+    conn.rollback()
+    return lag
+
+
+def _get_replica_conn():
+    global read_pool
+
+    now = time.monotonic()
+    if now < _replica["down_until"]:
+        return None
+
+    recheck = now - _replica["checked"] > REPLICA_CHECK_SECONDS
+    if _replica["lagging"] and not recheck:
+        return None
+
+    conn = None
+    try:
+        if read_pool is None:
+            with _pool_lock:
+                if read_pool is None:
+                    create_read_pool()
+
+        conn = read_pool.getconn()
+        conn.autocommit = False
+        _conn_origin[id(conn)] = read_pool
+
+        if recheck:
+            lag = _replica_lag(conn)
+            _replica["checked"] = now
+            _replica["lagging"] = lag > REPLICA_MAX_LAG
+            metrics.REPLICA_LAG.set(lag)
+            if _replica["lagging"]:
+                print(f"🐢 Replica halter {lag:.1f}s – læser fra primær")
+                release_conn(conn)
+                return None
+
+        return conn
+
+    except Exception as e:
+        if conn is not None:
+            release_conn(conn, broken=True)
+        _mark_replica_down(e)
+        return None
+
+# =====================
+# CIRCUIT BREAKER (PRIMÆR)
+# =====================
+class DatabaseUnavailable(Exception):
+    """Databasen er nede – kaldet afvises med det samme (web svarer 503)."""
+
+
+def _probe_primary():
+    global pool
+    conn = psycopg2.connect(DATABASE_URL, sslmode="require", connect_timeout=5)
+    try:
+        conn.cursor().execute("SELECT 1")
+    finally:
+        conn.close()
+
+    # poolens gamle forbindelser er døde efter et nedbrud → ny pool
+    old = pool
+    with _pool_lock:
+        create_pool()
+    if old is not None and old is not pool:
+        try:
+            old.closeall()
+        except Exception:
+            pass
+
+
+db_breaker = CircuitBreaker(
+    "db",
+    probe=_probe_primary,
+    failure_threshold=int(os.getenv("DB_BREAKER_THRESHOLD", "5")),
+    probe_interval=float(os.getenv("DB_BREAKER_PROBE_SECONDS", "2"))
+)
+
+
+def _check_breaker():
+    if not db_breaker.allow():
+        raise DatabaseUnavailable("❌ Databasen er utilgængelig (circuit breaker åben)")
+
+
+def _db_ok(conn):
+    if _conn_origin.get(id(conn)) is not read_pool or read_pool is None:
+        db_breaker.record_success()
+
+
+def _db_failed(conn):
+    # fejl på replicaen håndteres af release_conn (falder tilbage til primær)
+    if conn is None or _conn_origin.get(id(conn)) is not read_pool or read_pool is None:
+        db_breaker.record_failure()
 
 # =====================
 # CONNECTION HELPERS (BOMBESTABIL)
 # =====================
-def get_conn():
+def _pool_getconn():
+    """pool.getconn() – er poolen udtømt, ventes der på en ledig forbindelse.
+
+    En udtømt pool er travlhed, ikke en død database: den tæller ikke i
+    breakeren, og poolen skiftes ikke ud (det ville efterlade de udlånte
+    forbindelser uden pool).
+    """
+    deadline = time.monotonic() + DB_POOL_WAIT_SECONDS
+    while True:
+        try:
+            return pool.getconn()
+        except PoolError:
+            if time.monotonic() >= deadline:
+                raise DatabaseUnavailable("❌ Ingen ledig DB-forbindelse (poolen er udtømt)")
+            time.sleep(0.01)
+
+
+def get_conn(read=False):
     global pool
 
+    started = time.perf_counter()
+
+    if read and _replica_allowed():
+        conn = _get_replica_conn()
+        if conn is not None:
+            metrics.pool_wait(time.perf_counter() - started)
+            metrics.db_read("replica")
+            return conn
+
     for _ in range(5):
+        _check_breaker()
         try:
-            if pool is None:
-                create_pool()
+            _ensure_pool()
 
-            conn = pool.getconn()
+            conn = _pool_getconn()
             conn.autocommit = False
+            # poolen kan være skiftet ud når forbindelsen kommer tilbage
+            _conn_origin[id(conn)] = pool
+            metrics.pool_wait(time.perf_counter() - started)
+            if read:
+                metrics.db_read("primary")
             return conn
 
+        except DatabaseUnavailable:
+            metrics.pool_wait(time.perf_counter() - started)
+            metrics.db_error("get_conn")
+            raise
+
         except psycopg2.OperationalError:
             print("♻️ DB connection død – prøver igen...")
+            metrics.db_retry("get_conn")
+            db_breaker.record_failure()
             time.sleep(0.2)
             create_pool()
 
         except Exception as e:
             print("♻️ DB pool fejl:", e)
+            metrics.db_retry("get_conn")
+            db_breaker.record_failure()
             time.sleep(0.2)
             create_pool()
 
-    raise Exception("❌ Kunne ikke oprette database-forbindelse efter retries")
+    metrics.pool_wait(time.perf_counter() - started)
+    metrics.db_error("get_conn")
+    raise DatabaseUnavailable("❌ Kunne ikke oprette database-forbindelse efter retries")
 
 
 def release_conn(conn, broken=False):
     global pool
 
+    origin = _conn_origin.pop(id(conn), pool)
+    # en udskiftet pool skal ikke have forbindelsen tilbage til genbrug
+    retired = origin is not pool and origin is not read_pool
+
     try:
         if broken:
-            # 🔥 smid død forbindelse væk
+            # 🔥 smid død forbindelse væk (og frigiv pladsen i poolen)
+            if origin is read_pool and read_pool is not None:
+                _mark_replica_down("forbindelse brudt")
             try:
-                conn.close()
+                origin.putconn(conn, close=True)
             except:
-                pass
+                conn.close()
         else:
-            pool.putconn(conn)
+            origin.putconn(conn, close=retired)
     except Exception:
         pass
 
 # =====================
-# INIT
+# INIT (VERSIONEREDE MIGRATIONER)
 # =====================
+# Den nuværende version står i meta['schema_version']; er den aktuel
+# koster init_db() ét SELECT. Ellers tages SCHEMA_LOCK, versionen læses
+# igen, og kun de manglende migrationer køres – hver migration køres
+# præcis én gang (de er ikke alle sikre at gentage: _migration_1
+# skriver til user_stats(data), som _migration_3 erstatter).
+_SEED_LAGER = {
+    "SNS": 20,
+    "9mm": 20,
+    "vintage": 10,
+    "ceramic": 10,
+    "xm3": 10,
+    "deagle": 10,
+    "Pump": 10,
+    "veste": 200
+}
+
+_SEED_PRICES = {
+    "SNS": 500000,
+    "9mm": 800000,
+    "vintage": 950000,
+    "ceramic": 950000,
+    "xm3": 1500000,
+    "deagle": 1700000,
+    "Pump": 2550000,
+    "veste": 350000
+}
+
+
+def _seed(table, data):
+    return (
+        f"INSERT INTO {table} (data) SELECT %s::jsonb "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {table});",
+        (serializer.dumps(data),)
+    )
+
+
+def _migration_1():
+    sql = ["""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    INSERT INTO meta (key, value)
+    VALUES ('current', NULL)
+    ON CONFLICT (key) DO NOTHING;
+    """]
+    params = []
+
+    for table in ["sessions", "access", "lager", "prices", "user_stats", "audit"]:
+        sql.append(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id SERIAL PRIMARY KEY,
+            data JSONB NOT NULL
+        );
+        """)
+
+    for table, data in [
+        ("sessions", {"current": None, "sessions": {}}),
+        ("access", {"users": {}, "blocked": []}),
+        ("lager", _SEED_LAGER),
+        ("prices", _SEED_PRICES),
+        ("user_stats", {}),
+        ("audit", [])
+    ]:
+        stmt, args = _seed(table, data)
+        sql.append(stmt)
+        params.extend(args)
+
+    return "\n".join(sql), tuple(params)
+
+
+def _migration_2():
+    # ARKIV – lukkede sessions komprimeret (gzip JSON)
+    return """
+    CREATE TABLE IF NOT EXISTS session_archive (
+        name TEXT PRIMARY KEY,
+        closed_at TIMESTAMP NOT NULL,
+        user_ids TEXT[] NOT NULL DEFAULT '{}',
+        data BYTEA NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS session_archive_user_ids
+    ON session_archive USING GIN (user_ids);
+    """, ()
+
+
+def _migration_3():
+    # USER STATS – én række pr. bruger i stedet for ét voksende dokument.
+    # Det gamle dokument-tabel bliver liggende som user_stats_legacy.
+    return """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'user_stats' AND column_name = 'data'
+        ) THEN
+            ALTER TABLE user_stats RENAME TO user_stats_legacy;
+        END IF;
+    END $$;
+
+    CREATE TABLE IF NOT EXISTS user_stats (
+        uid TEXT PRIMARY KEY,
+        total_spent BIGINT NOT NULL DEFAULT 0,
+        total_items INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS user_item_totals (
+        uid TEXT NOT NULL REFERENCES user_stats (uid) ON DELETE CASCADE,
+        item TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (uid, item)
+    );
+
+    INSERT INTO user_stats (uid, total_spent, total_items)
+    SELECT u.key,
+           COALESCE((u.value->>'total_spent')::numeric, 0)::bigint,
+           COALESCE((u.value->>'total_items')::numeric, 0)::int
+    FROM (SELECT data FROM user_stats_legacy ORDER BY id DESC LIMIT 1) l,
+         jsonb_each(l.data) u
+    WHERE jsonb_typeof(u.value) = 'object'
+    ON CONFLICT (uid) DO NOTHING;
+
+    INSERT INTO user_item_totals (uid, item, amount)
+    SELECT u.key, i.key, (i.value #>> '{}')::numeric::int
+    FROM (SELECT data FROM user_stats_legacy ORDER BY id DESC LIMIT 1) l,
+         jsonb_each(l.data) u,
+         jsonb_each(CASE WHEN jsonb_typeof(u.value->'items') = 'object'
+                         THEN u.value->'items' ELSE '{}'::jsonb END) i
+    WHERE jsonb_typeof(u.value) = 'object'
+      AND jsonb_typeof(i.value) = 'number'
+      AND (i.value #>> '{}')::numeric > 0
+    ON CONFLICT (uid, item) DO NOTHING;
+    """, ()
+
+
+def _migration_4():
+    # ACCESS → users-tabel. Det gamle dokument-tabel bliver access_legacy.
+    return """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'access' AND column_name = 'data'
+        ) THEN
+            ALTER TABLE access RENAME TO access_legacy;
+        END IF;
+    END $$;
+
+    CREATE TABLE IF NOT EXISTS users (
+        uid TEXT PRIMARY KEY,
+        name TEXT,
+        avatar TEXT,
+        role TEXT NOT NULL DEFAULT 'user',
+        blocked BOOLEAN NOT NULL DEFAULT FALSE,
+        revoked BOOLEAN NOT NULL DEFAULT FALSE,
+        discord_roles TEXT[],
+        roles_checked TIMESTAMP,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS users_blocked ON users (uid) WHERE blocked;
+    CREATE INDEX IF NOT EXISTS users_admins ON users (uid) WHERE role = 'admin';
+    CREATE INDEX IF NOT EXISTS users_last_seen ON users (last_seen);
+    CREATE INDEX IF NOT EXISTS users_listing ON users ((role <> 'admin'), lower(name), uid);
+
+    INSERT INTO users (uid, name, avatar, role, first_seen, last_seen)
+    SELECT u.key,
+           u.value->>'name',
+           u.value->>'avatar',
+           COALESCE(u.value->>'role', 'user'),
+           CASE WHEN u.value->>'first_seen' ~ '^[0-9]{2}-[0-9]{2}-[0-9]{4} [0-9]{2}:[0-9]{2}$'
+                THEN to_timestamp(u.value->>'first_seen', 'DD-MM-YYYY HH24:MI')::timestamp END,
+           CASE WHEN u.value->>'last_seen' ~ '^[0-9]{2}-[0-9]{2}-[0-9]{4} [0-9]{2}:[0-9]{2}$'
+                THEN to_timestamp(u.value->>'last_seen', 'DD-MM-YYYY HH24:MI')::timestamp END
+    FROM (SELECT data FROM access_legacy ORDER BY id DESC LIMIT 1) l,
+         jsonb_each(CASE WHEN jsonb_typeof(l.data->'users') = 'object'
+                         THEN l.data->'users' ELSE '{}'::jsonb END) u
+    WHERE jsonb_typeof(u.value) = 'object'
+    ON CONFLICT (uid) DO NOTHING;
+
+    INSERT INTO users (uid, blocked)
+    SELECT b.uid, TRUE
+    FROM (SELECT data FROM access_legacy ORDER BY id DESC LIMIT 1) l,
+         jsonb_array_elements_text(CASE WHEN jsonb_typeof(l.data->'blocked') = 'array'
+                                        THEN l.data->'blocked' ELSE '[]'::jsonb END) b (uid)
+    ON CONFLICT (uid) DO UPDATE SET blocked = TRUE;
+    """, ()
+
+
+def _migration_5():
+    # ANALYSE – færdige aggregater for lukkede sessions (analytics.py)
+    return """
+    CREATE TABLE IF NOT EXISTS session_summaries (
+        name TEXT PRIMARY KEY,
+        data JSONB NOT NULL,
+        computed_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+    """, ()
+
+
+def _migration_6():
+    # AUDIT – én række pr. event med rigtigt tidsstempel, og ældre events
+    # rullet op i måneds-blobs (gzip JSONL). Det gamle dokument-tabel
+    # bliver liggende som audit_legacy.
+    return """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'audit' AND column_name = 'data'
+        ) THEN
+            ALTER TABLE audit RENAME TO audit_legacy;
+        END IF;
+    END $$;
+
+    CREATE TABLE IF NOT EXISTS audit_events (
+        id BIGSERIAL PRIMARY KEY,
+        at TIMESTAMP NOT NULL,
+        action TEXT NOT NULL,
+        admin TEXT,
+        target JSONB
+    );
+    CREATE INDEX IF NOT EXISTS audit_events_at ON audit_events (at);
+    CREATE INDEX IF NOT EXISTS audit_events_action ON audit_events (action, at);
+
+    CREATE TABLE IF NOT EXISTS audit_archive (
+        month DATE PRIMARY KEY,
+        first_at TIMESTAMP NOT NULL,
+        last_at TIMESTAMP NOT NULL,
+        events INTEGER NOT NULL,
+        actions TEXT[] NOT NULL DEFAULT '{}',
+        data BYTEA NOT NULL
+    );
+
+    INSERT INTO audit_events (at, action, admin, target)
+    SELECT CASE WHEN e.value->>'time' ~ '^[0-9]{2}-[0-9]{2}-[0-9]{4} [0-9]{2}:[0-9]{2}$'
+                THEN to_timestamp(e.value->>'time', 'DD-MM-YYYY HH24:MI')::timestamp
+                ELSE 'epoch'::timestamp END,
+           COALESCE(e.value->>'action', ''),
+           e.value->>'admin',
+           e.value->'target'
+    FROM (SELECT data FROM audit_legacy ORDER BY id DESC LIMIT 1) l,
+         jsonb_array_elements(CASE WHEN jsonb_typeof(l.data) = 'array'
+                                   THEN l.data ELSE '[]'::jsonb END) WITH ORDINALITY e (value, n)
+    WHERE jsonb_typeof(e.value) = 'object'
+      AND NOT EXISTS (SELECT 1 FROM audit_events)
+    ORDER BY e.n;
+    """, ()
+
+
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+    (5, _migration_5),
+    (6, _migration_6),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_ready = False
+# fast nøgle til pg_advisory_xact_lock – én worker migrerer ad gangen
+SCHEMA_LOCK = 817201
+
+
+def _schema_version(cur):
+    try:
+        cur.execute("SELECT value FROM meta WHERE key = 'schema_version'")
+        row = cur.fetchone()
+        return int(row[0]) if row and row[0] else 0
+    except psycopg2.errors.UndefinedTable:
+        return 0
+
+
 def init_db():
+    global _schema_ready
+
+    if _schema_ready:
+        return
+
     conn = get_conn()
     try:
         cur = conn.cursor()
 
-        # TABELLER
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS meta (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )
-        """)
+        version = _schema_version(cur)
+        conn.rollback()
 
-        for table in ["sessions", "access", "lager", "prices", "user_stats", "audit"]:
-            cur.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table} (
-                id SERIAL PRIMARY KEY,
-                data JSONB NOT NULL
-            )
-            """)
+        if version >= SCHEMA_VERSION:
+            _schema_ready = True
+            print(f"✅ init_db() – schema v{version} er aktuel")
+            return
 
-        # META
-        cur.execute("""
+        # en anden worker kan være i gang – vent på låsen og læs versionen
+        # igen i et nyt statement (READ COMMITTED ser så dens commit), så
+        # ingen migration køres to gange
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK,))
+        cur.execute("SELECT to_regclass('meta') IS NOT NULL")
+        version = _schema_version(cur) if cur.fetchone()[0] else 0
+
+        if version >= SCHEMA_VERSION:
+            conn.rollback()
+            _schema_ready = True
+            print(f"✅ init_db() – schema v{version} migreret af en anden worker")
+            return
+
+        # alle manglende migrationer i ét batch (én round trip)
+        sql = []
+        params = []
+        for v, migration in MIGRATIONS:
+            if v > version:
+                stmt, args = migration()
+                sql.append(stmt)
+                params.extend(args)
+
+        sql.append("""
         INSERT INTO meta (key, value)
-        VALUES ('current', NULL)
-        ON CONFLICT (key) DO NOTHING
+        VALUES ('schema_version', %s)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
         """)
+        params.append(str(SCHEMA_VERSION))
 
-        # SESSIONS
-        cur.execute("SELECT COUNT(*) FROM sessions")
-        if cur.fetchone()[0] == 0:
-            cur.execute(
-                "INSERT INTO sessions (data) VALUES (%s)",
-                (json.dumps({"current": None, "sessions": {}}),)
-            )
-
-        # ACCESS
-        cur.execute("SELECT COUNT(*) FROM access")
-        if cur.fetchone()[0] == 0:
-            cur.execute(
-                "INSERT INTO access (data) VALUES (%s)",
-                (json.dumps({"users": {}, "blocked": []}),)
-            )
-
-        # LAGER
-        cur.execute("SELECT COUNT(*) FROM lager")
-        if cur.fetchone()[0] == 0:
-            cur.execute(
-                "INSERT INTO lager (data) VALUES (%s)",
-                (json.dumps({
-                    "SNS": 20,
-                    "9mm": 20,
-                    "vintage": 10,
-                    "ceramic": 10,
-                    "xm3": 10,
-                    "deagle": 10,
-                    "Pump": 10,
-                    "veste": 200
-                }),)
-            )
-
-        # PRISER
-        cur.execute("SELECT COUNT(*) FROM prices")
-        if cur.fetchone()[0] == 0:
-            cur.execute(
-                "INSERT INTO prices (data) VALUES (%s)",
-                (json.dumps({
-                    "SNS": 500000,
-                    "9mm": 800000,
-                    "vintage": 950000,
-                    "ceramic": 950000,
-                    "xm3": 1500000,
-                    "deagle": 1700000,
-                    "Pump": 2550000,
-                    "veste": 350000
-                }),)
-            )
-
-        # USER STATS
-        cur.execute("SELECT COUNT(*) FROM user_stats")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO user_stats (data) VALUES (%s)", (json.dumps({}),))
-
-        # AUDIT
-        cur.execute("SELECT COUNT(*) FROM audit")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO audit (data) VALUES (%s)", (json.dumps([]),))
-
+        cur.execute("\n".join(sql), tuple(params))
         conn.commit()
-        print("✅ init_db() OK – database klar")
+
+        _schema_ready = True
+        print(f"✅ init_db() – schema migreret v{version} → v{SCHEMA_VERSION}")
+
+    except Exception:
+        conn.rollback()
+        raise
 
     finally:
         release_conn(conn)
@@ -176,22 +704,33 @@ def _load_latest(table, default):
     for _ in range(3):
         conn = None
         try:
-            conn = get_conn()
+            conn = get_conn(read=True)
             cur = conn.cursor()
+            started = time.perf_counter()
             cur.execute(f"SELECT data FROM {table} ORDER BY id DESC LIMIT 1")
             row = cur.fetchone()
+            metrics.db_roundtrip(f"load_{table}", time.perf_counter() - started)
+            _db_ok(conn)
             return row[0] if row and row[0] else default
 
+        except DatabaseUnavailable:
+            raise
+
         except psycopg2.OperationalError as e:
             print(f"♻️ SSL fejl på load {table} – retry...", e)
+            metrics.db_retry(f"load_{table}")
+            _db_failed(conn)
             if conn:
                 release_conn(conn, broken=True)
+                conn = None
             time.sleep(0.1)
 
         except Exception as e:
             print(f"❌ Fejl på load {table}:", e)
+            metrics.db_error(f"load_{table}")
             if conn:
                 release_conn(conn, broken=True)
+                conn = None
             return default
 
         finally:
@@ -201,7 +740,8 @@ def _load_latest(table, default):
                 except:
                     pass
 
-    return default
+    metrics.db_error(f"load_{table}")
+    raise DatabaseUnavailable(f"❌ Kunne ikke læse {table} efter retries")
 
 
 def _insert(table, data):
@@ -210,20 +750,32 @@ def _insert(table, data):
         try:
             conn = get_conn()
             cur = conn.cursor()
-            cur.execute(f"INSERT INTO {table} (data) VALUES (%s)", (json.dumps(data),))
+            started = time.perf_counter()
+            cur.execute(f"INSERT INTO {table} (data) VALUES (%s)", (serializer.dumps(data),))
             conn.commit()
+            _note_write()
+            metrics.db_roundtrip(f"insert_{table}", time.perf_counter() - started)
+            _db_ok(conn)
             return
 
+        except DatabaseUnavailable:
+            raise
+
         except psycopg2.OperationalError as e:
             print(f"♻️ SSL fejl på insert {table} – retry...", e)
+            metrics.db_retry(f"insert_{table}")
+            _db_failed(conn)
             if conn:
                 release_conn(conn, broken=True)
+                conn = None
             time.sleep(0.1)
 
         except Exception as e:
             print(f"❌ Fejl på insert {table}:", e)
+            metrics.db_error(f"insert_{table}")
             if conn:
                 release_conn(conn, broken=True)
+                conn = None
             return
 
         finally:
@@ -233,60 +785,580 @@ def _insert(table, data):
                 except:
                     pass
 
+    metrics.db_error(f"insert_{table}")
+    raise DatabaseUnavailable(f"❌ Kunne ikke gemme {table} efter retries")
+
+
+def _run(op, fn, read=False):
+    """Kør fn(cur) i én transaktion med samme retry/breaker-regler som ovenfor."""
+    for _ in range(3):
+        conn = None
+        try:
+            conn = get_conn(read=read)
+            cur = conn.cursor()
+            started = time.perf_counter()
+            result = fn(cur)
+            conn.commit()
+            if not read:
+                _note_write()
+            metrics.db_roundtrip(op, time.perf_counter() - started)
+            _db_ok(conn)
+            return result
+
+        except DatabaseUnavailable:
+            raise
+
+        except psycopg2.OperationalError as e:
+            print(f"♻️ SSL fejl på {op} – retry...", e)
+            metrics.db_retry(op)
+            _db_failed(conn)
+            if conn:
+                release_conn(conn, broken=True)
+                conn = None
+            time.sleep(0.1)
+
+        except Exception:
+            metrics.db_error(op)
+            if conn:
+                release_conn(conn, broken=True)
+                conn = None
+            raise
+
+        finally:
+            if conn:
+                release_conn(conn)
+
+    metrics.db_error(op)
+    raise DatabaseUnavailable(f"❌ {op} fejlede efter retries")
+
 # =====================
 # API FUNKTIONER
 # =====================
+# sidste sessions-dokument læst fra Postgres (rå JSON) – base for de
+# ventende journal-ændringer hvis DB'en er væk. Kun brugt under udfald.
+_sessions_base = {"raw": None, "current": None}
+
+
+def _pending_session_ops():
+    return [o for batch in journal.waiting("sessions") for o in batch["ops"]]
+
+
+def _load_sessions_db():
+    error = None
+    for _ in range(3):
+        conn = None
+        try:
+            conn = get_conn(read=True)
+            cur = conn.cursor()
+            started = time.perf_counter()
+
+            cur.execute("SELECT value FROM meta WHERE key='current'")
+            row = cur.fetchone()
+            current = row[0] if row else None
+            metrics.db_roundtrip("load_meta", time.perf_counter() - started)
+
+            started = time.perf_counter()
+            cur.execute("SELECT data::text FROM sessions ORDER BY id DESC LIMIT 1")
+            row = cur.fetchone()
+            metrics.db_roundtrip("load_sessions", time.perf_counter() - started)
+
+            _db_ok(conn)
+            return (row[0] if row else None), current
+
+        except psycopg2.OperationalError as e:
+            # en død forbindelse fra poolen (fx lukket SSL mens den lå stille) → ny forbindelse
+            print("♻️ SSL fejl load_sessions – retry...", e)
+            metrics.db_retry("load_sessions")
+            _db_failed(conn)
+            if conn:
+                release_conn(conn, broken=True)
+                conn = None
+            error = e
+            time.sleep(0.1)
+
+        finally:
+            if conn:
+                release_conn(conn)
+
+    # en tom fallback ville blive gemt oven i de rigtige data → fejl højt
+    metrics.db_error("load_sessions")
+    raise DatabaseUnavailable("❌ Kunne ikke læse sessions") from error
+
+
 def load_sessions():
-    conn = None
+    """Nyeste dokument fra Postgres + denne process' ændringer der venter i journalen."""
+    pending = _pending_session_ops()
     try:
-        conn = get_conn()
-        cur = conn.cursor()
+        raw, current = _load_sessions_db()
+        _sessions_base.update(raw=raw, current=current)
+    except DatabaseUnavailable:
+        # DB'en er væk, men vi har selv ventende ændringer → vis dem oven
+        # på det sidst læste dokument i stedet for en fejlside
+        if not pending or _sessions_base["raw"] is None:
+            raise
+        raw, current = _sessions_base["raw"], _sessions_base["current"]
+
+    data = serializer.loads(raw) if raw else {}
+    data.setdefault("sessions", {})
+    data["current"] = current
+    if pending:
+        apply_ops(data, pending)
+    return data
+
+
+def save_session_ops(ops, audit_events=()):
+    """Journal først (fsync), derefter Postgres.
+
+    ops er små ændringer (orders.op(...)) der afspilles mod det nyeste
+    dokument i Postgres; audit_events skrives i samme transaktion.
+    → True når det er skrevet, False når det venter i journalen.
+    """
+    entry = {"ops": list(ops)}
+    if audit_events:
+        entry["audit"] = list(audit_events)
+    journal.append("sessions", entry)
+
+    if JOURNAL_ASYNC:
+        journal.start_flusher()
+        return False
 
-        cur.execute("SELECT value FROM meta WHERE key='current'")
-        row = cur.fetchone()
-        current = row[0] if row else None
+    try:
+        # skriver også ældre ventende ændringer – i rækkefølge
+        journal.write("sessions")
+    except DatabaseUnavailable as e:
+        print("📒 ændring ligger i journalen – skrives når DB er tilbage:", e)
+        journal.start_flusher()
+        return False
+    return True
 
-        cur.execute("SELECT data FROM sessions ORDER BY id DESC LIMIT 1")
-        row = cur.fetchone()
 
-        data = row[0] if row and row[0] else {"current": None, "sessions": {}}
-        data["current"] = current
-        return data
+def sync_pending():
+    """Antal ændringer i journalen der endnu ikke er skrevet til Postgres."""
+    return journal.pending_count()
 
-    except psycopg2.OperationalError as e:
-        print("♻️ SSL fejl load_sessions – fallback", e)
-        return {"current": None, "sessions": {}}
 
+# fast nøgle til pg_advisory_xact_lock – én skriver ad gangen på sessions
+SESSIONS_LOCK = 7305
+
+
+def _read_sessions_cur(cur):
+    cur.execute("SELECT value FROM meta WHERE key='current'")
+    row = cur.fetchone()
+    current = row[0] if row else None
+    cur.execute("SELECT data FROM sessions ORDER BY id DESC LIMIT 1")
+    row = cur.fetchone()
+    data = row[0] if row and row[0] else {}
+    data.setdefault("sessions", {})
+    data["current"] = current
+    return data
+
+
+def _apply_session_ops(cur, ops):
+    """Afspil ops mod det nyeste dokument og gem det – i cur's transaktion.
+
+    Låsen serialiserer skrivere på tværs af workers; under READ COMMITTED
+    ser SELECT'en efter låsen altid den forriges commit. Betalt/ikke
+    betalt rettes i user_stats i samme transaktion – præcis én gang.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SESSIONS_LOCK,))
+    data = _read_sessions_cur(cur)
+    for delta in apply_ops(data, ops):
+        _apply_stats(cur, *delta)
+    _write_sessions_cur(cur, data)
+    return data
+
+
+def _write_sessions_cur(cur, data):
+    cur.execute("INSERT INTO sessions (data) VALUES (%s)", (serializer.dumps(data),))
+
+    cur.execute("""
+        INSERT INTO meta (key, value)
+        VALUES ('current', %s)
+        ON CONFLICT (key)
+        DO UPDATE SET value = EXCLUDED.value
+    """, (data.get("current"),))
+
+
+def _write_sessions(entries):
+    """Journal-writer: alle ventende ændringer i én transaktion."""
+    ops = [o for e in entries for o in e["ops"]]
+    events = [ev for e in entries for ev in e.get("audit", ())]
+
+    def fn(cur):
+        if ops:
+            _apply_session_ops(cur, ops)
+        if events:
+            _append_audit(cur, events)
+
+    _run("save_sessions", fn)
+
+
+journal.register("sessions", _write_sessions)
+
+
+# =====================
+# ARKIV (KOLDE SESSIONS)
+# =====================
+def _pack(data):
+    return psycopg2.Binary(gzip.compress(serializer.dumps_bytes(data)))
+
+
+def _unpack(raw):
+    return serializer.loads(gzip.decompress(bytes(raw)))
+
+
+def archive_sessions(max_age_days=None):
+    """Flyt sessions lukket for mere end max_age_days dage til session_archive."""
+    if max_age_days is None:
+        max_age_days = ARCHIVE_AFTER_DAYS
+
+    now = datetime.now()
+    cutoff = now - timedelta(days=max_age_days)
+
+    def fn(cur):
+        # samme lås som save_session_ops – læs-rediger-skriv på primær
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SESSIONS_LOCK,))
+        data = _read_sessions_cur(cur)
+        moved = []
+        stamped = False
+
+        for name, s in data["sessions"].items():
+            if s.get("open") or name == data["current"]:
+                continue
+
+            closed_at = s.get("closed_at")
+            if not closed_at:
+                # ældre sessions uden tidsstempel – alderen tælles herfra
+                s["closed_at"] = now.strftime(TIME_FORMAT)
+                stamped = True
+                continue
+
+            if datetime.strptime(closed_at, TIME_FORMAT) <= cutoff:
+                moved.append(name)
+
+        for name in moved:
+            s = data["sessions"].pop(name)
+            user_ids = sorted({
+                o["user_id"] for o in s.get("orders", []) if o.get("user_id")
+            })
+            cur.execute("""
+                INSERT INTO session_archive (name, closed_at, user_ids, data)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (name) DO UPDATE
+                SET closed_at = EXCLUDED.closed_at,
+                    user_ids = EXCLUDED.user_ids,
+                    data = EXCLUDED.data
+            """, (
+                name,
+                datetime.strptime(s["closed_at"], TIME_FORMAT),
+                user_ids,
+                _pack(s)
+            ))
+
+        # arkiv + nyt hot-dokument i samme transaktion → intet går tabt
+        if moved or stamped:
+            _write_sessions_cur(cur, data)
+        return moved
+
+    moved = _run("archive_sessions", fn)
+    if not moved:
+        return []
+
+    print(f"🗄️ Arkiverede {len(moved)} sessions:", ", ".join(moved))
+    return moved
+
+
+def load_archived_session(name):
+    conn = get_conn(read=True)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT data FROM session_archive WHERE name = %s", (name,))
+        row = cur.fetchone()
+        return _unpack(row[0]) if row else None
     finally:
-        if conn:
-            release_conn(conn)
+        release_conn(conn)
 
 
-def save_sessions(data):
-    conn = None
+def list_archived_sessions():
+    """Kun navne – selve data hentes først når sessionen åbnes."""
+    conn = get_conn(read=True)
     try:
-        conn = get_conn()
         cur = conn.cursor()
+        cur.execute("SELECT name FROM session_archive ORDER BY closed_at")
+        return [r[0] for r in cur.fetchall()]
+    finally:
+        release_conn(conn)
 
-        cur.execute("INSERT INTO sessions (data) VALUES (%s)", (json.dumps(data),))
 
-        cur.execute("""
-            INSERT INTO meta (key, value)
-            VALUES ('current', %s)
-            ON CONFLICT (key)
-            DO UPDATE SET value = EXCLUDED.value
-        """, (data.get("current"),))
+def load_archived_sessions_for_user(uid):
+    conn = get_conn(read=True)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT name, data FROM session_archive WHERE %s = ANY(user_ids) ORDER BY closed_at",
+            (uid,)
+        )
+        return {name: _unpack(raw) for name, raw in cur.fetchall()}
+    finally:
+        release_conn(conn)
 
+
+def delete_archived_session(name):
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM session_archive WHERE name = %s", (name,))
+        deleted = cur.rowcount > 0
         conn.commit()
+        _note_write()
+        return deleted
+    finally:
+        release_conn(conn)
+
+
+# =====================
+# EKSPORT (STREAMING)
+# =====================
+EXPORT_BATCH = 500
+
+
+def _order_matches(o, paid, delivered):
+    return (
+        (paid is None or bool(o.get("paid")) == paid)
+        and (delivered is None or bool(o.get("delivered")) == delivered)
+    )
+
+
+def _iter_packed_orders(raw, paid=None, delivered=None):
+    """Ordrerne i et arkiveret (gzip) session-blob – dekomprimeret som stream."""
+    with gzip.open(io.BytesIO(bytes(raw)), "rt", encoding="utf-8") as f:
+        for _, o in iter_members(Reader(f), ("orders",)):
+            if _order_matches(o, paid, delivered):
+                yield o
+
+
+def iter_session_orders(name=None, paid=None, delivered=None, archive=True, conn=None):
+    """Yield (session, ordre) én ad gangen – hele sessionen hentes aldrig.
+
+    Hot-sessions læses med en server-side cursor (EXPORT_BATCH rækker ad
+    gangen), arkiverede dekomprimeres og parses som stream. name=None → alle.
+    conn → læs i den forbindelses transaktion (se stats_snapshot).
+    """
+    if conn is None and journal.pending_count():
+        # egne ændringer venter på DB'en – læs dokumentet med dem lagt på
+        for sname, s in load_sessions()["sessions"].items():
+            if name is None or sname == name:
+                for o in s.get("orders", []):
+                    if _order_matches(o, paid, delivered):
+                        yield sname, o
+    else:
+        own = conn is None
+        hot = get_conn(read=True) if own else conn
+        try:
+            cur = hot.cursor(name="export_hot")
+            cur.itersize = EXPORT_BATCH
+            cur.execute("""
+                SELECT s.key, o.value
+                FROM (SELECT data FROM sessions ORDER BY id DESC LIMIT 1) d,
+                     jsonb_each(d.data->'sessions') s,
+                     jsonb_array_elements(
+                         CASE WHEN jsonb_typeof(s.value->'orders') = 'array'
+                              THEN s.value->'orders' ELSE '[]'::jsonb END
+                     ) o
+                WHERE (%(name)s::text IS NULL OR s.key = %(name)s)
+                  AND (%(paid)s::boolean IS NULL
+                       OR COALESCE((o.value->>'paid')::boolean, FALSE) = %(paid)s)
+                  AND (%(delivered)s::boolean IS NULL
+                       OR COALESCE((o.value->>'delivered')::boolean, FALSE) = %(delivered)s)
+            """, {"name": name, "paid": paid, "delivered": delivered})
+            for row in cur:
+                yield row
+            cur.close()
+            if own:
+                hot.rollback()
+        finally:
+            if own:
+                release_conn(hot)
+
+    if not archive:
+        return
 
-    except psycopg2.OperationalError as e:
-        print("♻️ SSL fejl save_sessions – ignoreret", e)
+    names = None if name is None else [name]
+    for sname, _, orders in iter_archived_sessions(names, paid, delivered, conn=conn):
+        for o in orders:
+            yield sname, o
 
+
+def iter_archived_sessions(names=None, paid=None, delivered=None, conn=None):
+    """Yield (navn, closed_at, ordrer) pr. arkiveret session, ét blob ad gangen.
+
+    ordrer er en generator over blobbet – den skal tømmes før næste session.
+    """
+    own = conn is None
+    if own:
+        conn = get_conn(read=True)
+    try:
+        cur = conn.cursor(name="export_archive")
+        cur.itersize = 1
+        cur.execute("""
+            SELECT name, closed_at, data FROM session_archive
+            WHERE %(names)s::text[] IS NULL OR name = ANY(%(names)s)
+            ORDER BY closed_at
+        """, {"names": names})
+        for sname, closed_at, raw in cur:
+            yield sname, closed_at.strftime(TIME_FORMAT), _iter_packed_orders(raw, paid, delivered)
+        cur.close()
+        if own:
+            conn.rollback()
     finally:
-        if conn:
+        if own:
             release_conn(conn)
 
 
+@contextmanager
+def stats_snapshot():
+    """user_stats og alle betalte ordrer (hot og arkiv) fra ét øjebliksbillede.
+
+    Stats rettes i samme transaktion som betalt-flaget (_apply_session_ops),
+    så i én REPEATABLE READ-transaktion på primæren passer de altid sammen.
+
+        with stats_snapshot() as (stats, orders):
+            for session_name, order in orders: ...
+    """
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        stats = _read_user_stats(cur)
+        yield stats, iter_session_orders(paid=True, conn=conn)
+        conn.rollback()
+    finally:
+        release_conn(conn)
+
+
+# =====================
+# ANALYSE (AGGREGATER)
+# =====================
+# Hot-sessions aggregeres i Postgres direkte over JSONB-ordrerne, så kun
+# grupperede rækker krydser netværket. Arkiverede sessions er gzip-blobs
+# og tælles i analytics.py. Færdige aggregater for lukkede sessions
+# gemmes i session_summaries.
+_HOT_ORDERS = """
+    WITH o AS (
+        SELECT s.key AS name, o.value AS o,
+               COALESCE((o.value->>'paid')::boolean, FALSE) AS paid
+        FROM (SELECT data FROM sessions ORDER BY id DESC LIMIT 1) d,
+             jsonb_each(d.data->'sessions') s,
+             jsonb_array_elements(
+                 CASE WHEN jsonb_typeof(s.value->'orders') = 'array'
+                      THEN s.value->'orders' ELSE '[]'::jsonb END
+             ) o
+        WHERE s.key = ANY(%(names)s)
+    )
+"""
+
+
+def list_session_index():
+    """{"current", "hot": {navn: closed_at}, "archived": {navn: closed_at}} – uden ordrerne."""
+    pending = load_sessions() if journal.pending_count() else None
+
+    def fn(cur):
+        index = {"current": None, "hot": {}, "archived": {}}
+        if pending is not None:
+            index["current"] = pending.get("current")
+            index["hot"] = {n: s.get("closed_at") for n, s in pending["sessions"].items()}
+        else:
+            cur.execute("SELECT value FROM meta WHERE key = 'current'")
+            row = cur.fetchone()
+            index["current"] = row[0] if row else None
+            cur.execute("""
+                SELECT s.key, s.value->>'closed_at'
+                FROM (SELECT data FROM sessions ORDER BY id DESC LIMIT 1) d,
+                     jsonb_each(d.data->'sessions') s
+            """)
+            index["hot"] = dict(cur.fetchall())
+
+        cur.execute("SELECT name, closed_at FROM session_archive")
+        index["archived"] = {n: c.strftime(TIME_FORMAT) for n, c in cur.fetchall()}
+        return index
+
+    return _run("list_session_index", fn, read=True)
+
+
+def aggregate_hot_sessions(names):
+    """Grupperede rækker for hot-sessions: {"buyers": [...], "items": [...]}.
+
+    buyers: (session, uid, navn, ordrer, betalte, leverede, total, betalt total)
+    items:  (session, vare, stk, betalte stk)
+    None når journalen er foran DB'en – så tæller analytics.py selv.
+    """
+    if journal.pending_count():
+        return None
+
+    def fn(cur):
+        args = {"names": list(names)}
+        cur.execute(_HOT_ORDERS + """
+            SELECT name,
+                   COALESCE(o->>'user_id', o->>'user', ''),
+                   max(o->>'user'),
+                   count(*),
+                   count(*) FILTER (WHERE paid),
+                   count(*) FILTER (WHERE COALESCE((o->>'delivered')::boolean, FALSE)),
+                   COALESCE(sum((o->>'total')::numeric), 0),
+                   COALESCE(sum((o->>'total')::numeric) FILTER (WHERE paid), 0)
+            FROM o
+            GROUP BY 1, 2
+        """, args)
+        buyers = cur.fetchall()
+
+        cur.execute(_HOT_ORDERS + """
+            SELECT name, i.key,
+                   sum(i.value::numeric),
+                   COALESCE(sum(i.value::numeric) FILTER (WHERE paid), 0)
+            FROM o,
+                 jsonb_each_text(CASE WHEN jsonb_typeof(o->'items') = 'object'
+                                      THEN o->'items' ELSE '{}'::jsonb END) i
+            WHERE i.value::numeric > 0
+            GROUP BY 1, 2
+        """, args)
+        return {"buyers": buyers, "items": cur.fetchall()}
+
+    return _run("aggregate_hot_sessions", fn, read=True)
+
+
+def load_session_summaries():
+    def fn(cur):
+        cur.execute("SELECT name, data FROM session_summaries")
+        return dict(cur.fetchall())
+
+    return _run("load_session_summaries", fn, read=True)
+
+
+def save_session_summaries(summaries):
+    if not summaries:
+        return
+
+    def fn(cur):
+        execute_values(cur, """
+            INSERT INTO session_summaries (name, data) VALUES %s
+            ON CONFLICT (name) DO UPDATE
+            SET data = EXCLUDED.data, computed_at = now()
+        """, [(name, serializer.dumps(s)) for name, s in summaries.items()])
+
+    _run("save_session_summaries", fn)
+
+
+@task("drop_session_summary")
+def drop_session_summary(name):
+    _run("drop_session_summary", lambda cur: cur.execute(
+        "DELETE FROM session_summaries WHERE name = %s", (name,)
+    ))
+
+
+def queue_drop_session_summary(name):
+    enqueue("drop_session_summary", name)
+
+
 def load_lager():
     return _load_latest("lager", {})
 
@@ -295,41 +1367,533 @@ def load_prices():
     return _load_latest("prices", {})
 
 
+# =====================
+# USER STATS (ÉN RÆKKE PR. BRUGER)
+# =====================
+def _empty_stats():
+    return {"total_spent": 0, "total_items": 0, "items": {}}
+
+
+def load_user_stat(uid):
+    """Én brugers stats – indekseret opslag på user_stats/user_item_totals."""
+    def fn(cur):
+        cur.execute("""
+            SELECT s.total_spent, s.total_items, i.item, i.amount
+            FROM user_stats s
+            LEFT JOIN user_item_totals i ON i.uid = s.uid
+            WHERE s.uid = %s
+        """, (uid,))
+        rows = cur.fetchall()
+        if not rows:
+            return _empty_stats()
+        return {
+            "total_spent": rows[0][0],
+            "total_items": rows[0][1],
+            "items": {item: amount for _, _, item, amount in rows if item is not None}
+        }
+    return _run("load_user_stat", fn, read=True)
+
+
+def _read_user_stats(cur, uids=None, lock=False):
+    cur.execute(
+        "SELECT uid, total_spent, total_items FROM user_stats "
+        "WHERE %(uids)s::text[] IS NULL OR uid = ANY(%(uids)s)" + (" FOR UPDATE" if lock else ""),
+        {"uids": uids}
+    )
+    stats = {
+        uid: {"total_spent": spent, "total_items": items, "items": {}}
+        for uid, spent, items in cur.fetchall()
+    }
+    cur.execute(
+        "SELECT uid, item, amount FROM user_item_totals "
+        "WHERE %(uids)s::text[] IS NULL OR uid = ANY(%(uids)s)",
+        {"uids": uids}
+    )
+    for uid, item, amount in cur.fetchall():
+        stats[uid]["items"][item] = amount
+    return stats
+
+
 def load_user_stats():
-    return _load_latest("user_stats", {})
+    """Alle brugeres stats som {uid: {...}} – kun til admin/analyse."""
+    return _run("load_user_stats", _read_user_stats, read=True)
+
+
+def update_user_stats(uids, fn):
+    """Læs-rediger-skriv for et sæt brugere i én kort transaktion.
+
+    Rækkerne låses (FOR UPDATE), fn({uid: stats}) returnerer de nye stats.
+    """
+    def tx(cur):
+        new = fn(_read_user_stats(cur, list(uids), lock=True))
+        _write_user_stats(cur, new)
+        return new
+    return _run("update_user_stats", tx)
+
+
+def _write_user_stats(cur, stats):
+    if not stats:
+        return
+    execute_values(cur, """
+        INSERT INTO user_stats (uid, total_spent, total_items) VALUES %s
+        ON CONFLICT (uid) DO UPDATE
+        SET total_spent = EXCLUDED.total_spent,
+            total_items = EXCLUDED.total_items
+    """, [(uid, s.get("total_spent", 0), s.get("total_items", 0)) for uid, s in stats.items()])
+    cur.execute("DELETE FROM user_item_totals WHERE uid = ANY(%s)", (list(stats),))
+    rows = [
+        (uid, item, amount)
+        for uid, s in stats.items()
+        for item, amount in s.get("items", {}).items()
+        if amount > 0
+    ]
+    if rows:
+        execute_values(cur, "INSERT INTO user_item_totals (uid, item, amount) VALUES %s", rows)
 
 
 def save_user_stats(stats):
-    _insert("user_stats", stats)
+    """Overskriv stats for de brugere der er i stats (andre røres ikke)."""
+    _run("save_user_stats", lambda cur: _write_user_stats(cur, stats))
 
 
 def reset_all_stats():
-    _insert("user_stats", {})
+    _run("reset_all_stats", lambda cur: cur.execute("TRUNCATE user_item_totals, user_stats"))
+
+
+def _apply_stats(cur, uid, items, total, sign=1):
+    """Læg en betalt ordre til (sign=1) eller træk den fra (sign=-1) brugerens stats.
+
+    Kaldes kun fra _apply_session_ops, i samme transaktion som betalt-flaget.
+    """
+    items = [(uid, item, amount) for item, amount in items.items() if amount > 0]
+    count = sum(amount for _, _, amount in items)
+    total = total or 0
+
+    if sign > 0:
+        cur.execute("""
+            INSERT INTO user_stats (uid, total_spent, total_items)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (uid) DO UPDATE
+            SET total_spent = user_stats.total_spent + EXCLUDED.total_spent,
+                total_items = user_stats.total_items + EXCLUDED.total_items
+        """, (uid, total, count))
+        if items:
+            execute_values(cur, """
+                INSERT INTO user_item_totals (uid, item, amount) VALUES %s
+                ON CONFLICT (uid, item) DO UPDATE
+                SET amount = user_item_totals.amount + EXCLUDED.amount
+            """, items)
+        return
+
+    # sikkerhed: aldrig under 0
+    cur.execute("""
+        UPDATE user_stats
+        SET total_spent = GREATEST(0, total_spent - %s),
+            total_items = GREATEST(0, total_items - %s)
+        WHERE uid = %s
+    """, (total, count, uid))
+    if items:
+        execute_values(cur, """
+            UPDATE user_item_totals t
+            SET amount = t.amount - v.amount
+            FROM (VALUES %s) AS v (uid, item, amount)
+            WHERE t.uid = v.uid AND t.item = v.item
+        """, items)
+        cur.execute("DELETE FROM user_item_totals WHERE uid = %s AND amount <= 0", (uid,))
+
+
+# =====================
+# USERS (ADGANG)
+# =====================
+# Én række pr. bruger. last_seen skrives ikke ved hvert login/request –
+# touch_user samler tidsstemplerne i hukommelsen, og en baggrundstråd
+# skriver dem samlet hvert LAST_SEEN_FLUSH_SECONDS.
+LAST_SEEN_FLUSH_SECONDS = float(os.getenv("LAST_SEEN_FLUSH_SECONDS", "60"))
+
+_USER_COLUMNS = (
+    "uid, name, avatar, role, blocked, revoked, discord_roles, "
+    "roles_checked, first_seen, last_seen"
+)
+
+_last_seen = {}             # uid → datetime (endnu ikke skrevet)
+_last_seen_lock = threading.Lock()
+_last_seen_flusher = None
 
 
-def load_access():
-    return _load_latest("access", {"users": {}, "blocked": []})
+def _fmt_time(ts):
+    return ts.strftime(TIME_FORMAT) if ts else None
 
 
-def save_access(data):
-    _insert("access", data)
+def _user_from_row(row):
+    uid, name, avatar, role, blocked, revoked, roles, checked, first, last = row
+    pending = _last_seen.get(uid)
+    if pending and (last is None or pending > last):
+        last = pending
+    return {
+        "uid": uid,
+        "name": name or "Ukendt",
+        "avatar": avatar,
+        "role": role,
+        "blocked": blocked,
+        "revoked": revoked,
+        "discord_roles": roles or [],
+        "roles_checked": _fmt_time(checked),
+        "first_seen": _fmt_time(first),
+        "last_seen": _fmt_time(last)
+    }
 
 
-def audit_log(action, admin, target):
-    events = load_audit()
+def load_user(uid):
+    """Én bruger (dict) eller None – opslag på primærnøglen."""
+    def fn(cur):
+        cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE uid = %s", (uid,))
+        row = cur.fetchone()
+        return _user_from_row(row) if row else None
+    return _run("load_user", fn, read=True)
+
+
+def list_users(page=1, per_page=50):
+    """(brugere, antal i alt) – admins først, derefter navn; sorteret i SQL."""
+    def fn(cur):
+        cur.execute("SELECT count(*) FROM users WHERE name IS NOT NULL")
+        total = cur.fetchone()[0]
+        cur.execute(f"""
+            SELECT {_USER_COLUMNS} FROM users
+            WHERE name IS NOT NULL
+            ORDER BY (role <> 'admin'), lower(name), uid
+            LIMIT %s OFFSET %s
+        """, (per_page, (max(page, 1) - 1) * per_page))
+        return [_user_from_row(r) for r in cur.fetchall()], total
+    return _run("list_users", fn, read=True)
+
+
+def login_user(uid, name, avatar):
+    """Opret/opdatér ved login. Rollen overskrives ALDRIG automatisk."""
+    now = datetime.now()
+
+    def fn(cur):
+        cur.execute("""
+            INSERT INTO users (uid, name, avatar, first_seen, last_seen)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (uid) DO UPDATE
+            SET name = EXCLUDED.name,
+                avatar = EXCLUDED.avatar,
+                revoked = FALSE,
+                first_seen = COALESCE(users.first_seen, EXCLUDED.first_seen),
+                last_seen = EXCLUDED.last_seen
+            WHERE users.name IS DISTINCT FROM EXCLUDED.name
+               OR users.avatar IS DISTINCT FROM EXCLUDED.avatar
+               OR users.revoked
+               OR users.first_seen IS NULL
+        """, (uid, name, avatar, now, now))
+        return cur.rowcount
+
+    if not _run("login_user", fn):
+        # intet ændret → kun last_seen, og den samles op
+        touch_user(uid, now)
+
+
+def touch_user(uid, when=None):
+    with _last_seen_lock:
+        _last_seen[uid] = when or datetime.now()
+    _start_last_seen_flusher()
+
+
+def flush_last_seen():
+    with _last_seen_lock:
+        batch = dict(_last_seen)
+    if not batch:
+        return 0
+
+    def fn(cur):
+        execute_values(cur, """
+            UPDATE users SET last_seen = v.ts
+            FROM (VALUES %s) AS v (uid, ts)
+            WHERE users.uid = v.uid
+              AND (users.last_seen IS NULL OR users.last_seen < v.ts)
+        """, list(batch.items()), template="(%s, %s::timestamp)")
+    _run("flush_last_seen", fn)
+
+    with _last_seen_lock:
+        for uid, ts in batch.items():
+            if _last_seen.get(uid) == ts:
+                del _last_seen[uid]
+    return len(batch)
+
+
+def _start_last_seen_flusher():
+    global _last_seen_flusher
+    if _last_seen_flusher and _last_seen_flusher.is_alive():
+        return
+    with _last_seen_lock:
+        if _last_seen_flusher and _last_seen_flusher.is_alive():
+            return
+        _last_seen_flusher = threading.Thread(
+            target=_last_seen_loop, name="last-seen-flusher", daemon=True
+        )
+        _last_seen_flusher.start()
 
-    events.append({
-        "time": datetime.now().strftime("%d-%m-%Y %H:%M"),
+
+def _last_seen_loop():
+    while True:
+        time.sleep(LAST_SEEN_FLUSH_SECONDS)
+        try:
+            flush_last_seen()
+        except Exception as e:
+            print("⚠️ last_seen flush fejlede – prøver igen:", e)
+
+
+def set_role(uid, role):
+    def fn(cur):
+        cur.execute("UPDATE users SET role = %s WHERE uid = %s", (role, uid))
+        return cur.rowcount > 0
+    return _run("set_role", fn)
+
+
+def set_blocked(uid, blocked):
+    def fn(cur):
+        cur.execute("UPDATE users SET blocked = %s WHERE uid = %s", (blocked, uid))
+        return cur.rowcount > 0
+    return _run("set_blocked", fn)
+
+
+def load_active_users(since):
+    """[(uid, revoked)] for brugere set siden `since` (indeks på last_seen)."""
+    flush_last_seen()
+
+    def fn(cur):
+        cur.execute("SELECT uid, revoked FROM users WHERE last_seen >= %s", (since,))
+        return cur.fetchall()
+    return _run("load_active_users", fn, read=True)
+
+
+def save_role_checks(roles, revoked, when=None):
+    """roles: {uid: [rollenavne]} – revoked: uids der har mistet adgangen."""
+    when = when or datetime.now()
+    revoked = set(revoked)
+    rows = [(uid, r, uid in revoked, when) for uid, r in roles.items()]
+    if not rows:
+        return
+
+    def fn(cur):
+        execute_values(cur, """
+            UPDATE users
+            SET discord_roles = v.roles,
+                roles_checked = v.checked,
+                revoked = users.revoked OR v.revoked
+            FROM (VALUES %s) AS v (uid, roles, revoked, checked)
+            WHERE users.uid = v.uid
+        """, rows, template="(%s, %s::text[], %s, %s::timestamp)")
+    _run("save_role_checks", fn)
+
+
+def load_meta(key, default=None):
+    def fn(cur):
+        cur.execute("SELECT value FROM meta WHERE key = %s", (key,))
+        row = cur.fetchone()
+        return serializer.loads(row[0]) if row and row[0] else default
+    return _run("load_meta", fn, read=True)
+
+
+def save_meta(key, value):
+    _run("save_meta", lambda cur: cur.execute("""
+        INSERT INTO meta (key, value) VALUES (%s, %s)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+    """, (key, serializer.dumps(value))))
+
+
+# =====================
+# AUDIT (HOT + MÅNEDSARKIV)
+# =====================
+# Nye events er rækker i audit_events med et rigtigt tidsstempel. Events
+# ældre end AUDIT_RETENTION_DAYS rulles af archive_audit() op i én
+# gzip-JSONL-blob pr. måned i audit_archive, hvor rækken samtidig er
+# indekset (første/sidste tidspunkt, antal, handlinger). Nye batches
+# lægges bag på blobben som et ekstra gzip-member, så en måned aldrig
+# skal pakkes ud og ind igen. iter_audit() læser hot-rækker og derefter
+# månederne – nyeste først, én blob ad gangen.
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))
+AUDIT_BATCH = 500
+
+
+def audit_event(action, admin, target, when=None):
+    return {
+        "time": when or datetime.now().strftime(TIME_FORMAT),
         "action": action,
         "admin": admin,
         "target": target
-    })
+    }
+
 
-    _insert("audit", events)
+def _audit_row(ev):
+    try:
+        at = datetime.strptime(ev["time"], TIME_FORMAT)
+    except (TypeError, ValueError):
+        at = datetime.now()
+    return at, ev["action"], ev.get("admin"), serializer.dumps(ev.get("target"))
+
+
+def _append_audit(cur, new_events):
+    # én række pr. event – samtidige batches rører aldrig de samme rækker
+    execute_values(cur, """
+        INSERT INTO audit_events (at, action, admin, target) VALUES %s
+    """, [_audit_row(ev) for ev in new_events], template="(%s, %s, %s, %s::jsonb)")
+
+
+@task("audit_log")
+def audit_log(action, admin, target, when=None):
+    _run("audit_log", lambda cur: _append_audit(cur, [audit_event(action, admin, target, when)]))
+
+
+def queue_audit(action, admin, target):
+    # tidspunktet er handlingens – ikke hvornår køen når til den
+    enqueue("audit_log", action, admin, target, datetime.now().strftime(TIME_FORMAT))
+
+
+def _audit_out(at, action, admin, target):
+    return {"time": at.strftime(TIME_FORMAT), "action": action, "admin": admin, "target": target}
+
+
+def pack_audit_month(events):
+    """[(at, action, admin, target)] → ét gzip-member med én JSON-linje pr. event."""
+    lines = b"".join(
+        serializer.dumps_bytes({"at": at.isoformat(), "action": action, "admin": admin, "target": target}) + b"\n"
+        for at, action, admin, target in events
+    )
+    return gzip.compress(lines)
+
+
+def iter_audit_month(raw, start=None, end=None, action=None):
+    """Events i én måneds-blob der matcher – nyeste først.
+
+    Blobben dekomprimeres som stream; kun de matchende events holdes i
+    hukommelsen, fordi de skal vendes.
+    """
+    lo = start.isoformat() if start else None
+    hi = end.isoformat() if end else None
+    matches = []
+    with gzip.open(io.BytesIO(bytes(raw)), "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            ev = serializer.loads(line)
+            if lo and ev["at"] < lo or hi and ev["at"] >= hi:
+                continue
+            if action and ev["action"] != action:
+                continue
+            matches.append(ev)
+    # linjerne ligger i indsættelsesrækkefølge – vend først, så samme minut
+    # også kommer nyeste først (sort er stabil)
+    matches.reverse()
+    matches.sort(key=lambda ev: ev["at"], reverse=True)
+    for ev in matches:
+        yield _audit_out(datetime.fromisoformat(ev["at"]), ev["action"], ev["admin"], ev["target"])
+
+
+def iter_audit(start=None, end=None, action=None):
+    """Yield audit-events nyeste først: hot-rækker, derefter arkivet.
+
+    start/end er datetimes (end eksklusiv), action filtrerer på handling.
+    Stop bare med at læse når siden er fuld – resten hentes aldrig.
+    """
+    params = {"start": start, "end": end, "action": action}
+    conn = get_conn(read=True)
+    try:
+        cur = conn.cursor(name="audit_hot")
+        cur.itersize = AUDIT_BATCH
+        cur.execute("""
+            SELECT at, action, admin, target FROM audit_events
+            WHERE (%(start)s::timestamp IS NULL OR at >= %(start)s)
+              AND (%(end)s::timestamp IS NULL OR at < %(end)s)
+              AND (%(action)s::text IS NULL OR action = %(action)s)
+            ORDER BY at DESC, id DESC
+        """, params)
+        for row in cur:
+            yield _audit_out(*row)
+        cur.close()
+
+        cur = conn.cursor(name="audit_archive")
+        cur.itersize = 1
+        cur.execute("""
+            SELECT data FROM audit_archive
+            WHERE (%(start)s::timestamp IS NULL OR last_at >= %(start)s)
+              AND (%(end)s::timestamp IS NULL OR first_at < %(end)s)
+              AND (%(action)s::text IS NULL OR %(action)s = ANY(actions))
+            ORDER BY month DESC
+        """, params)
+        for (raw,) in cur:
+            yield from iter_audit_month(raw, start, end, action)
+        conn.rollback()
+    finally:
+        release_conn(conn)
 
 
-def load_audit():
-    return _load_latest("audit", [])
+def audit_index():
+    """{"hot": antal, "actions": [...], "months": [{month, events, first, last, bytes}]}"""
+    def fn(cur):
+        cur.execute("SELECT count(*) FROM audit_events")
+        hot = cur.fetchone()[0]
+        cur.execute("""
+            SELECT DISTINCT action FROM audit_events
+            UNION
+            SELECT DISTINCT unnest(actions) FROM audit_archive
+        """)
+        actions = sorted(r[0] for r in cur.fetchall())
+        cur.execute("""
+            SELECT month, events, first_at, last_at, octet_length(data)
+            FROM audit_archive ORDER BY month DESC
+        """)
+        months = [
+            {"month": m.strftime("%Y-%m"), "events": n, "first": f, "last": l, "bytes": size}
+            for m, n, f, l, size in cur.fetchall()
+        ]
+        return {"hot": hot, "actions": actions, "months": months}
+    return _run("audit_index", fn, read=True)
+
+
+def archive_audit(max_age_days=None):
+    """Rul audit-events ældre end max_age_days op i audit_archive → {måned: antal}."""
+    if max_age_days is None:
+        max_age_days = AUDIT_RETENTION_DAYS
+    if max_age_days < 1:
+        raise ValueError(f"max_age_days skal være mindst 1 (fik {max_age_days})")
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+
+    def fn(cur):
+        cur.execute("""
+            DELETE FROM audit_events WHERE at < %s
+            RETURNING id, at, action, admin, target
+        """, (cutoff,))
+        months = {}
+        for _, at, action, admin, target in sorted(cur.fetchall(), key=lambda r: (r[1], r[0])):
+            months.setdefault(at.date().replace(day=1), []).append((at, action, admin, target))
+
+        for month, events in sorted(months.items()):
+            cur.execute("""
+                INSERT INTO audit_archive (month, first_at, last_at, events, actions, data)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (month) DO UPDATE SET
+                    first_at = LEAST(audit_archive.first_at, EXCLUDED.first_at),
+                    last_at = GREATEST(audit_archive.last_at, EXCLUDED.last_at),
+                    events = audit_archive.events + EXCLUDED.events,
+                    actions = ARRAY(
+                        SELECT DISTINCT a FROM unnest(audit_archive.actions || EXCLUDED.actions) a ORDER BY a
+                    ),
+                    data = audit_archive.data || EXCLUDED.data
+            """, (
+                month,
+                events[0][0],
+                events[-1][0],
+                len(events),
+                sorted({ev[1] for ev in events}),
+                psycopg2.Binary(pack_audit_month(events))
+            ))
+        return {m.strftime("%Y-%m"): len(evs) for m, evs in sorted(months.items())}
+
+    moved = _run("archive_audit", fn)
+    if moved:
+        print(f"🗄️ {sum(moved.values())} audit-events arkiveret ({', '.join(moved)})")
+    return moved
 
 # =====================
 # HELPERS
@@ -341,7 +1905,7 @@ def new_order(user, items, user_id=None):
         "user_id": user_id,
         "items": items,
         "total": 0,
-        "time": datetime.now().strftime("%d-%m-%Y %H:%M")
+        "time": datetime.now().strftime(TIME_FORMAT)
     }
 
 
@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+import requests
+
+import metrics
+from db import load_active_users, save_role_checks, primary_reads, queue_audit, TIME_FORMAT
+
+# =====================
+# DISCORD ROLLE-REVALIDERING
+# =====================
+# Roller tjekkes kun i auth_callback. Denne baggrundsjob henter med
+# bot-tokenet alle guild-medlemmer i bulk (1000 pr. kald) og sammenholder
+# dem med aktive brugere i users-tabellen:
+#
+#   - har brugeren stadig DISCORD_USER_ROLE / DISCORD_ADMIN_ROLE → roller gemmes
+#   - er rollen fjernet / brugeren forladt serveren → "revoked": True
+#
+# En tilbagekaldt bruger logges ud af enforce_blocked og kommer først ind
+# igen efter et nyt login, hvor auth_callback tjekker rollerne forfra.
+# Fejler et Discord-kald undervejs, tilbagekaldes ingen i den runde.
+
+DISCORD_API = os.getenv("DISCORD_API_BASE", "https://discord.com/api").rstrip("/")
+DISCORD_GUILD_ID = os.getenv("DISCORD_GUILD_ID")
+DISCORD_ADMIN_ROLE = os.getenv("DISCORD_ADMIN_ROLE")
+DISCORD_USER_ROLE = os.getenv("DISCORD_USER_ROLE")
+DISCORD_BOT_TOKEN = os.getenv("DISCORD_TOKEN")
+
+ROLE_SYNC_SECONDS = float(os.getenv("ROLE_SYNC_SECONDS", "900"))   # 0 = slået fra
+ROLE_ACTIVE_DAYS = int(os.getenv("ROLE_ACTIVE_DAYS", "30"))
+MEMBERS_PAGE = 1000
+MAX_RATE_LIMIT_WAIT = 60.0
+
+DISCORD_CALLS = metrics.Counter(
+    "bestilling_discord_calls_total",
+    "Discord API calls by route and status",
+    ("route", "status")
+)
+DISCORD_RATE_LIMITED = metrics.Counter(
+    "bestilling_discord_rate_limited_seconds_total",
+    "Seconds spent waiting on Discord rate limits"
+)
+ROLE_SYNC_LAST = metrics.Gauge(
+    "bestilling_role_sync_last_success_timestamp",
+    "Unix time of the last successful role sync"
+)
+ROLE_SYNC_REVOKED = metrics.Counter(
+    "bestilling_role_sync_revoked_total",
+    "Users revoked because their access role was removed"
+)
+
+
+class DiscordError(Exception):
+    pass
+
+
+class DiscordClient:
+    def __init__(self, token=DISCORD_BOT_TOKEN, base=DISCORD_API, sleep=time.sleep):
+        self.base = base
+        self.http = requests.Session()
+        self.http.headers["Authorization"] = f"Bot {token}"
+        self.sleep = sleep
+        # bucket-grænser fra sidste svar: pause før næste kald hvis den er brugt op
+        self._reset_at = 0.0
+
+    def _wait(self, seconds):
+        seconds = min(max(seconds, 0.0), MAX_RATE_LIMIT_WAIT)
+        if seconds > 0:
+            DISCORD_RATE_LIMITED.inc(seconds)
+            self.sleep(seconds)
+
+    def get(self, route, path, params=None, attempts=5):
+        for _ in range(attempts):
+            self._wait(self._reset_at - time.monotonic())
+
+            r = self.http.get(self.base + path, params=params, timeout=10)
+            DISCORD_CALLS.inc(route=route, status=r.status_code)
+
+            if r.headers.get("X-RateLimit-Remaining") == "0":
+                reset_after = float(r.headers.get("X-RateLimit-Reset-After", 1))
+                self._reset_at = time.monotonic() + reset_after
+
+            if r.status_code == 429:
+                try:
+                    retry_after = float(r.json().get("retry_after", 1))
+                except ValueError:
+                    retry_after = float(r.headers.get("Retry-After", 1))
+                print(f"⏳ Discord rate limit på {route} – venter {retry_after:.2f}s")
+                self._wait(retry_after)
+                continue
+
+            if r.status_code != 200:
+                raise DiscordError(f"{route}: HTTP {r.status_code}")
+            return r.json()
+
+        raise DiscordError(f"{route}: stadig rate-limited efter {attempts} forsøg")
+
+    def role_map(self, guild_id):
+        return {r["id"]: r["name"] for r in self.get("roles", f"/guilds/{guild_id}/roles")}
+
+    def members(self, guild_id):
+        """Alle medlemmer, pagineret med ?after=<højeste user-id>."""
+        after = "0"
+        while True:
+            page = self.get(
+                "members",
+                f"/guilds/{guild_id}/members",
+                {"limit": MEMBERS_PAGE, "after": after}
+            )
+            for m in page:
+                yield m
+            if len(page) < MEMBERS_PAGE:
+                return
+            after = max((m["user"]["id"] for m in page), key=int)
+
+
+def revalidate(client=None, guild_id=DISCORD_GUILD_ID, active_days=ROLE_ACTIVE_DAYS):
+    """Én rund: hent roller for aktive brugere og tilbagekald dem uden adgang."""
+    client = client or DiscordClient()
+    allowed = {DISCORD_USER_ROLE, DISCORD_ADMIN_ROLE} - {None}
+
+    # Discord først – brugerne læses først lige før vi skriver
+    role_map = client.role_map(guild_id)
+    members = {
+        m["user"]["id"]: [role_map.get(r, r) for r in m.get("roles", [])]
+        for m in client.members(guild_id)
+    }
+
+    now = datetime.now()
+
+    with primary_reads():
+        active = load_active_users(now - timedelta(days=active_days))
+
+    roles = {}
+    revoked = []
+    for uid, already_revoked in active:
+        if already_revoked:
+            continue
+        user_roles = members.get(uid)
+        roles[uid] = user_roles or []
+        if user_roles is None or not allowed.intersection(user_roles):
+            revoked.append(uid)
+
+    save_role_checks(roles, revoked, now)
+    checked = len(roles)
+
+    for uid in revoked:
+        ROLE_SYNC_REVOKED.inc()
+        queue_audit("revoke_access", "role-sync", uid)
+    ROLE_SYNC_LAST.set(int(time.time()))
+
+    print(f"🔄 Roller tjekket for {checked} aktive bruger(e) – {len(revoked)} tilbagekaldt")
+    return revoked
+
+
+# =====================
+# BAGGRUNDSTRÅD
+# =====================
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def enabled():
+    return bool(ROLE_SYNC_SECONDS > 0 and DISCORD_BOT_TOKEN and DISCORD_GUILD_ID)
+
+
+def start():
+    global _thread
+    if _thread is not None or not enabled():
+        return
+    with _thread_lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_loop, name="role-sync", daemon=True)
+        _thread.start()
+
+
+def _loop():
+    client = DiscordClient()
+    while True:
+        time.sleep(ROLE_SYNC_SECONDS)
+        try:
+            revalidate(client)
+        except Exception as e:
+            print("🔄 Rolle-sync fejlede – prøver igen næste runde:", e)
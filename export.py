@@ -0,0 +1,73 @@
+import io
+import csv
+
+import serializer
+
+# =====================
+# EKSPORT AF ORDRER (CSV / JSONL)
+# =====================
+# Rækkerne kommer fra db.iter_session_orders og skrives ud i små bidder,
+# så en eksport af alle sessions kører i konstant hukommelse.
+
+FLUSH_ROWS = 200
+
+BASE_COLUMNS = ["session", "id", "time", "user", "user_id", "total", "paid", "delivered"]
+
+
+def _items_text(items):
+    return "; ".join(f"{item}={amount}" for item, amount in items.items() if amount > 0)
+
+
+def csv_rows(orders, item_columns=None):
+    """Yield CSV-tekst. item_columns=[...] → én kolonne pr. vare, ellers én "items"-kolonne."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    header = BASE_COLUMNS + (list(item_columns) + ["other_items"] if item_columns else ["items"])
+    writer.writerow(header)
+
+    known = set(item_columns or ())
+    n = 0
+    for session, o in orders:
+        items = o.get("items") or {}
+        row = [
+            session,
+            o.get("id"),
+            o.get("time"),
+            o.get("user"),
+            o.get("user_id"),
+            o.get("total") or 0,
+            int(bool(o.get("paid"))),
+            int(bool(o.get("delivered")))
+        ]
+        if item_columns:
+            row += [items.get(item, 0) for item in item_columns]
+            row.append(_items_text({k: v for k, v in items.items() if k not in known}))
+        else:
+            row.append(_items_text(items))
+        writer.writerow(row)
+
+        n += 1
+        if n % FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    yield buf.getvalue()
+
+
+def jsonl_rows(orders):
+    chunk = []
+    for session, o in orders:
+        chunk.append(serializer.dumps({"session": session, **o}))
+        if len(chunk) >= FLUSH_ROWS:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
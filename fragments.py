@@ -0,0 +1,113 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+import bus
+import metrics
+import serializer
+
+# =====================
+# FRAGMENT-CACHE (RENDERET HTML)
+# =====================
+# Tunge dele af session.html og index.html (ordretabel, lagerstatus,
+# totaler) renderes én gang pr. (session, fragment, revision, rolle) og
+# deles af alle der ser den samme version. Revisionen er en hash af
+# ordrerne, så en ændret session aldrig giver et forældet fragment –
+# "session_changed" på bussen smider de gamle versioner ud med det samme,
+# og resten holdes under FRAGMENT_CACHE_MB med LRU.
+
+FRAGMENT_CACHE_MB = float(os.getenv("FRAGMENT_CACHE_MB", "16"))
+
+FRAGMENT_HITS = metrics.Counter(
+    "bestilling_fragment_cache_hits_total",
+    "Rendered fragments served from cache",
+    ("fragment",)
+)
+FRAGMENT_MISSES = metrics.Counter(
+    "bestilling_fragment_cache_misses_total",
+    "Fragments rendered because no cached version existed",
+    ("fragment",)
+)
+FRAGMENT_EVICTIONS = metrics.Counter(
+    "bestilling_fragment_cache_evictions_total",
+    "Fragments dropped from the cache",
+    ("reason",)
+)
+FRAGMENT_BYTES = metrics.Gauge("bestilling_fragment_cache_bytes", "Size of cached fragments")
+
+
+def revision(value):
+    """Kort hash af et JSON-objekt – samme som /session_data sender til klienten."""
+    # sort_keys: JSONB og et dokument rettet i hukommelsen (fx med ventende
+    # journal-operationer) har samme indhold i forskellig nøgleorden
+    return hashlib.md5(serializer.dumps_bytes(value, sort_keys=True)).hexdigest()
+
+
+class FragmentCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()     # (session, fragment, ...) → html
+        self.by_session = {}             # session → {nøgler}
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key, reason):
+        html = self.entries.pop(key)
+        self.size -= len(html)
+        keys = self.by_session.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_session[key[0]]
+        FRAGMENT_EVICTIONS.inc(reason=reason)
+
+    def get_or_render(self, key, render):
+        """key = (session, fragment, ...). render() kaldes kun ved miss."""
+        with self._lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+        if html is not None:
+            FRAGMENT_HITS.inc(fragment=key[1])
+            return Markup(html)
+
+        FRAGMENT_MISSES.inc(fragment=key[1])
+        html = render()
+
+        with self._lock:
+            if key not in self.entries and len(html) <= self.max_bytes:
+                self.entries[key] = html
+                self.by_session.setdefault(key[0], set()).add(key)
+                self.size += len(html)
+                while self.size > self.max_bytes:
+                    self._drop(next(iter(self.entries)), "lru")
+            FRAGMENT_BYTES.set(self.size)
+        return Markup(html)
+
+    def evict_session(self, name):
+        with self._lock:
+            for key in list(self.by_session.get(name, ())):
+                self._drop(key, "changed")
+            FRAGMENT_BYTES.set(self.size)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.by_session.clear()
+            self.size = 0
+            FRAGMENT_BYTES.set(0)
+
+
+cache = FragmentCache(int(FRAGMENT_CACHE_MB * 1024 * 1024))
+
+
+def _on_session_changed(data):
+    name = (data or {}).get("session")
+    if name:
+        cache.evict_session(name)
+
+
+bus.subscribe("session_changed", _on_session_changed)
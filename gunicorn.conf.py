@@ -0,0 +1,47 @@
+import os
+
+# =====================
+# GUNICORN (PRODUKTION)
+# =====================
+#   gunicorn -c gunicorn.conf.py web:app
+#
+# Flere eventlet-workers, hver med mange samtidige greenlets. Socket.IO
+# kører kun over websocket når WEB_CONCURRENCY > 1 (se web.py), så en
+# forbindelse bliver på den worker der tog imod den – long-polling ville
+# kræve en sticky load balancer foran gunicorn. Emits og cache-
+# invalidering deles mellem workers via MESSAGE_QUEUE (bus.py).
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# web.py læser den for at vælge Socket.IO-transporter
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+if workers > 1 and not os.getenv("MESSAGE_QUEUE"):
+    print("⚠️ Flere workers uden MESSAGE_QUEUE – emits og invalidering når kun egen worker")
+# eventlet-workeren findes ikke længere i gunicorn 26 (requirements: gunicorn<26)
+worker_class = "eventlet"
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "500"))
+timeout = 60
+graceful_timeout = 20
+keepalive = 5
+accesslog = "-" if os.getenv("ACCESS_LOG") else None
+
+
+def post_worker_init(worker):
+    # hver worker har sin egen pool – init_db er ét SELECT når schemaet er aktuelt
+    from db import init_db, make_green
+    from bus import bus
+    from journal import journal
+    from tasks import queue
+
+    make_green()
+    if os.getenv("DATABASE_URL"):
+        try:
+            init_db()
+        except Exception as e:
+            print("❌ init_db fejlede i worker:", e)
+    # ændringer der ikke nåede Postgres før sidste stop skrives nu
+    journal.open()
+    # … og opgaver der lå i spool (audit, broadcasts) køres igen
+    queue.start()
+    bus.start()
@@ -0,0 +1,231 @@
+import os
+import re
+import sys
+import time
+import threading
+
+import metrics
+import serializer
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - ikke-POSIX
+    fcntl = None
+
+# =====================
+# WRITE-AHEAD JOURNAL
+# =====================
+# Hver ændring skrives først som én linje i en lokal JSONL-fil (flush +
+# fsync). Derefter skrives til Postgres – lykkes det ikke, ligger posten
+# i journalen og en baggrundstråd gentager, også efter genstart.
+#
+# Linjer:  {"seq": 7, "kind": "sessions", "data": {"ops": [...]}}
+#          {"flushed": 7, "kind": "sessions"}
+# En post er en lille ændring (fx "ordre X er betalt"), ikke hele
+# dokumentet. Alle ventende poster pr. kind skrives i rækkefølge i ét
+# batch af writer'en, som afspiller dem mod det nyeste i Postgres – så
+# en proces med en gammel kopi aldrig overskriver andres skrivninger.
+#
+# Filen åbnes kun i processer der skriver (første append eller open()
+# ved opstart) – scripts der bare læser via db.py rører den ikke.
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")
+JOURNAL_NAME = os.getenv(
+    "JOURNAL_NAME",
+    # web.py → "web", bot.py → "bot", gunicorn → "gunicorn"
+    re.sub(r"\W", "", os.path.splitext(os.path.basename(sys.argv[0] or ""))[0]) or "app"
+)
+JOURNAL_FLUSH_SECONDS = float(os.getenv("JOURNAL_FLUSH_SECONDS", "1"))
+# ack efter fsync og lad baggrundstråden skrive til Postgres
+JOURNAL_ASYNC = os.getenv("JOURNAL_ASYNC", "").lower() in ("1", "true", "yes")
+
+JOURNAL_PENDING = metrics.Gauge(
+    "bestilling_journal_pending",
+    "Journal entries not yet written to Postgres",
+    ("kind",)
+)
+JOURNAL_APPENDS = metrics.Counter(
+    "bestilling_journal_appends_total",
+    "Journal entries appended",
+    ("kind",)
+)
+JOURNAL_FLUSHES = metrics.Counter(
+    "bestilling_journal_flushes_total",
+    "Journal flush attempts",
+    ("kind", "result")
+)
+
+
+def open_locked(directory, name):
+    """Åbn <name>[-n].jsonl med eksklusiv lås – flere processer får hver sin fil."""
+    os.makedirs(directory, exist_ok=True)
+
+    for i in range(16):
+        suffix = "" if i == 0 else f"-{i}"
+        path = os.path.join(directory, f"{name}{suffix}.jsonl")
+        f = open(path, "a+b")
+        if fcntl is None:
+            return path, f
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return path, f
+        except OSError:
+            f.close()
+
+    raise RuntimeError(f"❌ Ingen ledig journal-fil for {name}")
+
+
+def fsync_line(f, rec):
+    f.write(serializer.dumps_bytes(rec) + b"\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class Journal:
+    def __init__(self, directory=JOURNAL_DIR, name=JOURNAL_NAME):
+        self.directory = directory
+        self.name = name
+        self.path = None
+        self.f = None
+        self.seq = 0
+        self.pending = {}    # kind → [(seq, data)] i rækkefølge – ikke skrevet endnu
+        self.writers = {}    # kind → funktion([data, ...]) der skriver til Postgres
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._flusher = None
+
+    # ---- fil ----
+    def open(self):
+        """Åbn filen og genoptag det der ikke nåede Postgres før sidste stop."""
+        with self._lock:
+            if self.f is not None:
+                return
+            self.path, self.f = open_locked(self.directory, self.name)
+            self._replay()
+        if self.pending:
+            self.start_flusher()
+
+    def _replay(self):
+        self.f.seek(0)
+        entries = {}
+        flushed = {}
+        for line in self.f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = serializer.loads(line)
+            except ValueError:
+                # afkortet sidste linje efter et nedbrud midt i en skrivning
+                print("⚠️ Ødelagt journal-linje ignoreret i", self.path)
+                continue
+            if "flushed" in rec:
+                flushed[rec["kind"]] = max(flushed.get(rec["kind"], 0), rec["flushed"])
+            else:
+                self.seq = max(self.seq, rec["seq"])
+                entries.setdefault(rec["kind"], []).append((rec["seq"], rec["data"]))
+
+        for kind, items in entries.items():
+            waiting = [(seq, data) for seq, data in items if seq > flushed.get(kind, 0)]
+            if waiting:
+                self.pending[kind] = waiting
+                JOURNAL_PENDING.set(len(waiting), kind=kind)
+
+        self.f.seek(0, os.SEEK_END)
+        if self.pending:
+            print(f"📒 Journal {self.path}: {self.pending_count()} ændring(er) venter på Postgres")
+
+    def _write_line(self, rec):
+        fsync_line(self.f, rec)
+
+    # ---- API ----
+    def register(self, kind, writer):
+        self.writers[kind] = writer
+
+    def append(self, kind, data):
+        with self._lock:
+            self.open()
+            self.seq += 1
+            seq = self.seq
+            self._write_line({"seq": seq, "kind": kind, "data": data})
+            waiting = self.pending.setdefault(kind, [])
+            waiting.append((seq, data))
+            JOURNAL_PENDING.set(len(waiting), kind=kind)
+        JOURNAL_APPENDS.inc(kind=kind)
+        return seq
+
+    def mark_flushed(self, kind, seq):
+        with self._lock:
+            waiting = [(s, d) for s, d in self.pending.get(kind, []) if s > seq]
+            if waiting:
+                self.pending[kind] = waiting
+            else:
+                self.pending.pop(kind, None)
+            JOURNAL_PENDING.set(len(waiting), kind=kind)
+            if self.pending:
+                self._write_line({"flushed": seq, "kind": kind})
+            else:
+                self._compact()
+
+    def _compact(self):
+        # alt er skrevet → start forfra, så filen ikke vokser
+        # (en tom fil betyder "intet venter" – ingen flushed-linje nødvendig)
+        self.f.truncate(0)
+        self.f.seek(0)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def waiting(self, kind):
+        """Ventende poster for kind, ældste først (data deles – må ikke ændres)."""
+        with self._lock:
+            return [data for _, data in self.pending.get(kind, ())]
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(v) for v in self.pending.values())
+
+    def write(self, kind):
+        """Skriv alt ventende for kind i ét kald til writer'en.
+
+        Én skrivning ad gangen pr. proces, så rækkefølgen holder. Fejler
+        writer'en, bliver posterne liggende og fejlen kastes videre.
+        """
+        with self._write_lock:
+            with self._lock:
+                batch = list(self.pending.get(kind, ()))
+            if not batch:
+                return
+            try:
+                self.writers[kind]([data for _, data in batch])
+            except Exception:
+                JOURNAL_FLUSHES.inc(kind=kind, result="error")
+                raise
+            JOURNAL_FLUSHES.inc(kind=kind, result="ok")
+            self.mark_flushed(kind, batch[-1][0])
+
+    # ---- baggrunds-flush ----
+    def flush(self):
+        for kind in list(self.pending):
+            if kind not in self.writers:
+                continue
+            try:
+                self.write(kind)
+            except Exception as e:
+                print(f"📒 Journal flush af {kind} fejlede – prøver igen:", e)
+
+    def start_flusher(self):
+        if self._flusher and self._flusher.is_alive():
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(JOURNAL_FLUSH_SECONDS)
+            if self.pending:
+                self.flush()
+            elif not JOURNAL_ASYNC:
+                return  # synkron tilstand: tråden behøves kun mens noget venter
+
+
+journal = Journal()
@@ -0,0 +1,116 @@
+import json
+
+# =====================
+# STREAMING JSON
+# =====================
+# Dekoder store JSON-dokumenter én værdi ad gangen fra et fil-objekt
+# (tekst), så hele dokumentet aldrig ligger i hukommelsen.
+CHUNK_SIZE = 1 << 16
+
+
+class Reader:
+    """Læser en JSON-fil bid for bid og dekoder én værdi ad gangen."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, at_least=CHUNK_SIZE):
+        if self.eof:
+            return False
+        # smid allerede læst data væk, så bufferen ikke vokser
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(max(at_least, CHUNK_SIZE))
+        if not chunk:
+            self.eof = True
+            return False
+        self.bytes += len(chunk.encode("utf-8"))
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"forventede {ch!r} ved position {self.bytes - len(self.buf) + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # et tal/literal der slutter ved bufferens ende kan være afkortet
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(len(self.buf))
+
+
+def iter_keys(reader):
+    """Yield hver nøgle i objektet. Kalderen læser værdien før næste nøgle."""
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key
+        if reader.peek() == ",":
+            reader.expect(",")
+            continue
+        reader.expect("}")
+        return
+
+
+def iter_members(reader, path=()):
+    """Yield (nøgle, værdi) for objektet – eller (index, værdi) for arrayet – ved path."""
+    ch = reader.peek()
+
+    if ch == "" and not path:
+        return  # tom fil
+
+    if ch == "{":
+        for key in iter_keys(reader):
+            if not path:
+                yield key, reader.value()
+            elif key == path[0]:
+                yield from iter_members(reader, path[1:])
+            else:
+                reader.value()  # spring over
+        return
+
+    if ch == "[":
+        if path:
+            raise ValueError(f"sti {path} findes ikke (array)")
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.expect("]")
+            return
+        i = 0
+        while True:
+            yield i, reader.value()
+            i += 1
+            if reader.peek() == ",":
+                reader.expect(",")
+                continue
+            reader.expect("]")
+            return
+
+    raise ValueError(f"uventet tegn {ch!r} – forventede objekt eller array")
@@ -0,0 +1,256 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# =====================
+# METRICS (PROMETHEUS TEKSTFORMAT)
+# =====================
+# Simpelt in-process register – ingen ekstra afhængigheder.
+# Per-request tællere ligger i en ContextVar, så de følger den
+# enkelte request / greenlet / asyncio-task.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(n, "")) for n in labelnames)
+
+
+def _fmt_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(n, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for n, v in pairs
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        with _lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        for key, v in sorted(self.values.items()):
+            yield self.name, _fmt_labels(self.labelnames, key), v
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self.values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        with _lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        for key, (counts, count, total) in sorted(self.values.items()):
+            for bound, c in zip(self.buckets, counts):
+                yield (
+                    self.name + "_bucket",
+                    _fmt_labels(self.labelnames, key, ("le", repr(float(bound)))),
+                    c
+                )
+            yield self.name + "_bucket", _fmt_labels(self.labelnames, key, ("le", "+Inf")), count
+            yield self.name + "_count", _fmt_labels(self.labelnames, key), count
+            yield self.name + "_sum", _fmt_labels(self.labelnames, key), total
+
+
+def render():
+    """Alle metrics i Prometheus' tekstformat (text/plain; version=0.0.4)."""
+    lines = []
+    with _lock:
+        metrics = list(_registry)
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for name, labels, value in list(m.samples()):
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# =====================
+# STANDARD METRICS
+# =====================
+REQUEST_LATENCY = Histogram(
+    "bestilling_request_seconds",
+    "Request latency per route",
+    ("route", "method", "status")
+)
+REQUEST_DB_ROUNDTRIPS = Histogram(
+    "bestilling_request_db_roundtrips",
+    "DB round trips per request",
+    ("route",),
+    buckets=COUNT_BUCKETS
+)
+REQUEST_DB_RETRIES = Histogram(
+    "bestilling_request_db_retries",
+    "DB retries per request",
+    ("route",),
+    buckets=COUNT_BUCKETS
+)
+REQUEST_POOL_WAIT = Histogram(
+    "bestilling_request_pool_wait_seconds",
+    "Time spent waiting for a pool connection per request",
+    ("route",)
+)
+
+DB_ROUNDTRIPS = Counter(
+    "bestilling_db_roundtrips_total",
+    "DB round trips",
+    ("op",)
+)
+DB_RETRIES = Counter(
+    "bestilling_db_retries_total",
+    "DB retries after connection errors",
+    ("op",)
+)
+DB_ERRORS = Counter(
+    "bestilling_db_errors_total",
+    "DB calls that gave up",
+    ("op",)
+)
+DB_LATENCY = Histogram(
+    "bestilling_db_seconds",
+    "DB call latency",
+    ("op",)
+)
+DB_READS = Counter(
+    "bestilling_db_reads_total",
+    "Read connections handed out per target",
+    ("target",)
+)
+REPLICA_LAG = Gauge(
+    "bestilling_db_replica_lag_seconds",
+    "Last measured replica replay lag"
+)
+POOL_WAIT = Histogram(
+    "bestilling_db_pool_wait_seconds",
+    "Time spent in get_conn"
+)
+
+
+# =====================
+# PER-REQUEST SCOPE
+# =====================
+_current = ContextVar("bestilling_request_metrics", default=None)
+
+
+def start_request():
+    scope = {"start": time.perf_counter(), "roundtrips": 0, "retries": 0, "pool_wait": 0.0}
+    _current.set(scope)
+    return scope
+
+
+def finish_request(route, method, status):
+    scope = _current.get()
+    if scope is None:
+        return
+    _current.set(None)
+
+    REQUEST_LATENCY.observe(
+        time.perf_counter() - scope["start"],
+        route=route, method=method, status=status
+    )
+    REQUEST_DB_ROUNDTRIPS.observe(scope["roundtrips"], route=route)
+    REQUEST_DB_RETRIES.observe(scope["retries"], route=route)
+    REQUEST_POOL_WAIT.observe(scope["pool_wait"], route=route)
+
+
+@contextmanager
+def request_scope(route, method):
+    """Til kode uden for Flask (fx bot.on_message)."""
+    start_request()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        finish_request(route, method, status)
+
+
+# =====================
+# DB HOOKS
+# =====================
+def db_roundtrip(op, seconds):
+    DB_ROUNDTRIPS.inc(op=op)
+    DB_LATENCY.observe(seconds, op=op)
+    scope = _current.get()
+    if scope is not None:
+        scope["roundtrips"] += 1
+
+
+def db_retry(op):
+    DB_RETRIES.inc(op=op)
+    scope = _current.get()
+    if scope is not None:
+        scope["retries"] += 1
+
+
+def db_error(op):
+    DB_ERRORS.inc(op=op)
+
+
+def db_read(target):
+    DB_READS.inc(target=target)
+
+
+def pool_wait(seconds):
+    POOL_WAIT.observe(seconds)
+    scope = _current.get()
+    if scope is not None:
+        scope["pool_wait"] += seconds
@@ -1,61 +1,368 @@
-import json
+"""Import af de gamle JSON-filer til Postgres.
+
+    python migrate_postgres.py                  # alle filer i DATA_DIR
+    python migrate_postgres.py --dry-run        # parse + tæl, skriv intet
+    python migrate_postgres.py --only sessions,audit
+    python migrate_postgres.py --archive-closed # lukkede sessions direkte i arkivet
+
+Filerne læses som stream (ét medlem ad gangen) i stedet for json.load,
+hver tabel skrives i sin egen transaktion, og eksisterende data i
+databasen flettes med filens indhold. Audit-events har ingen nøgle at
+flette på, så audit.json importeres kun når der ingen events er i
+forvejen – importen kan køres igen uden dubletter.
+"""
 import os
-from db import get_conn, init_db
+import sys
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
 
-init_db()
+from psycopg2.extras import execute_values
+
+import serializer
+from jsonstream import Reader, iter_keys, iter_members
+from db import (
+    get_conn,
+    release_conn,
+    init_db,
+    _pack,
+    _read_sessions_cur,
+    _write_sessions_cur,
+    SESSIONS_LOCK,
+    TIME_FORMAT
+)
 
 DATA_DIR = os.getenv("DATA_DIR", ".")
-LAGER_FILE = os.path.join(DATA_DIR, "lager.json")
-PRICES_FILE = os.path.join(DATA_DIR, "prices.json")
-
-def migrate_lager():
-    if not os.path.exists(LAGER_FILE):
-        print("❌ lager.json findes ikke")
-        return
-
-    with open(LAGER_FILE, "r", encoding="utf-8") as f:
-        lager = json.load(f)
-
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            for item, amount in lager.items():
-                c.execute(
-                    """
-                    INSERT INTO lager (item, amount)
-                    VALUES (%s, %s)
-                    ON CONFLICT (item)
-                    DO UPDATE SET amount = EXCLUDED.amount
-                    """,
-                    (item, amount)
-                )
-        conn.commit()
-
-    print(f"✅ Migreret {len(lager)} varer til lager")
-
-def migrate_prices():
-    if not os.path.exists(PRICES_FILE):
-        print("❌ prices.json findes ikke")
-        return
-
-    with open(PRICES_FILE, "r", encoding="utf-8") as f:
-        prices = json.load(f)
-
-    with get_conn() as conn:
-        with conn.cursor() as c:
-            for item, price in prices.items():
-                c.execute(
-                    """
-                    INSERT INTO prices (item, price)
-                    VALUES (%s, %s)
-                    ON CONFLICT (item)
-                    DO UPDATE SET price = EXCLUDED.price
-                    """,
-                    (item, price)
-                )
-        conn.commit()
-
-    print(f"✅ Migreret {len(prices)} priser")
+PAGE_SIZE = 500
+
+
+# =====================
+# STREAMING AF FILERNE
+# =====================
+_bytes_read = 0
+
+
+@contextmanager
+def stream(path):
+    """Åbn en fil som Reader og tæl læste bytes til rapporten."""
+    global _bytes_read
+    with open(path, "r", encoding="utf-8") as f:
+        reader = Reader(f)
+        try:
+            yield reader
+        finally:
+            _bytes_read += reader.bytes
+
+
+# =====================
+# PARSE AF FILERNE
+# =====================
+def _path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def read_dict(name):
+    with stream(_path(name)) as reader:
+        return dict(iter_members(reader))
+
+
+def read_sessions():
+    """sessions.json + sessions/<navn>.json (gamle ordrelister pr. session)."""
+    current = None
+    sessions = {}
+
+    if os.path.exists(_path("sessions.json")):
+        with stream(_path("sessions.json")) as reader:
+            for key in iter_keys(reader):
+                if key == "current":
+                    current = reader.value()
+                elif key == "sessions":
+                    # én session ad gangen
+                    for name, s in iter_members(reader):
+                        sessions[name] = s
+                else:
+                    reader.value()
+
+    session_dir = _path("sessions")
+    if os.path.isdir(session_dir):
+        for fname in sorted(os.listdir(session_dir)):
+            if not fname.endswith(".json"):
+                continue
+            name = fname[:-5]
+            s = sessions.setdefault(name, {"open": False, "orders": []})
+            orders = s.setdefault("orders", [])
+            known = {o.get("id") for o in orders}
+            with stream(os.path.join(session_dir, fname)) as reader:
+                for _, o in iter_members(reader):
+                    if o.get("id") not in known:
+                        orders.append(o)
+
+    for s in sessions.values():
+        s.setdefault("open", False)
+        s.setdefault("orders", [])
+        s.setdefault("locked_users", [])
+
+    return current, sessions
+
+
+def read_access():
+    users, blocked = {}, []
+    with stream(_path("access.json")) as reader:
+        for key in iter_keys(reader):
+            if key == "users":
+                users.update(iter_members(reader))
+            elif key == "blocked":
+                blocked.extend(uid for _, uid in iter_members(reader))
+            else:
+                reader.value()
+    return users, blocked
+
+
+def read_audit():
+    """audit.json er enten en liste eller {"events": [...]} – yield ét event ad gangen."""
+    with stream(_path("audit.json")) as reader:
+        path = ("events",) if reader.peek() == "{" else ()
+        for _, e in iter_members(reader, path):
+            if isinstance(e, dict):
+                yield e
+
+
+# =====================
+# SKRIVNING
+# =====================
+def _latest(cur, table, default):
+    cur.execute(f"SELECT data FROM {table} ORDER BY id DESC LIMIT 1 FOR UPDATE")
+    row = cur.fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def _parse_time(value):
+    try:
+        return datetime.strptime(value, TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_doc(cur, table, data):
+    cur.execute(f"INSERT INTO {table} (data) VALUES (%s)", (serializer.dumps(data),))
+
+
+class Importer:
+    def __init__(self, dry_run=False, archive_closed=False, page_size=PAGE_SIZE):
+        self.dry_run = dry_run
+        self.archive_closed = archive_closed
+        self.page_size = page_size
+        self.report = []
+
+    def _run(self, table, fn):
+        """Én transaktion pr. tabel – rulles tilbage ved dry-run eller fejl."""
+        global _bytes_read
+        _bytes_read = 0
+        started = time.perf_counter()
+
+        if self.dry_run:
+            records = fn(None)
+        else:
+            conn = get_conn()
+            try:
+                cur = conn.cursor()
+                records = fn(cur)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                release_conn(conn)
+
+        secs = max(time.perf_counter() - started, 1e-9)
+        self.report.append((table, records, _bytes_read, secs))
+        print(f"{'🔎' if self.dry_run else '✅'} {table:<12} {records:>8} poster  "
+              f"{_bytes_read / 1e6:>7.2f} MB  {secs:>6.2f} s  "
+              f"{records / secs:>10.0f} poster/s")
+
+    # ---- tabeller ----
+    def _merge_doc(self, table):
+        """Filens varer oven i databasens – varer der kun findes i DB'en bliver."""
+        def fn(cur):
+            items = read_dict(f"{table}.json")
+            if cur:
+                doc = _latest(cur, table, {})
+                doc.update(items)
+                _write_doc(cur, table, doc)
+            return len(items)
+        self._run(table, fn)
+
+    def lager(self):
+        self._merge_doc("lager")
+
+    def prices(self):
+        self._merge_doc("prices")
+
+    def sessions(self):
+        def fn(cur):
+            current, sessions = read_sessions()
+            records = sum(len(s["orders"]) for s in sessions.values())
+            if not cur:
+                return records
+
+            # samme lås som live-skrivere (db._apply_session_ops) – ellers
+            # overskriver importen ordrer der gemmes mens den kører
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (SESSIONS_LOCK,))
+            existing = _read_sessions_cur(cur)
+            merged = existing["sessions"]
+
+            archive_rows = []
+            for name, s in sessions.items():
+                if name in merged:
+                    continue
+                if self.archive_closed and not s["open"] and name != current:
+                    s.setdefault("closed_at", datetime.now().strftime(TIME_FORMAT))
+                    user_ids = sorted({o["user_id"] for o in s["orders"] if o.get("user_id")})
+                    archive_rows.append((
+                        name,
+                        datetime.strptime(s["closed_at"], TIME_FORMAT),
+                        user_ids,
+                        _pack(s)
+                    ))
+                else:
+                    merged[name] = s
+
+            if archive_rows:
+                execute_values(cur, """
+                    INSERT INTO session_archive (name, closed_at, user_ids, data)
+                    VALUES %s
+                    ON CONFLICT (name) DO NOTHING
+                """, archive_rows, page_size=self.page_size)
+
+            current = existing.get("current") or (current if current in merged else None)
+            _write_sessions_cur(cur, {"current": current, "sessions": merged})
+            return records
+        self._run("sessions", fn)
+
+    def access(self):
+        def fn(cur):
+            users, blocked = read_access()
+            if cur:
+                # brugere der allerede findes i Postgres røres ikke
+                if users:
+                    execute_values(cur, """
+                        INSERT INTO users (uid, name, avatar, role, first_seen, last_seen)
+                        VALUES %s
+                        ON CONFLICT (uid) DO NOTHING
+                    """, [
+                        (
+                            uid, u.get("name"), u.get("avatar"), u.get("role", "user"),
+                            _parse_time(u.get("first_seen")), _parse_time(u.get("last_seen"))
+                        )
+                        for uid, u in users.items()
+                    ], page_size=self.page_size)
+                if blocked:
+                    execute_values(cur, """
+                        INSERT INTO users (uid, blocked) VALUES %s
+                        ON CONFLICT (uid) DO UPDATE SET blocked = TRUE
+                    """, [(uid, True) for uid in blocked], page_size=self.page_size)
+            return len(users) + len(blocked)
+        self._run("access", fn)
+
+    def user_stats(self):
+        def fn(cur):
+            stats = read_dict("user_stats.json")
+            if cur:
+                # brugere der allerede har stats i Postgres røres ikke
+                new = execute_values(cur, """
+                    INSERT INTO user_stats (uid, total_spent, total_items) VALUES %s
+                    ON CONFLICT (uid) DO NOTHING
+                    RETURNING uid
+                """, [
+                    (uid, s.get("total_spent", 0), s.get("total_items", 0))
+                    for uid, s in stats.items()
+                ], page_size=self.page_size, fetch=True) if stats else []
+                new = {r[0] for r in new}
+
+                items = [
+                    (uid, item, amount)
+                    for uid, s in stats.items() if uid in new
+                    for item, amount in s.get("items", {}).items() if amount > 0
+                ]
+                if items:
+                    execute_values(cur, """
+                        INSERT INTO user_item_totals (uid, item, amount) VALUES %s
+                    """, items, page_size=self.page_size)
+            return len(stats)
+        self._run("user_stats", fn)
+
+    def audit(self):
+        def fn(cur):
+            if cur:
+                # events har ingen nøgle at springe over på – som migration 6
+                # importeres kun når der ikke er nogen i forvejen
+                cur.execute("SELECT EXISTS (SELECT 1 FROM audit_events) OR EXISTS (SELECT 1 FROM audit_archive)")
+                if cur.fetchone()[0]:
+                    print("⏭️  audit: der er allerede events i databasen – springes over")
+                    return 0
+
+            count = 0
+
+            def rows():
+                nonlocal count
+                for e in read_audit():
+                    count += 1
+                    # uden gyldigt tidspunkt havner de i 1970 (arkivet)
+                    yield (
+                        _parse_time(e.get("time")) or datetime(1970, 1, 1),
+                        e.get("action") or "",
+                        e.get("admin"),
+                        serializer.dumps(e.get("target"))
+                    )
+
+            if cur:
+                # én række pr. event – execute_values tager generatoren side for side
+                execute_values(cur, """
+                    INSERT INTO audit_events (at, action, admin, target) VALUES %s
+                """, rows(), template="(%s, %s, %s, %s::jsonb)", page_size=self.page_size)
+            else:
+                for _ in rows():
+                    pass
+            return count
+        self._run("audit", fn)
+
+
+TABLES = {
+    "lager": "lager.json",
+    "prices": "prices.json",
+    "sessions": "sessions.json",
+    "access": "access.json",
+    "user_stats": "user_stats.json",
+    "audit": "audit.json",
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(TABLES))
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--archive-closed", action="store_true")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    if not args.dry_run:
+        init_db()
+
+    importer = Importer(args.dry_run, args.archive_closed, args.page_size)
+    for table in args.only.split(","):
+        fname = TABLES[table]
+        has_session_dir = table == "sessions" and os.path.isdir(_path("sessions"))
+        if not os.path.exists(_path(fname)) and not has_session_dir:
+            print(f"❌ {fname} findes ikke")
+            continue
+        getattr(importer, table)()
+
+    total = sum(r[1] for r in importer.report)
+    secs = sum(r[3] for r in importer.report)
+    print(f"📊 I alt {total} poster på {secs:.2f} s"
+          + (" (dry-run – intet skrevet)" if args.dry_run else ""))
+
 
 if __name__ == "__main__":
-    migrate_lager()
-    migrate_prices()
+    sys.exit(main())
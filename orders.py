@@ -0,0 +1,147 @@
+# =====================
+# ORDRER I SESSION-DOKUMENTET
+# =====================
+# Sessions gemmes som {"orders": [ {...}, ... ]} – og ordrerne bliver i
+# den form, også i hukommelsen. Hver request henter og parser alligevel
+# hele dokumentet, så et indeks der bygges forfra pr. request sparer
+# intet: ét opslag er højst én gennemgang af listen – billigere end at
+# bygge indekset, og under 1% af requesten ved 10k ordrer (se
+# bench/bench_orders.py). Ændringer sker direkte på ordre-dict'en.
+
+def find_order(session_data, order_id):
+    """Første ordre med id'et – eller None."""
+    return next((o for o in session_data.get("orders", []) if o["id"] == order_id), None)
+
+
+def order_for_user(session_data, user_id):
+    """Brugerens (første) ordre i sessionen – eller None."""
+    return next((o for o in session_data.get("orders", []) if o.get("user_id") == user_id), None)
+
+
+def remove_order(session_data, order_id):
+    """Fjern ordren (alle med id'et) og returnér den første – eller None."""
+    orders = session_data.get("orders", [])
+    order = next((o for o in orders if o["id"] == order_id), None)
+    if order is not None:
+        session_data["orders"] = [o for o in orders if o["id"] != order_id]
+    return order
+
+
+def used_items(session_data):
+    """Stk. pr. vare på tværs af sessionens ordrer."""
+    used = {}
+    for o in session_data.get("orders", []):
+        for item, amount in o.get("items", {}).items():
+            used[item] = used.get(item, 0) + amount
+    return used
+
+
+# =====================
+# OPERATIONER (JOURNAL)
+# =====================
+# En ændring gemmes som små operationer på én ordre eller session – ikke
+# som hele dokumentet. db.py afspiller dem mod det nyeste dokument i
+# Postgres (under en lås), så to workers ikke overskriver hinandens
+# ændringer. Hver operation er idempotent: afspillet to gange (fx efter
+# en commit hvor svaret gik tabt) giver den samme resultat som én gang.
+#
+# Skifter en ordres betalt-flag, returnerer apply_ops brugerens stats-
+# ændring. db.py lægger den i user_stats i samme transaktion som
+# dokumentet – flaget er dermed "anvendt"-markeringen: en gentaget
+# operation finder ordren allerede betalt og giver ingen ændring.
+#
+#   op("set_order", session="bestilling3", order_id="1712.1", fields={"paid": True})
+
+def op(kind, **args):
+    return {"op": kind, **args}
+
+
+def _session(data, op):
+    return data["sessions"].get(op["session"])
+
+
+def _add_order(data, op):
+    s = _session(data, op)
+    if s is not None and find_order(s, op["order"]["id"]) is None:
+        s.setdefault("orders", []).append(op["order"])
+
+
+def _set_order(data, op):
+    s = _session(data, op)
+    order = find_order(s, op["order_id"]) if s is not None else None
+    if order is None:
+        return None
+    before = dict(order)
+    order.update(op["fields"])
+    if bool(before.get("paid")) == bool(order.get("paid")):
+        return None
+    # betalt → det der blev betalt; ikke betalt → det der blev talt med
+    counted, sign = (order, 1) if order.get("paid") else (before, -1)
+    return (counted["user_id"], counted.get("items", {}), counted.get("total", 0), sign)
+
+
+def _delete_order(data, op):
+    s = _session(data, op)
+    if s is not None:
+        remove_order(s, op["order_id"])
+
+
+def _create_session(data, op):
+    data["sessions"].setdefault(op["session"], op["data"])
+
+
+def _set_session(data, op):
+    s = _session(data, op)
+    if s is not None:
+        s.update(op["fields"])
+
+
+def _delete_session(data, op):
+    data["sessions"].pop(op["session"], None)
+    if data.get("current") == op["session"]:
+        data["current"] = None
+
+
+def _set_current(data, op):
+    data["current"] = op["session"]
+
+
+def _lock_user(data, op):
+    s = _session(data, op)
+    if s is None:
+        return
+    locked = s.setdefault("locked_users", [])
+    if op["locked"] and op["uid"] not in locked:
+        locked.append(op["uid"])
+    elif not op["locked"] and op["uid"] in locked:
+        locked.remove(op["uid"])
+
+
+OPS = {
+    "add_order": _add_order,
+    "set_order": _set_order,
+    "delete_order": _delete_order,
+    "create_session": _create_session,
+    "set_session": _set_session,
+    "delete_session": _delete_session,
+    "set_current": _set_current,
+    "lock_user": _lock_user,
+}
+
+
+def apply_ops(data, ops):
+    """Afspil operationerne på et sessions-dokument (ændres på stedet).
+
+    → stats-ændringer [(uid, items, total, sign)] for ordrer hvis
+    betalt-flag skiftede.
+    """
+    stats = []
+    for o in ops:
+        fn = OPS.get(o["op"])
+        if fn is None:
+            print(f"⚠️ Ukendt session-operation {o['op']!r} springes over")
+            continue
+        delta = fn(data, o)
+        if delta:
+            stats.append(delta)
+    return stats
@@ -0,0 +1,85 @@
+import io
+import os
+import re
+import pstats
+import cProfile
+from datetime import datetime
+
+# =====================
+# PROFILER (KUN ADMINS, OPT-IN)
+# =====================
+# Tilføj ?_profile=1 til en vilkårlig URL som admin → requesten køres
+# under cProfile og resultatet gemmes som .pstats i PROFILE_DIR.
+# Kun de nyeste PROFILE_KEEP filer beholdes.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+_NAME_RE = re.compile(r"^[\w.-]+\.pstats$")
+
+
+def start():
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
+
+
+def stop(prof, route, method):
+    prof.disable()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{method}_{slug}.pstats"
+    prof.dump_stats(os.path.join(PROFILE_DIR, name))
+
+    _enforce_cap()
+    print("🔬 Profil gemt:", name)
+    return name
+
+
+def _enforce_cap():
+    profiles = list_profiles()
+    for p in profiles[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, p["name"]))
+        except OSError:
+            pass
+
+
+def list_profiles():
+    """Nyeste først."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not _NAME_RE.match(name):
+            continue
+        st = os.stat(os.path.join(PROFILE_DIR, name))
+        profiles.append({
+            "name": name,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "time": datetime.fromtimestamp(st.st_mtime).strftime("%d-%m-%Y %H:%M:%S")
+        })
+    profiles.sort(key=lambda p: (p["mtime"], p["name"]), reverse=True)
+    return profiles
+
+
+def profile_path(name):
+    """Stien til en gemt profil – None hvis navnet er ugyldigt eller ukendt."""
+    if not _NAME_RE.match(name or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def summary(name, sort="cumulative", limit=40):
+    path = profile_path(name)
+    if not path:
+        return None
+
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
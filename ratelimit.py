@@ -0,0 +1,132 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# =====================
+# RATE LIMITING (TOKEN BUCKET)
+# =====================
+# Én spand pr. (klasse, bruger) og pr. (klasse, IP). Hver request tager
+# én token; spanden fyldes op med en fast rate og rummer højst "burst"
+# tokens. Er en af dem tom → 429 med Retry-After.
+#
+# Regler sættes pr. klasse som "antal/sekunder", fx
+#   RATE_LIMIT_POLL_USER=120/60   RATE_LIMIT_POLL_IP=600/60
+# "0" slår grænsen fra, RATE_LIMIT=off slår det hele fra. Spandene ligger
+# i hukommelsen i hver worker, så med WEB_CONCURRENCY workers er den
+# reelle grænse op til N gange højere.
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "on").lower() not in ("off", "0", "false")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "20000"))
+
+DEFAULT_RULES = {
+    # session_data / auto-reload – ~30/min pr. åben fane
+    "poll": ("120/60", "600/60"),
+    # alt der ændrer data
+    "mutate": ("30/60", "120/60"),
+    "admin": ("300/60", "600/60"),
+    # /debug_db dumper hele databasen
+    "debug": ("5/60", "10/60"),
+}
+
+RATE_LIMITED = metrics.Counter(
+    "bestilling_rate_limited_total",
+    "Requests rejected with 429 by rate limit class and scope",
+    ("limit", "scope")
+)
+RATE_ALLOWED = metrics.Counter(
+    "bestilling_rate_allowed_total",
+    "Requests checked against a rate limit and allowed",
+    ("limit",)
+)
+RATE_KEYS = metrics.Gauge("bestilling_rate_limit_keys", "Token buckets held in memory")
+
+
+def parse_rule(text):
+    """"120/60" → (burst=120, rate=2.0 tokens/s). "0" / "" → None."""
+    text = (text or "").strip()
+    if not text or text == "0":
+        return None
+    count, _, seconds = text.partition("/")
+    count = float(count)
+    seconds = float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        return None
+    return count, count / seconds
+
+
+def rules_from_env(defaults=DEFAULT_RULES):
+    rules = {}
+    for name, (user, ip) in defaults.items():
+        rules[name] = {
+            "user": parse_rule(os.getenv(f"RATE_LIMIT_{name.upper()}_USER", user)),
+            "ip": parse_rule(os.getenv(f"RATE_LIMIT_{name.upper()}_IP", ip)),
+        }
+    return rules
+
+
+class RateLimiter:
+    def __init__(self, rules, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.rules = rules
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets = OrderedDict()     # (klasse, scope, nøgle) → [tokens, opdateret]
+        self._lock = threading.Lock()
+
+    def _take(self, key, rule, now):
+        burst, rate = rule
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [burst, now]
+            self.buckets[key] = bucket
+            # LRU – de længst ubrugte spande er (næsten) fulde og kan smides ud
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def hit(self, name, user=None, ip=None):
+        """Tag én token for klassen. Returnerer 0 eller sekunder til næste token."""
+        rule = self.rules.get(name)
+        if not rule:
+            return 0.0
+
+        checks = [
+            (scope, key, rule[scope])
+            for scope, key in (("user", user), ("ip", ip))
+            if key and rule.get(scope)
+        ]
+        if not checks:
+            return 0.0
+
+        with self._lock:
+            now = self.clock()
+            for scope, key, r in checks:
+                wait = self._take((name, scope, key), r, now)
+                if wait:
+                    RATE_LIMITED.inc(limit=name, scope=scope)
+                    RATE_KEYS.set(len(self.buckets))
+                    return wait
+            # først når alle spande har plads, trækkes der
+            for scope, key, _ in checks:
+                self.buckets[(name, scope, key)][0] -= 1
+            RATE_KEYS.set(len(self.buckets))
+
+        RATE_ALLOWED.inc(limit=name)
+        return 0.0
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
+
+
+limiter = RateLimiter(rules_from_env() if RATE_LIMIT else {})
@@ -0,0 +1,77 @@
+import json
+
+# =====================
+# JSON SERIALIZER (ORJSON HVIS MULIGT)
+# =====================
+# Én fælles indgang til JSON for db.py (JSONB ind/ud), Flask og hashes.
+# orjson er valgfri – uden den bruges stdlib med samme kompakte output.
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - afhænger af miljøet
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def _std_dumps(obj, sort_keys=False):
+    return json.dumps(obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False)
+
+
+if orjson:
+    def dumps_bytes(obj, sort_keys=False):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            # fx ikke-str nøgler eller ints > 64 bit → stdlib kan stadig
+            return _std_dumps(obj, sort_keys).encode("utf-8")
+
+    def dumps(obj, sort_keys=False):
+        return dumps_bytes(obj, sort_keys).decode("utf-8")
+
+    def loads(data):
+        return orjson.loads(data)
+
+else:
+    def dumps_bytes(obj, sort_keys=False):
+        return _std_dumps(obj, sort_keys).encode("utf-8")
+
+    def dumps(obj, sort_keys=False):
+        return _std_dumps(obj, sort_keys)
+
+    def loads(data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+
+
+def register_psycopg2():
+    """Brug loads() når psycopg2 parser JSON/JSONB kolonner."""
+    import psycopg2.extras
+
+    psycopg2.extras.register_default_json(globally=True, loads=loads)
+    psycopg2.extras.register_default_jsonb(globally=True, loads=loads)
+
+
+def flask_provider():
+    """JSONProvider-klasse til app.json_provider_class (bruges af jsonify)."""
+    from flask.json.provider import DefaultJSONProvider
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            # jsonify beder om kompakte separators – det er output allerede
+            kwargs.pop("separators", None)
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            try:
+                return dumps(obj, sort_keys=self.sort_keys)
+            except TypeError:
+                # typer kun Flask kender (Decimal, dataclasses, ...)
+                return super().dumps(obj)
+
+        def loads(self, s, **kwargs):
+            if kwargs:
+                return super().loads(s, **kwargs)
+            return loads(s)
+
+    return FastJSONProvider
@@ -1 +1 @@
-gunicorn web:app
\ No newline at end of file
+python assets.py && gunicorn -c gunicorn.conf.py web:app
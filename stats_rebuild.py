@@ -0,0 +1,190 @@
+"""Genberegn user_stats ud fra ordrehistorikken.
+
+    python stats_rebuild.py              # genberegn og skriv
+    python stats_rebuild.py --dry-run    # vis kun forskellene
+
+Alle betalte ordrer (hot og arkiv) streames én gang, og hver brugers
+stats tælles op forfra. Resultatet sammenlignes med de nuværende stats,
+og kun brugere der afviger skrives – i små batches med korte
+transaktioner, så live-trafikken ikke venter på jobbet. Samme job kan
+startes fra /admin (opgavekøen); seneste rapport ligger i meta.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from tasks import task
+from db import (
+    init_db,
+    stats_snapshot,
+    update_user_stats,
+    load_meta,
+    save_meta,
+    queue_audit,
+    TIME_FORMAT
+)
+
+REBUILD_BATCH = int(os.getenv("STATS_REBUILD_BATCH", "500"))
+REPORT_KEY = "stats_rebuild"
+REPORT_TOP = 10
+# giv andre greenlets plads undervejs (eventlet-workers)
+YIELD_EVERY = 1000
+
+
+def _empty():
+    return {"total_spent": 0, "total_items": 0, "items": {}}
+
+
+def _same(a, b):
+    return (
+        a["total_spent"] == b["total_spent"]
+        and a["total_items"] == b["total_items"]
+        and {k: v for k, v in a["items"].items() if v > 0} == {k: v for k, v in b["items"].items() if v > 0}
+    )
+
+
+def collect(orders):
+    """Én gennemgang af betalte ordrer → ({uid: stats}, antal ordrer)."""
+    stats = {}
+    n = 0
+    for _, o in orders:
+        n += 1
+        if n % YIELD_EVERY == 0:
+            time.sleep(0)
+
+        uid = o.get("user_id")
+        if not uid:
+            continue  # ældre ordrer uden user_id kan ikke knyttes til en bruger
+
+        s = stats.setdefault(uid, _empty())
+        s["total_spent"] += o.get("total") or 0
+        for item, amount in (o.get("items") or {}).items():
+            if amount > 0:
+                s["items"][item] = s["items"].get(item, 0) + amount
+                s["total_items"] += amount
+    return stats, n
+
+
+def compensate(rebuilt, before, now):
+    """rebuilt + det live-betalinger har ændret siden before blev læst."""
+    items = {}
+    for item in set(rebuilt["items"]) | set(before["items"]) | set(now["items"]):
+        amount = rebuilt["items"].get(item, 0) + now["items"].get(item, 0) - before["items"].get(item, 0)
+        if amount > 0:
+            items[item] = amount
+    return {
+        "total_spent": max(0, rebuilt["total_spent"] + now["total_spent"] - before["total_spent"]),
+        "total_items": max(0, rebuilt["total_items"] + now["total_items"] - before["total_items"]),
+        "items": items
+    }
+
+
+def diff(before, rebuilt):
+    changed = []
+    for uid in set(before) | set(rebuilt):
+        b = before.get(uid, _empty())
+        r = rebuilt.get(uid, _empty())
+        if not _same(b, r):
+            changed.append({
+                "uid": uid,
+                "spent_before": b["total_spent"],
+                "spent_after": r["total_spent"],
+                "items_before": b["total_items"],
+                "items_after": r["total_items"]
+            })
+    changed.sort(key=lambda c: -abs(c["spent_after"] - c["spent_before"]))
+    return {
+        "users": len(rebuilt),
+        "changed": len(changed),
+        "added": sum(1 for c in changed if c["uid"] not in before),
+        "removed": sum(1 for c in changed if c["uid"] not in rebuilt),
+        "spent_delta": sum(c["spent_after"] - c["spent_before"] for c in changed),
+        "items_delta": sum(c["items_after"] - c["items_before"] for c in changed),
+        "top": changed[:REPORT_TOP],
+        "uids": [c["uid"] for c in changed]
+    }
+
+
+def rebuild(dry_run=False, by="cli", batch_size=None):
+    batch_size = batch_size or REBUILD_BATCH
+    started = time.time()
+    stamp = datetime.now().strftime(TIME_FORMAT)
+    save_meta(REPORT_KEY, {"status": "running", "started": stamp, "by": by, "dry_run": dry_run})
+
+    try:
+        # stats og ordrer fra samme snapshot – en betaling er enten med i
+        # begge eller i ingen af dem; det der sker bagefter lægger
+        # compensate oven i
+        with stats_snapshot() as (before, orders):
+            rebuilt, n_orders = collect(orders)
+
+        report = diff(before, rebuilt)
+        uids = report.pop("uids")
+
+        if not dry_run:
+            for i in range(0, len(uids), batch_size):
+                batch = uids[i:i + batch_size]
+                update_user_stats(batch, lambda now, batch=batch: {
+                    uid: compensate(
+                        rebuilt.get(uid, _empty()),
+                        before.get(uid, _empty()),
+                        now.get(uid, _empty())
+                    )
+                    for uid in batch
+                })
+                time.sleep(0)
+
+    except Exception as e:
+        save_meta(REPORT_KEY, {
+            "status": "failed", "started": stamp, "by": by, "dry_run": dry_run, "error": str(e)
+        })
+        raise
+
+    report.update(
+        status="done",
+        started=stamp,
+        finished=datetime.now().strftime(TIME_FORMAT),
+        seconds=round(time.time() - started, 2),
+        orders=n_orders,
+        by=by,
+        dry_run=dry_run
+    )
+    save_meta(REPORT_KEY, report)
+    print(
+        f"📊 Stats genberegnet: {report['orders']} betalte ordrer, {report['users']} brugere, "
+        f"{report['changed']} ændret ({report['spent_delta']:+,} kr)"
+        + (" – dry-run, intet skrevet" if dry_run else "")
+    )
+    return report
+
+
+@task("rebuild_stats")
+def rebuild_task(by, dry_run=False):
+    report = rebuild(dry_run, by)
+    if not dry_run:
+        queue_audit("rebuild_stats", by, f"{report['changed']} brugere ændret ({report['spent_delta']:+,} kr)")
+
+
+def last_report():
+    return load_meta(REPORT_KEY)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch", type=int, default=REBUILD_BATCH)
+    args = parser.parse_args(argv)
+
+    init_db()
+    report = rebuild(args.dry_run, by="cli", batch_size=args.batch)
+    for c in report["top"]:
+        print(
+            f"  {c['uid']:<20} {c['spent_before']:>14,} → {c['spent_after']:>14,} kr   "
+            f"{c['items_before']:>6} → {c['items_after']:>6} stk"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
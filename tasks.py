@@ -0,0 +1,229 @@
+import os
+import time
+import heapq
+import threading
+import itertools
+
+import metrics
+import serializer
+from journal import JOURNAL_DIR, JOURNAL_NAME, open_locked, fsync_line
+
+# =====================
+# BAGGRUNDSOPGAVER (AUDIT, STATS, BROADCASTS)
+# =====================
+# Ikke-kritiske sideeffekter køres af en lille worker-pulje i stedet for
+# i selve requesten. Hver opgave skrives til en lokal spool-fil (fsync)
+# før den køres, så den overlever genstart; fejl gentages med backoff.
+#
+#   @task("audit_log")
+#   def audit_log(action, admin, target, when=None): ...
+#
+#   enqueue("audit_log", "order_paid", "admin", order_id)
+#
+# Opgaver med samme navn køres én ad gangen (serial=True), fordi fx stats
+# og audit er læs-rediger-skriv på ét dokument.
+
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "8"))
+TASK_BACKOFF_SECONDS = float(os.getenv("TASK_BACKOFF_SECONDS", "0.5"))
+TASK_BACKOFF_MAX = 60.0
+
+TASK_DEPTH = metrics.Gauge("bestilling_task_queue_depth", "Tasks waiting to run")
+TASK_OLDEST = metrics.Gauge("bestilling_task_oldest_seconds", "Age of the oldest waiting task")
+TASK_LAG = metrics.Histogram(
+    "bestilling_task_lag_seconds",
+    "Time from enqueue until a task starts",
+    ("task",)
+)
+TASK_RUNS = metrics.Counter(
+    "bestilling_task_runs_total",
+    "Task executions by result",
+    ("task", "result")
+)
+
+_registry = {}
+
+
+def task(name, serial=True):
+    def wrap(fn):
+        _registry[name] = (fn, threading.Lock() if serial else None)
+        return fn
+    return wrap
+
+
+class TaskQueue:
+    def __init__(self, directory=JOURNAL_DIR, name=f"{JOURNAL_NAME}-tasks", workers=TASK_WORKERS):
+        self.directory = directory
+        self.name = name
+        self.workers = workers
+        self.heap = []          # (due, seq, task)
+        self.inflight = {}      # id → task
+        self.f = None
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._threads = []
+
+    # ---- spool ----
+    def _open(self):
+        if self.f is not None:
+            return
+        _, self.f = open_locked(self.directory, self.name)
+
+        self.f.seek(0)
+        pending = {}
+        for line in self.f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = serializer.loads(line)
+            except ValueError:
+                continue
+            if "done" in rec:
+                pending.pop(rec["done"], None)
+            else:
+                pending[rec["id"]] = rec
+        self.f.seek(0, os.SEEK_END)
+
+        if pending:
+            print(f"🧵 {len(pending)} opgave(r) genoptaget fra spool")
+        start = max(pending, default=0) + 1
+        self._ids = itertools.count(start)
+        for rec in pending.values():
+            heapq.heappush(self.heap, (time.time(), rec["id"], rec))
+        self._update_gauges()
+
+    def _done(self, rec):
+        self.inflight.pop(rec["id"], None)
+        if not self.heap and not self.inflight:
+            # intet venter → start spool-filen forfra
+            self.f.truncate(0)
+            self.f.seek(0)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        else:
+            fsync_line(self.f, {"done": rec["id"]})
+
+    def _update_gauges(self):
+        TASK_DEPTH.set(len(self.heap) + len(self.inflight))
+        oldest = min((r["enqueued"] for _, _, r in self.heap), default=None)
+        TASK_OLDEST.set(round(time.time() - oldest, 3) if oldest else 0)
+
+    # ---- API ----
+    def enqueue(self, name, *args):
+        if name not in _registry:
+            raise KeyError(f"ukendt opgave {name!r}")
+
+        with self._cond:
+            self._open()
+            rec = {
+                "id": next(self._ids),
+                "name": name,
+                "args": list(args),
+                "attempts": 0,
+                "enqueued": time.time()
+            }
+            fsync_line(self.f, rec)
+            heapq.heappush(self.heap, (rec["enqueued"], rec["id"], rec))
+            self._update_gauges()
+            self._cond.notify()
+
+        self.start()
+        return rec["id"]
+
+    def depth(self):
+        return len(self.heap) + len(self.inflight)
+
+    def pending(self, name):
+        """Antal ventende/kørende opgaver med dette navn."""
+        with self._cond:
+            return (
+                sum(1 for _, _, r in self.heap if r["name"] == name)
+                + sum(1 for r in self.inflight.values() if r["name"] == name)
+            )
+
+    def start(self):
+        if self._threads:
+            return
+        with self._cond:
+            self._open()
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"task-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def drain(self, timeout=10):
+        """Vent til køen er tom (bruges af scripts og benchmarks)."""
+        deadline = time.time() + timeout
+        while self.depth() and time.time() < deadline:
+            time.sleep(0.01)
+        return self.depth() == 0
+
+    # ---- workers ----
+    def _next(self):
+        with self._cond:
+            while True:
+                if self.heap:
+                    due = self.heap[0][0]
+                    wait = due - time.time()
+                    if wait <= 0:
+                        _, _, rec = heapq.heappop(self.heap)
+                        self.inflight[rec["id"]] = rec
+                        self._update_gauges()
+                        return rec
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _worker(self):
+        while True:
+            rec = self._next()
+            if rec["name"] not in _registry:
+                print(f"💀 Ukendt opgave {rec['name']} i spool – springes over")
+                with self._cond:
+                    self._done(rec)
+                    self._update_gauges()
+                continue
+            fn, lock = _registry[rec["name"]]
+            if rec["attempts"] == 0:
+                TASK_LAG.observe(time.time() - rec["enqueued"], task=rec["name"])
+
+            try:
+                if lock:
+                    with lock:
+                        fn(*rec["args"])
+                else:
+                    fn(*rec["args"])
+            except Exception as e:
+                rec["attempts"] += 1
+                if rec["attempts"] >= TASK_MAX_ATTEMPTS:
+                    TASK_RUNS.inc(task=rec["name"], result="dead")
+                    print(f"💀 Opgave {rec['name']} opgivet efter {rec['attempts']} forsøg:", e)
+                    with self._cond:
+                        self._done(rec)
+                        self._update_gauges()
+                    continue
+
+                TASK_RUNS.inc(task=rec["name"], result="retry")
+                delay = min(TASK_BACKOFF_MAX, TASK_BACKOFF_SECONDS * 2 ** (rec["attempts"] - 1))
+                print(f"🔁 Opgave {rec['name']} fejlede ({e}) – nyt forsøg om {delay:.1f}s")
+                with self._cond:
+                    self.inflight.pop(rec["id"], None)
+                    heapq.heappush(self.heap, (time.time() + delay, rec["id"], rec))
+                    self._update_gauges()
+                    self._cond.notify()
+                continue
+
+            TASK_RUNS.inc(task=rec["name"], result="ok")
+            with self._cond:
+                self._done(rec)
+                self._update_gauges()
+
+
+queue = TaskQueue()
+
+
+def enqueue(name, *args):
+    return queue.enqueue(name, *args)
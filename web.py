@@ -1,25 +1,61 @@
 import os
-import json
-import hashlib
+import hmac
 import requests
-from datetime import datetime
+from itertools import islice
+from contextlib import closing
+from datetime import datetime, timedelta
 from urllib.parse import urlencode
-from flask import Flask, render_template, request, redirect, session, jsonify
+from flask import Flask, render_template, request, redirect, session, jsonify, g, Response, send_file, stream_with_context
 from flask_socketio import SocketIO
 
+import metrics
+import profiler
+import discord_roles
+import bus
+import export
+import analytics
+import stats_rebuild
+import ratelimit
+import fragments
+import assets
+import serializer
+from orders import op, find_order, order_for_user, used_items
+from tasks import task, enqueue, queue
+from journal import journal
+
 from db import (
+    queue_drop_session_summary,
     init_db,
+    route_reads,
+    last_write_at,
+    db_breaker,
+    DatabaseUnavailable,
+    sync_pending,
     load_sessions,
-    save_sessions,
-    load_access,
-    save_access,
+    save_session_ops,
+    audit_event,
+    load_user,
+    list_users,
+    login_user,
+    touch_user,
+    set_role,
+    set_blocked,
     load_lager,
     load_prices,
-    load_user_stats,
-    save_user_stats,
-    audit_log,
-    load_audit,
-    reset_all_stats      # 👈 TILFØJ DENNE
+    load_user_stat,
+    queue_audit,
+    iter_audit,
+    audit_index,
+    archive_audit,
+    load_meta,
+    reset_all_stats,     # 👈 TILFØJ DENNE
+    archive_sessions,
+    load_archived_session,
+    list_archived_sessions,
+    load_archived_sessions_for_user,
+    delete_archived_session,
+    iter_session_orders,
+    TIME_FORMAT
 )
 
 
@@ -33,6 +69,13 @@ DISCORD_ADMIN_ROLE = os.getenv("DISCORD_ADMIN_ROLE")
 DISCORD_USER_ROLE = os.getenv("DISCORD_USER_ROLE")
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_TOKEN")
 OWNER_ID = os.getenv("OWNER_DISCORD_ID")
+USERS_PER_PAGE = int(os.getenv("USERS_PER_PAGE", "50"))
+AUDIT_PER_PAGE = int(os.getenv("AUDIT_PER_PAGE", "200"))
+AUDIT_MAX_PAGE = 5000
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# antal proxies foran appen (Render = 1) – bruges til klientens IP
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
 
 BASE_URL = "https://discord-bestilling-yfte.onrender.com"
 OAUTH_REDIRECT = "/auth/callback"
@@ -41,8 +84,37 @@ OAUTH_REDIRECT = "/auth/callback"
 # FLASK
 # =====================
 app = Flask(__name__)
+app.json_provider_class = serializer.flask_provider()
+app.json = app.json_provider_class(app)
 app.secret_key = os.getenv("FLASK_SECRET", "dev-secret")
-socketio = SocketIO(app, cors_allowed_origins="*")
+# flere workers → emits går via bussen, og kun websocket (ingen sticky LB)
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    client_manager=bus.socketio_manager(),
+    transports=["websocket"] if WEB_CONCURRENCY > 1 else ["polling", "websocket"]
+)
+# 📦 static/*.css med hash i navnet (python assets.py) – se assets.py
+assets.load()
+app.add_template_global(assets.url, "asset_url")
+
+
+# =====================
+# 📡 BROADCASTS (i baggrunden)
+# =====================
+@task("broadcast", serial=False)
+def broadcast(event, payload):
+    socketio.emit(event, payload)
+
+
+def notify_session(name, data=None):
+    enqueue("broadcast", "session_update", {"session": name})
+    # caches (analytics m.fl.) i alle workers
+    bus.publish("session_changed", {"session": name})
+    # gemt summary findes kun for lukkede sessions – slettes én gang her,
+    # ikke af hver worker der hører "session_changed"
+    if data is None or data.get("current") != name:
+        queue_drop_session_summary(name)
 print("🧪 DATABASE_URL =", os.getenv("DATABASE_URL"))
 # 🔥 FORCE INIT HVIS RUN_INIT=true / True / 1 / yes
 
@@ -50,23 +122,27 @@ print("🧪 DATABASE_URL =", os.getenv("DATABASE_URL"))
 # =====================
 # HELPERS
 # =====================
+def get_user(uid):
+    """load_user – men kun ét opslag pr. request for den samme bruger."""
+    cache = g.setdefault("users", {})
+    if uid not in cache:
+        cache[uid] = load_user(uid)
+    return cache[uid]
+
 def is_admin():
     uid = session.get("user", {}).get("id")
     if not uid:
         return False
 
-    role = load_access()["users"].get(uid, {}).get("role")
-    return role == "admin" or is_owner()
+    user = get_user(uid)
+    return (user and user["role"] == "admin") or is_owner()
 
 def is_blocked(uid):
-    return uid in load_access()["blocked"]
+    user = get_user(uid)
+    return bool(user and user["blocked"])
 
-def get_user_statistics(uid):
-    stats = load_user_stats().get(uid, {
-        "total_spent": 0,
-        "total_items": 0,
-        "items": {}
-    })
+def get_user_statistics(uid, sessions=None):
+    stats = load_user_stat(uid)
 
     filtered_items = {
         item: amount
@@ -76,12 +152,14 @@ def get_user_statistics(uid):
 
     most_bought = max(filtered_items, key=filtered_items.get) if filtered_items else None
 
-    sessions = load_sessions()
+    if sessions is None:
+        sessions = load_sessions()
     locked = False
     if sessions["current"]:
         locked = uid in sessions["sessions"][sessions["current"]]["locked_users"]
 
-    role = load_access()["users"].get(uid, {}).get("role", "user")
+    user = get_user(uid)
+    role = user["role"] if user else "user"
 
     return {
         "total_spent": stats["total_spent"],
@@ -91,13 +169,23 @@ def get_user_statistics(uid):
         "role": role
     }
 
-def get_lager_status_for_session(session_name):
-    data = load_sessions()
-    session_data = data["sessions"].get(session_name)
+def get_session(session_name, data=None):
+    """Hent session fra hot-dokumentet – eller lazy fra arkivet."""
+    if data is None:
+        data = load_sessions()
+    s = data["sessions"].get(session_name)
+    if s is None:
+        s = load_archived_session(session_name)
+    return s
+
+def get_lager_status_for_session(session_name, session_data=None, lager=None):
+    if session_data is None:
+        session_data = get_session(session_name)
     if not session_data:
         return {}
 
-    lager = load_lager()
+    if lager is None:
+        lager = load_lager()
     used = {i: 0 for i in lager}
 
     for o in session_data["orders"]:
@@ -115,18 +203,238 @@ def get_lager_status_for_session(session_name):
         }
     return status
 
+def render_fragment(key, template, context):
+    """Cachet HTML-fragment (fragments.py). context() kaldes kun ved miss."""
+    return fragments.cache.get_or_render(
+        key,
+        lambda: app.jinja_env.get_template(template).render(**context())
+    )
+
 def is_owner():
     return session.get("user", {}).get("id") == OWNER_ID
 
+# =====================
+# METRICS
+# =====================
+def _route_label():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def metrics_start():
+    metrics.start_request()
+
+@app.after_request
+def metrics_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def metrics_finish(exc):
+    status = g.get("metrics_status", 500 if exc else 200)
+    metrics.finish_request(_route_label(), request.method, status)
+
+# =====================
+# RATE LIMITING (TOKEN BUCKET)
+# =====================
+# Klasse pr. endpoint – resten: POST → mutate, /admin og /owner → admin.
+RATE_LIMIT_CLASSES = {
+    "index": "poll",           # forsiden genindlæses ofte (og havde auto-reload)
+    "session_data": "poll",
+    "debug_db": "debug",
+    "create_order": "mutate",
+    "delete_order": "mutate",
+    "mark_paid": "mutate",
+    "mark_delivered": "mutate",
+    "order_unpaid": "mutate",
+    "open_session": "mutate",
+    "close_session": "mutate",
+    "delete_session": "mutate",
+    "reset_stats": "mutate",
+    "rebuild_stats": "mutate",
+}
+
+def client_ip():
+    if TRUSTED_PROXIES:
+        hops = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return request.remote_addr
+
+def _rate_class():
+    name = RATE_LIMIT_CLASSES.get(request.endpoint)
+    if name:
+        return name
+    if request.method == "POST":
+        return "mutate"
+    if request.path.startswith(("/admin", "/owner")):
+        return "admin"
+    return None
+
+@app.before_request
+def rate_limit():
+    name = _rate_class()
+    if not name:
+        return
+
+    wait = ratelimit.limiter.hit(name, user=session.get("user", {}).get("id"), ip=client_ip())
+    if wait:
+        return (
+            "For mange forespørgsler – prøv igen om lidt.",
+            429,
+            {"Retry-After": ratelimit.retry_after(wait)}
+        )
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # 🔑 scraper bruger METRICS_TOKEN – ellers kun admins
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        token = auth.removeprefix("Bearer ") or request.args.get("token", "")
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return "Forbidden", 403
+    elif not is_admin():
+        return "Forbidden", 403
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# =====================
+# STATISKE FILER + KOMPRESSION
+# =====================
+# ingen session-opslag her – så sender Flask heller ikke "Vary: Cookie"
+STATIC_ENDPOINTS = ("static", "asset")
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    return assets.send(filename, request.headers.get("Accept-Encoding", ""))
+
+@app.after_request
+def compress(response):
+    return assets.compress_response(response, request.headers.get("Accept-Encoding", ""))
+
+# =====================
+# TEMPLATE CONTEXT
+# =====================
+@app.context_processor
+def inject_sync_state():
+    # 📒 ændringer der kun ligger i den lokale journal endnu
+    return {"sync_pending": sync_pending()}
+
+# =====================
+# DB NEDE → 503
+# =====================
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    print("🔌 503:", e)
+    return (
+        "Databasen er midlertidigt utilgængelig – prøv igen om lidt.",
+        503,
+        {"Retry-After": str(db_breaker.retry_after())}
+    )
+
+# =====================
+# DB ROUTING (READ-REPLICA)
+# =====================
+# Kun rene læse-sider må læse fra replicaen. Alle andre routes læser,
+# retter og gemmer hele dokumenter → de skal se primærens data.
+READ_ONLY_ENDPOINTS = {
+    "index",
+    "view_session",
+    "session_data",
+    "admin_dashboard",
+    "admin_users",
+    "user_history",
+    "audit",
+    "debug_db",
+    "login",
+}
+
+@app.before_request
+def db_routing():
+    if request.endpoint in STATIC_ENDPOINTS:
+        return
+    route_reads(
+        replica=request.endpoint in READ_ONLY_ENDPOINTS,
+        last_write=session.get("last_write")
+    )
+
+@app.after_request
+def remember_write(response):
+    # read-your-writes på tværs af workers: tidspunktet rejser med cookien
+    if request.endpoint not in STATIC_ENDPOINTS:
+        wrote = last_write_at()
+        if wrote and wrote != session.get("last_write"):
+            session["last_write"] = wrote
+    return response
+
+# =====================
+# PROFILER (?_profile=1)
+# =====================
+@app.before_request
+def profile_start():
+    if request.args.get("_profile") and is_admin():
+        try:
+            g.profiler = profiler.start()
+        except ValueError as e:
+            # fx en anden profil kører allerede i samme tråd
+            print("🔬 Profiler ikke startet:", e)
+
+@app.teardown_request
+def profile_stop(exc):
+    prof = g.pop("profiler", None)
+    if prof is not None:
+        profiler.stop(prof, _route_label(), request.method)
+
+@app.route("/admin/profiles")
+@app.route("/admin/profiles/<name>")
+def admin_profiles(name=None):
+    if not is_admin():
+        return "Forbidden", 403
+
+    report = None
+    if name:
+        report = profiler.summary(name)
+        if report is None:
+            return "Findes ikke", 404
+
+    return render_template(
+        "admin_profiles.html",
+        profiles=profiler.list_profiles(),
+        keep=profiler.PROFILE_KEEP,
+        selected=name,
+        report=report,
+        admin=True,
+        user=session["user"]
+    )
+
+@app.route("/admin/profiles/<name>/download")
+def admin_profile_download(name):
+    if not is_admin():
+        return "Forbidden", 403
+
+    path = profiler.profile_path(name)
+    if not path:
+        return "Findes ikke", 404
+
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
 # =====================
 # BLOCK ENFORCEMENT
 # =====================
 @app.before_request
 def enforce_blocked():
-    if "user" in session and is_blocked(session["user"]["id"]):
+    discord_roles.start()
+
+    if request.endpoint in STATIC_ENDPOINTS or "user" not in session:
+        return
+    uid = session["user"]["id"]
+    user = get_user(uid)
+    # blokeret af en admin – eller Discord-rollen er fjernet (discord_roles)
+    if user and (user["blocked"] or user["revoked"]):
         session.clear()
         return redirect("/login")
 
+    touch_user(uid)
+
 # =====================
 # AUTH
 # =====================
@@ -150,11 +458,15 @@ def login():
 
 @app.route("/debug_db")
 def debug_db():
+    # hele sessions-dokumentet og brugerlisten – kun for admins
+    if not is_admin():
+        return "Forbidden", 403
+
     return jsonify({
         "sessions": load_sessions(),
         "lager": load_lager(),
         "prices": load_prices(),
-        "access": load_access(),
+        "users": list_users(per_page=1000)[0],
     })
 
 @app.route("/auth/callback")
@@ -214,22 +526,8 @@ def auth_callback():
         "avatar": user.get("avatar")
     }
 
-    # 🔑 ROLLE KOMMER KUN FRA DATABASEN NU
-    access = load_access()
-
-    existing = access["users"].get(user["id"])
-
-    role = existing["role"] if existing else "user"
-
-    access["users"][user["id"]] = {
-        "name": user["username"],
-        "role": role,   # 👈 ALDRIG overskriv automatisk
-        "avatar": user.get("avatar"),
-        "first_seen": existing.get("first_seen") if existing else datetime.now().strftime("%d-%m-%Y %H:%M"),
-        "last_seen": datetime.now().strftime("%d-%m-%Y %H:%M")
-    }
-
-    save_access(access)
+    # 🔑 ROLLE KOMMER KUN FRA DATABASEN NU (login_user rører aldrig rollen)
+    login_user(user["id"], user["username"], user.get("avatar"))
 
     return redirect("/")
 
@@ -242,36 +540,71 @@ def index():
     if "user" not in session:
         return redirect("/login")
 
+    uid = session["user"]["id"]
     data = load_sessions()
-    totals = {
-        name: sum(o.get("total", 0) for o in s["orders"])
-        for name, s in data["sessions"].items()
-    }
+
+    # delt af alle seere – kun "min ordre" findes pr. bruger
+    cards = {}
+    my_orders = {}
+    for name, s in data["sessions"].items():
+        orders = s["orders"]
+        cards[name] = render_fragment(
+            (name, "card", fragments.revision(orders), bool(s.get("open"))),
+            "fragments/index_card.html",
+            lambda: {
+                "name": name,
+                "open": s.get("open"),
+                "total": sum(o.get("total", 0) for o in orders)
+            }
+        )
+        for o in orders:
+            if o.get("user_id") == uid:
+                my_orders[name] = o["id"]
 
     return render_template(
         "index.html",
         sessions=data["sessions"],
-        totals=totals,
+        cards=cards,
+        my_orders=my_orders,
         current=data["current"],
+        archived=list_archived_sessions(),
         admin=is_admin(),
         user=session["user"],
-        stats=get_user_statistics(session["user"]["id"])
+        stats=get_user_statistics(uid, data)
     )
 
 @app.route("/admin")
 def admin_dashboard():
     if not is_admin():
         return "Forbidden", 403
-    return render_template("admin_dashboard.html", admin=True, user=session["user"])
+    return render_template(
+        "admin_dashboard.html",
+        admin=True,
+        user=session["user"],
+        analytics=analytics.dashboard(),
+        rebuild=load_meta(stats_rebuild.REPORT_KEY)
+    )
+
+@app.route("/admin/role_sync")
+def admin_role_sync():
+    if not is_admin():
+        return "Forbidden", 403
+
+    try:
+        revoked = discord_roles.revalidate()
+    except (discord_roles.DiscordError, requests.RequestException) as e:
+        return f"❌ Rolle-sync fejlede: {e}", 502
+
+    queue_audit("role_sync", session["user"]["name"], f"{len(revoked)} revoked")
+    return redirect("/admin/users")
 
 @app.route("/admin/lock/<uid>")
 def admin_lock_user(uid):
     data = load_sessions()
     current = data["current"]
     if current and uid not in data["sessions"][current]["locked_users"]:
-        data["sessions"][current]["locked_users"].append(uid)
-        save_sessions(data)
-        audit_log("lock_user", session["user"]["name"], uid)
+        save_session_ops([op("lock_user", session=current, uid=uid, locked=True)])
+        queue_audit("lock_user", session["user"]["name"], uid)
     return redirect(f"/admin/user_history?uid={uid}")
 
 @app.route("/admin/unlock/<uid>")
@@ -279,9 +612,8 @@ def admin_unlock_user(uid):
     data = load_sessions()
     current = data["current"]
     if current and uid in data["sessions"][current]["locked_users"]:
-        data["sessions"][current]["locked_users"].remove(uid)
-        save_sessions(data)
-        audit_log("unlock_user", session["user"]["name"], uid)
+        save_session_ops([op("lock_user", session=current, uid=uid, locked=False)])
+        queue_audit("unlock_user", session["user"]["name"], uid)
     return redirect(f"/admin/user_history?uid={uid}")
 
 @app.route("/open_session")
@@ -290,19 +622,25 @@ def open_session():
         return "Forbidden", 403
 
     data = load_sessions()
+    ops = []
     if data["current"]:
-        data["sessions"][data["current"]]["open"] = False
+        ops.append(op("set_session", session=data["current"], fields={
+            "open": False,
+            "closed_at": datetime.now().strftime(TIME_FORMAT)
+        }))
 
+    # navne i arkivet er også optaget
+    taken = set(data["sessions"]) | set(list_archived_sessions())
     i = 1
-    while f"bestilling{i}" in data["sessions"]:
+    while f"bestilling{i}" in taken:
         i += 1
 
     name = f"bestilling{i}"
-    data["sessions"][name] = {"open": True, "orders": [], "locked_users": []}
-    data["current"] = name
+    ops.append(op("create_session", session=name, data={"open": True, "orders": [], "locked_users": []}))
+    ops.append(op("set_current", session=name))
 
-    save_sessions(data)
-    audit_log("open_session", session["user"]["name"], name)
+    save_session_ops(ops)
+    queue_audit("open_session", session["user"]["name"], name)
     return redirect("/")
 
 @app.route("/close_session")
@@ -313,10 +651,14 @@ def close_session():
     data = load_sessions()
     if data["current"]:
         name = data["current"]
-        data["sessions"][name]["open"] = False
-        data["current"] = None
-        save_sessions(data)
-        audit_log("close_session", session["user"]["name"], name)
+        save_session_ops([
+            op("set_session", session=name, fields={
+                "open": False,
+                "closed_at": datetime.now().strftime(TIME_FORMAT)
+            }),
+            op("set_current", session=None)
+        ])
+        queue_audit("close_session", session["user"]["name"], name)
 
     return redirect("/")
 
@@ -327,22 +669,76 @@ def delete_session(name):
 
     data = load_sessions()
     if name in data["sessions"]:
-        del data["sessions"][name]
-        if data["current"] == name:
-            data["current"] = None
-        save_sessions(data)
-        audit_log("delete_session", session["user"]["name"], name)
+        save_session_ops([op("delete_session", session=name)])
+        notify_session(name)
+        queue_audit("delete_session", session["user"]["name"], name)
+    elif delete_archived_session(name):
+        notify_session(name)
+        queue_audit("delete_session", session["user"]["name"], name)
 
     return redirect("/")
 
+# =====================
+# 📤 EKSPORT (CSV / JSONL)
+# =====================
+def _flag(name):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    return value.lower() in ("1", "true", "yes", "ja")
+
+def _export_response(session_name, fmt):
+    if not is_admin():
+        return "Forbidden", 403
+    if fmt not in export.FORMATS:
+        return "Ukendt format", 404
+
+    orders = iter_session_orders(
+        session_name,
+        paid=_flag("paid"),
+        delivered=_flag("delivered"),
+        archive=_flag("archive") is not False
+    )
+
+    if fmt == "csv":
+        columns = list(load_prices()) if request.args.get("items") == "columns" else None
+        body = export.csv_rows(orders, columns)
+    else:
+        body = export.jsonl_rows(orders)
+
+    filename = f"{session_name or 'alle'}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype=export.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.route("/admin/export/<session_name>.<fmt>")
+def export_session(session_name, fmt):
+    return _export_response(session_name, fmt)
+
+@app.route("/admin/export.<fmt>")
+def export_all(fmt):
+    return _export_response(None, fmt)
+
+@app.route("/admin/archive_sessions")
+def admin_archive_sessions():
+    if not is_admin():
+        return "Forbidden", 403
+
+    days = request.args.get("days", type=int)
+    moved = archive_sessions(days)
+    if moved:
+        queue_audit("archive_sessions", session["user"]["name"], ", ".join(moved))
+
+    return redirect("/admin")
+
 @app.route("/admin/block/<uid>")
 def block_user(uid):
     if not is_admin():
         return "Forbidden", 403
 
-    access = load_access()
-
-    user = access["users"].get(uid)
+    user = load_user(uid)
 
     # 🔒 Brugeren findes ikke
     if not user:
@@ -350,7 +746,7 @@ def block_user(uid):
 
     # 🚫 Kan ikke blokere admins
     if user.get("role") == "admin":
-        audit_log(
+        queue_audit(
             "block_denied_admin",
             session["user"]["name"],
             uid
@@ -359,17 +755,16 @@ def block_user(uid):
 
     # 🚫 Kan ikke blokere sig selv
     if uid == session["user"]["id"]:
-        audit_log(
+        queue_audit(
             "block_denied_self",
             session["user"]["name"],
             uid
         )
         return redirect("/admin/users")
 
-    if uid not in access["blocked"]:
-        access["blocked"].append(uid)
-        save_access(access)
-        audit_log("block", session["user"]["name"], uid)
+    if not user["blocked"]:
+        set_blocked(uid, True)
+        queue_audit("block", session["user"]["name"], uid)
 
     return redirect("/admin/users")
 
@@ -381,9 +776,7 @@ def owner_make_admin(uid):
     if not is_owner():
         return "Forbidden", 403
 
-    access = load_access()
-
-    user = access["users"].get(uid)
+    user = load_user(uid)
     if not user:
         return redirect("/admin/users")
 
@@ -391,10 +784,9 @@ def owner_make_admin(uid):
     if uid == session["user"]["id"]:
         return redirect("/admin/users")
 
-    user["role"] = "admin"
-    save_access(access)
+    set_role(uid, "admin")
 
-    audit_log("make_admin", session["user"]["name"], uid)
+    queue_audit("make_admin", session["user"]["name"], uid)
 
     return redirect("/admin/users")
 
@@ -407,9 +799,7 @@ def owner_remove_admin(uid):
     if not is_owner():
         return "Forbidden", 403
 
-    access = load_access()
-
-    user = access["users"].get(uid)
+    user = load_user(uid)
     if not user:
         return redirect("/admin/users")
 
@@ -417,21 +807,22 @@ def owner_remove_admin(uid):
     if uid == session["user"]["id"]:
         return redirect("/admin/users")
 
-    user["role"] = "user"
-    save_access(access)
+    set_role(uid, "user")
 
-    audit_log("remove_admin", session["user"]["name"], uid)
+    queue_audit("remove_admin", session["user"]["name"], uid)
 
     return redirect("/admin/users")
 
 
 @app.route("/admin/unblock/<uid>")
 def unblock_user(uid):
-    access = load_access()
-    if uid in access["blocked"]:
-        access["blocked"].remove(uid)
-        save_access(access)
-        audit_log("unblock", session["user"]["name"], uid)
+    if not is_admin():
+        return "Forbidden", 403
+
+    user = load_user(uid)
+    if user and user["blocked"]:
+        set_blocked(uid, False)
+        queue_audit("unblock", session["user"]["name"], uid)
     return redirect("/admin/users")
 
 @app.route("/admin/users")
@@ -439,22 +830,16 @@ def admin_users():
     if not is_admin():
         return "Forbidden", 403
 
-    access = load_access()
-
-    users = dict(
-        sorted(
-            access["users"].items(),
-            key=lambda x: (
-                0 if x[1].get("role") == "admin" else 1,
-                x[1].get("name", "").lower()
-            )
-        )
-    )
+    page = max(request.args.get("page", 1, type=int), 1)
+    rows, total = list_users(page, USERS_PER_PAGE)
+    users = {u["uid"]: u for u in rows}
 
     return render_template(
         "admin_users.html",
         users=users,
-        blocked=access["blocked"],
+        page=page,
+        pages=max(1, -(-total // USERS_PER_PAGE)),
+        total=total,
         admin=True,
         user=session["user"],
         is_owner=is_owner(),                 
@@ -471,12 +856,14 @@ def user_history():
     grand_total = 0
 
     sessions = load_sessions()
-    access = load_access()
     stats = None
 
     if uid:
-        # 🔁 Saml alle ordrer for brugeren (alle sessions)
-        for sname, s in sessions["sessions"].items():
+        # 🔁 Saml alle ordrer for brugeren (alle sessions – også arkiverede)
+        all_sessions = dict(load_archived_sessions_for_user(uid))
+        all_sessions.update(sessions["sessions"])
+
+        for sname, s in all_sessions.items():
             for o in s.get("orders", []):
                 if o.get("user_id") == uid:
                     orders.append({
@@ -490,7 +877,7 @@ def user_history():
         grand_total = stats["total_spent"]
 
     # 👤 Brugerinfo
-    raw_user = access.get("users", {}).get(uid)
+    raw_user = load_user(uid) if uid else None
     user_info = None
     if raw_user:
         user_info = {
@@ -532,53 +919,94 @@ def audit():
     if not is_admin():
         return "Forbidden", 403
 
-    events = load_audit()
+    def day(name):
+        try:
+            return datetime.strptime(request.args.get(name, ""), "%Y-%m-%d")
+        except ValueError:
+            return None
+
+    action = request.args.get("action") or None
+    start = day("from")
+    end = day("to")
+    limit = min(max(request.args.get("limit", AUDIT_PER_PAGE, type=int), 1), AUDIT_MAX_PAGE)
 
-    action = request.args.get("action")
-    if action:
-        events = [e for e in events if e["action"] == action]
+    # 📜 nyeste først – arkivet læses kun så langt siden rækker
+    with closing(iter_audit(start, end + timedelta(days=1) if end else None, action)) as events:
+        events = list(islice(events, limit + 1))
 
     return render_template(
         "audit.html",
-        events=events,
+        events=events[:limit],
+        more=len(events) > limit,
+        limit=limit,
+        filters={k: request.args.get(k, "") for k in ("action", "from", "to")},
+        index=audit_index(),
         admin=True,
         user=session["user"]
     )
 
+@app.route("/admin/archive_audit")
+def admin_archive_audit():
+    if not is_admin():
+        return "Forbidden", 403
+
+    # days=0 eller negativ ville arkivere hele den aktive tabel
+    days = request.args.get("days", type=int)
+    if days is not None and days < 1:
+        return "days skal være mindst 1", 400
+    moved = archive_audit(days)
+    if moved:
+        queue_audit("archive_audit", session["user"]["name"], ", ".join(f"{m}: {n}" for m, n in moved.items()))
+
+    return redirect("/admin/audit")
+
 
 @app.route("/session/<name>")
 def view_session(name):
     if "user" not in session:
         return redirect("/login")
 
-    data = load_sessions()
-
-    session_data = data["sessions"].get(name)
+    session_data = get_session(name)
     if not session_data:
         return "Findes ikke", 404
 
     orders = session_data.get("orders", [])
-    total = sum(o.get("total", 0) for o in orders)
+    rev = fragments.revision(orders)
+    admin = is_admin()
+    lager = load_lager()
 
-    lager_status = get_lager_status_for_session(name)
+    # ordretabel + total og lagerstatus deles af alle med samme rolle
+    orders_html = render_fragment(
+        (name, "orders", rev, "admin" if admin else "user"),
+        "fragments/session_orders.html",
+        lambda: {
+            "name": name,
+            "orders": orders,
+            "total": sum(o.get("total", 0) for o in orders),
+            "admin": admin
+        }
+    )
+    lager_html = render_fragment(
+        (name, "lager", rev, fragments.revision(lager)),
+        "fragments/session_lager.html",
+        lambda: {"lager_status": get_lager_status_for_session(name, session_data, lager)}
+    )
 
     return render_template(
         "session.html",
         name=name,
-        orders=orders,
-        total=total,
-        lager_status=lager_status,
-        admin=is_admin(),
+        orders_html=orders_html,
+        lager_html=lager_html,
+        admin=admin,
         user=session["user"]
     )
 
 
 @app.route("/session_data/<name>")
 def session_data(name):
-    data = load_sessions()
-    orders = data["sessions"].get(name, {}).get("orders", [])
-    payload = json.dumps(orders, sort_keys=True)
-    return jsonify({"hash": hashlib.md5(payload.encode()).hexdigest()})
+    orders = (get_session(name) or {}).get("orders", [])
+    # samme revision som fragment-cachen bruger
+    return jsonify({"hash": fragments.revision(orders)})
 
 @app.route("/create_order/<session_name>")
 def create_order(session_name):
@@ -593,28 +1021,25 @@ def create_order(session_name):
     uid = session["user"]["id"]
 
     # findes der allerede?
-    for o in s["orders"]:
-        if o["user_id"] == uid:
-            return redirect(f"/session/{session_name}")
-
-    prices = load_prices()
+    if order_for_user(s, uid):
+        return redirect(f"/session/{session_name}")
 
+    now = datetime.now()
     order = {
-        "id": str(datetime.now().timestamp()),
+        "id": str(now.timestamp()),
         "user": session["user"]["name"],
-        "user_id": session["user"]["id"],
+        "user_id": uid,
         "items": {k: 0 for k in load_prices()},
         "total": 0,
-        "time": datetime.now().strftime("%d-%m-%Y %H:%M"),
+        "time": now.strftime(TIME_FORMAT),
         "paid": False,
         "delivered": False
     }
 
+    save_session_ops([op("add_order", session=session_name, order=order)])
+    notify_session(session_name, data)
 
-    s["orders"].append(order)
-    save_sessions(data)
-
-    audit_log("create_order", session["user"]["name"], session_name)
+    queue_audit("create_order", session["user"]["name"], session_name)
 
     return redirect(f"/edit_own_order/{session_name}/{order['id']}")
 
@@ -628,13 +1053,12 @@ def edit_own_order(session_name, order_id):
     if not session_data:
         return "Session not found", 404
 
-    orders = session_data["orders"]
-    order = next((o for o in orders if o["id"] == order_id), None)
+    order = find_order(session_data, order_id)
     if not order:
         return "Order not found", 404
 
     # 🔐 KUN EGEN ORDRE
-    if order.get("user_id") != session["user"]["id"]:
+    if order["user_id"] != session["user"]["id"]:
         return "Du må kun se din egen ordre", 403
 
     # 🔒 HVIS BETALT ELLER SESSION ER LUKKET → VIS SESSION
@@ -649,10 +1073,7 @@ def edit_own_order(session_name, order_id):
     lager = load_lager()
 
     # 📦 BEREGN LAGERSTATUS FOR DENNE SESSION
-    used = {}
-    for o in orders:
-        for item, amount in o["items"].items():
-            used[item] = used.get(item, 0) + amount
+    used = used_items(session_data)
 
     remaining = {}
     for item in lager:
@@ -665,11 +1086,6 @@ def edit_own_order(session_name, order_id):
     if request.method == "POST":
         before_items = order["items"].copy()
 
-        used = {}
-        for o in orders:
-            for item, amount in o["items"].items():
-                used[item] = used.get(item, 0) + amount
-
         total = 0
         for item in order["items"]:
             requested = int(request.form.get(item, 0))
@@ -681,9 +1097,13 @@ def edit_own_order(session_name, order_id):
             total += final_amount * prices.get(item, 0)
 
         order["total"] = total
-        save_sessions(data)
+        save_session_ops([op("set_order", session=session_name, order_id=order_id, fields={
+            "items": order["items"],
+            "total": total
+        })])
+        notify_session(session_name, data)
 
-        audit_log(
+        queue_audit(
             "edit_own_order",
             session["user"]["name"],
             f"{session_name}:{order_id}"
@@ -730,42 +1150,24 @@ def mark_paid(session_name, order_id):
         return "Forbidden", 403
 
     data = load_sessions()
-    order = next(
-        o for o in data["sessions"][session_name]["orders"]
-        if o["id"] == order_id
-    )
+    session_data = data["sessions"].get(session_name)
+    if not session_data:
+        return "Session not found", 404
+
+    order = find_order(session_data, order_id)
+    if not order:
+        return "Order not found", 404
 
     # hvis allerede betalt → gør intet
     if order.get("paid"):
         return redirect(f"/session/{session_name}")
 
-    # marker som betalt
-    order["paid"] = True
-    save_sessions(data)
-
-    # =====================
-    # 📊 OPDATER USER STATS
-    # =====================
-    stats = load_user_stats()
-    uid = order["user_id"]
-
-    stats.setdefault(uid, {
-        "total_spent": 0,
-        "total_items": 0,
-        "items": {}
-    })
-
-    for item, amount in order["items"].items():
-        if amount > 0:
-            stats[uid]["items"][item] = stats[uid]["items"].get(item, 0) + amount
-            stats[uid]["total_items"] += amount
-
-    stats[uid]["total_spent"] += order.get("total", 0)
-
-    save_user_stats(stats)
+    # marker som betalt – user stats rettes i samme transaktion (db._apply_session_ops)
+    save_session_ops([op("set_order", session=session_name, order_id=order_id, fields={"paid": True})])
+    notify_session(session_name, data)
 
     # audit
-    audit_log("order_paid", session["user"]["name"], order_id)
+    queue_audit("order_paid", session["user"]["name"], order_id)
 
     return redirect(f"/session/{session_name}")
 
@@ -775,25 +1177,37 @@ def reset_stats():
         return "Forbidden", 403
 
     reset_all_stats()
-    audit_log("reset_stats", session["user"]["name"], "ALL_USERS")
+    queue_audit("reset_stats", session["user"]["name"], "ALL_USERS")
 
     return redirect("/admin")
 
+@app.route("/admin/rebuild_stats")
+def rebuild_stats():
+    if not is_admin():
+        return "Forbidden", 403
+
+    # kører i opgavekøen – rapporten vises på /admin når den er færdig
+    enqueue("rebuild_stats", session["user"]["name"], _flag("dry_run") is True)
+    return redirect("/admin")
+
 @app.route("/admin/order_delivered/<session_name>/<order_id>")
 def mark_delivered(session_name, order_id):
     if not is_admin():
         return "Forbidden", 403
 
     data = load_sessions()
-    order = next(
-        o for o in data["sessions"][session_name]["orders"]
-        if o["id"] == order_id
-    )
+    session_data = data["sessions"].get(session_name)
+    if not session_data:
+        return "Session not found", 404
+
+    order = find_order(session_data, order_id)
+    if not order:
+        return "Order not found", 404
 
-    order["delivered"] = True
-    save_sessions(data)
+    save_session_ops([op("set_order", session=session_name, order_id=order_id, fields={"delivered": True})])
+    notify_session(session_name, data)
 
-    audit_log("order_delivered", session["user"]["name"], order_id)
+    queue_audit("order_delivered", session["user"]["name"], order_id)
     return redirect(f"/session/{session_name}")
 
 @app.route("/admin/order_unpaid/<session_name>/<order_id>")
@@ -802,46 +1216,25 @@ def order_unpaid(session_name, order_id):
         return "Forbidden", 403
 
     data = load_sessions()
-    order = next(
-        o for o in data["sessions"][session_name]["orders"]
-        if o["id"] == order_id
-    )
+    session_data = data["sessions"].get(session_name)
+    if not session_data:
+        return "Session not found", 404
+
+    order = find_order(session_data, order_id)
+    if not order:
+        return "Order not found", 404
 
     # hvis ikke betalt → gør intet
     if not order.get("paid"):
         return redirect(f"/session/{session_name}")
 
-    # =====================
-    # 📊 RUL STATS TILBAGE
-    # =====================
-    stats = load_user_stats()
-    uid = order["user_id"]
-
-    if uid in stats:
-        for item, amount in order["items"].items():
-            if amount > 0:
-                stats[uid]["items"][item] = stats[uid]["items"].get(item, 0) - amount
-                stats[uid]["total_items"] -= amount
-
-                if stats[uid]["items"][item] <= 0:
-                    del stats[uid]["items"][item]
-
-        stats[uid]["total_spent"] -= order.get("total", 0)
-
-        # sikkerhed
-        if stats[uid]["total_spent"] < 0:
-            stats[uid]["total_spent"] = 0
-        if stats[uid]["total_items"] < 0:
-            stats[uid]["total_items"] = 0
-
-        save_user_stats(stats)
-
-    # marker ordre som ikke betalt
-    order["paid"] = False
-    order["delivered"] = False
-
-    save_sessions(data)
-    audit_log("order_unpaid", session["user"]["name"], order_id)
+    # marker ordre som ikke betalt – stats rulles tilbage i samme transaktion
+    save_session_ops([op("set_order", session=session_name, order_id=order_id, fields={
+        "paid": False,
+        "delivered": False
+    })])
+    notify_session(session_name, data)
+    queue_audit("order_unpaid", session["user"]["name"], order_id)
 
     return redirect(f"/session/{session_name}")
 
@@ -860,8 +1253,7 @@ def delete_order(session_name, order_id):
     if not session_data:
         return "Session not found", 404
 
-    orders = session_data["orders"]
-    order = next((o for o in orders if o["id"] == order_id), None)
+    order = find_order(session_data, order_id)
     if not order:
         return "Order not found", 404
 
@@ -871,10 +1263,10 @@ def delete_order(session_name, order_id):
         if amount > 0
     }
 
-    session_data["orders"] = [o for o in orders if o["id"] != order_id]
-    save_sessions(data)
+    save_session_ops([op("delete_order", session=session_name, order_id=order_id)])
+    notify_session(session_name, data)
 
-    audit_log(
+    queue_audit(
         "delete_order",
         session["user"]["name"],
         f"{session_name}:{order_id} → {returned_items}"
@@ -882,6 +1274,68 @@ def delete_order(session_name, order_id):
 
     return redirect(f"/session/{session_name}")
 
+
+# =========================================================
+# ☑️ BULK-HANDLINGER (valgte ordrer)
+# =========================================================
+# Samme regler som enkelt-ruterne ovenfor, men alle ændringer og audit-
+# linjer skrives i én transaktion (save_session_ops med audit_events).
+# "delivered" springer ubetalte ordrer over – ligesom ordretabellen kun
+# viser leveret-knappen når ordren er betalt.
+BULK_ACTIONS = ("paid", "unpaid", "delivered", "delete")
+
+
+@app.route("/admin/orders/<session_name>/bulk", methods=["POST"])
+def bulk_orders(session_name):
+    if not is_admin():
+        return "Forbidden", 403
+
+    action = request.form.get("action")
+    if action not in BULK_ACTIONS:
+        return "Ukendt handling", 400
+
+    data = load_sessions()
+    session_data = data["sessions"].get(session_name)
+    if not session_data:
+        return "Session not found", 404
+
+    admin = session["user"]["name"]
+    now = datetime.now().strftime(TIME_FORMAT)
+
+    ops = []
+    events = []
+    for order_id in dict.fromkeys(request.form.getlist("order_ids")):
+        order = find_order(session_data, order_id)
+        if not order:
+            continue
+
+        if action == "paid" and not order.get("paid"):
+            ops.append(op("set_order", session=session_name, order_id=order_id, fields={"paid": True}))
+            events.append(audit_event("order_paid", admin, order_id, now))
+
+        elif action == "unpaid" and order.get("paid"):
+            ops.append(op("set_order", session=session_name, order_id=order_id, fields={
+                "paid": False,
+                "delivered": False
+            }))
+            events.append(audit_event("order_unpaid", admin, order_id, now))
+
+        elif action == "delivered" and order.get("paid") and not order.get("delivered"):
+            ops.append(op("set_order", session=session_name, order_id=order_id, fields={"delivered": True}))
+            events.append(audit_event("order_delivered", admin, order_id, now))
+
+        elif action == "delete":
+            returned_items = {item: amount for item, amount in order["items"].items() if amount > 0}
+            ops.append(op("delete_order", session=session_name, order_id=order_id))
+            events.append(audit_event("delete_order", admin, f"{session_name}:{order_id} → {returned_items}", now))
+
+    # intet at ændre → ingen skrivning
+    if ops:
+        save_session_ops(ops, events)
+        notify_session(session_name, data)
+
+    return redirect(f"/session/{session_name}")
+
 # =========================================================
 # ✏️ EDIT ORDER (GET + POST)
 # =========================================================
@@ -895,8 +1349,7 @@ def edit_order(session_name, order_id):
     if not session_data:
         return "Session not found", 404
 
-    orders = session_data["orders"]
-    order = next((o for o in orders if o["id"] == order_id), None)
+    order = find_order(session_data, order_id)
     if not order:
         return "Order not found", 404
 
@@ -906,10 +1359,7 @@ def edit_order(session_name, order_id):
     # =====================
     # 📦 BEREGN LAGERSTATUS (SAMME LOGIK SOM USER)
     # =====================
-    used = {}
-    for o in orders:
-        for item, amount in o["items"].items():
-            used[item] = used.get(item, 0) + amount
+    used = used_items(session_data)
 
     remaining = {}
     for item in lager:
@@ -922,11 +1372,6 @@ def edit_order(session_name, order_id):
     if request.method == "POST":
         before_items = order["items"].copy()
 
-        used = {}
-        for o in orders:
-            for item, amount in o["items"].items():
-                used[item] = used.get(item, 0) + amount
-
         total = 0
         for item in order["items"]:
             requested = int(request.form.get(item, 0))
@@ -938,9 +1383,13 @@ def edit_order(session_name, order_id):
             total += final_amount * prices.get(item, 0)
 
         order["total"] = total
-        save_sessions(data)
+        save_session_ops([op("set_order", session=session_name, order_id=order_id, fields={
+            "items": order["items"],
+            "total": total
+        })])
+        notify_session(session_name, data)
 
-        audit_log(
+        queue_audit(
             "edit_order_admin",
             session["user"]["name"],
             f"{session_name}:{order_id}"
@@ -968,5 +1417,8 @@ def edit_order(session_name, order_id):
 # START
 # =====================
 if __name__ == "__main__":
+    journal.open()
+    # opgaver der lå i spool ved sidste stop køres nu – ikke først ved næste enqueue
+    queue.start()
     port = int(os.environ.get("PORT", 5000))
     socketio.run(app, host="0.0.0.0", port=port, debug=True)